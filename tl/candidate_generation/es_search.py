@@ -1,8 +1,7 @@
-import copy
-
 import hashlib
 import logging
 import re
+import time
 
 import json
 import requests
@@ -11,12 +10,45 @@ import typing
 from requests.auth import HTTPBasicAuth
 from typing import List
 
-from tl.candidate_generation.phrase_query_json import query
-from tl.candidate_generation.ngram_query import ngram_query
+from tl.candidate_generation.phrase_query_json import query as phrase_query
+from tl.candidate_generation.query_templates import exact_match_template, trigram_template, \
+    external_identifier_template, phrase_template, fuzzy_template, fuzzy_augmented_template, ngram_template, \
+    filter_clauses
+from tl.exceptions import UnsupportTypeError
+from tl.utility.concurrency import ConcurrencyController, retry_delay
 from tl.utility.singleton import singleton
 
 romance_languages = {'en', 'de', 'es', 'fr', 'it', 'pt'}
 
+phrase_query_default_fields = phrase_query['query']['bool']['must'][0]['multi_match']['fields']
+
+# the query types whose candidates can be looked up for many search terms with one query
+batch_query_types = {'exact-match', 'ex-id-match'}
+
+# the default index.max_result_window of ES
+max_result_window = 10000
+
+highlight_pattern = re.compile(r'<em>(.*?)</em>')
+
+# the fields of an ES document holding the names of a QNode, used to assign a hit to search terms when the
+# matched field is neither highlighted nor stored in the _source
+name_fields = ['labels', 'aliases', 'all_labels', 'ascii_labels', 'abbreviated_name', 'extra_aliases',
+               'external_identifiers', 'external_identifiers_pairs', 'redirect_text', 'wikipedia_anchor_text',
+               'wikitable_anchor_text']
+
+
+def flatten_strings(value) -> List[str]:
+    """
+    Returns all the strings in a value of an ES document, which can be a string or nested lists and dicts.
+    """
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, list):
+        return [x for v in value for x in flatten_strings(v)]
+    return []
+
 
 @singleton
 class Search(object):
@@ -25,28 +57,45 @@ class Search(object):
         self.es_index = es_index
         self.es_user = es_user
         self.es_pass = es_pass
-        self.query = copy.deepcopy(query)
         self.query_cache = dict()
         self.logger = logging.getLogger(__name__)
+        self.concurrency_controller = ConcurrencyController()
+        self.max_retries = 3
+        # the seconds waited before the first retry of a rejected request, doubled for every later retry
+        self.retry_base_delay = 0.5
 
-    def search_es(self, query: dict):
+    def search_es(self, query: typing.Union[dict, bytes]):
+        """
+        Sends a query to ES. The query is either a dict or a body already serialized by a query template.
+        """
         es_search_url = '{}/{}/_search'.format(self.es_url, self.es_index)
         cache_key = self.get_query_hash(query)
 
         if cache_key not in self.query_cache:
-            # return the top matched QNode using ES
-            if self.es_user and self.es_pass:
-                response = requests.post(es_search_url, json=query, auth=HTTPBasicAuth(self.es_user, self.es_pass))
+            if isinstance(query, bytes):
+                request_kwargs = {'data': query, 'headers': {'Content-Type': 'application/json'}}
             else:
-                response = requests.post(es_search_url, json=query)
+                request_kwargs = {'json': query}
+            if self.es_user and self.es_pass:
+                request_kwargs['auth'] = HTTPBasicAuth(self.es_user, self.es_pass)
+            # return the top matched QNode using ES, retry the requests rejected by an overloaded cluster
+            for attempt in range(self.max_retries + 1):
+                if attempt > 0:
+                    time.sleep(retry_delay(attempt, self.retry_base_delay))
+                response = self.concurrency_controller.call(requests.post, es_search_url, **request_kwargs)
+                if not self.concurrency_controller.is_overloaded(response):
+                    break
 
             if response.status_code == 200:
                 response_output = response.json()['hits']['hits']
             else:
                 response_output = None
                 self.logger.error("Query ES error with response {}!".format(response.status_code))
-                self.logger.error(response.json())
-            self.query_cache[cache_key] = response_output
+                self.logger.error(response.text)
+            if not self.concurrency_controller.is_overloaded(response):
+                self.query_cache[cache_key] = response_output
+            else:
+                return response_output
 
         return self.query_cache[cache_key]
 
@@ -56,7 +105,7 @@ class Search(object):
                                  size: int,
                                  properties: List[str],
                                  extra_musts: dict = None,
-                                 search_term_original: str = None):
+                                 search_term_original: str = None) -> bytes:
         must = list()
         search_terms = list()
         search_terms.append(search_term.strip())
@@ -87,93 +136,30 @@ class Search(object):
                 highlight_fields['fields'][_field] = {}
             must.append(query_part)
 
-        if extra_musts:
-            must.append(extra_musts)
-
-        must_not = [
-            {
-                "terms": {
-                    "descriptions.en.keyword_lower": [
-                        "wikimedia disambiguation page",
-                        "wikimedia category",
-                        "wikimedia kml file",
-                        "wikimedia list article",
-                        "wikimedia template",
-                        "wikimedia module",
-                        "wikinews article",
-                        "wikimedia template page"
-                    ]
-                }
-            }
-        ]
-
-        return {
-            "query": {
-                "bool": {
-                    "must": must,
-                    "must_not": must_not
-                }
-            },
-            "highlight": highlight_fields,
-            "size": size
-        }
+        return exact_match_template.render(must=must,
+                                           filter=filter_clauses(extra_musts),
+                                           highlight=highlight_fields,
+                                           size=size)
 
     def create_trigram_query(self, search_term,
                              size,
                              properties,
-                             extra_musts=None):
-        must = list()
-        search_term = search_term.lower()
-
+                             extra_musts=None) -> bytes:
         highlight = {
-            'fields': {}
+            'fields': {p: {} for p in properties}
         }
-        for p in properties:
-            highlight['fields'][p] = {}
+        extra_filters = extra_musts if isinstance(extra_musts, list) else [extra_musts]
 
-        query_part = {
-            "query_string": {
-                "fields": properties,
-                "query": search_term
-            }
-        }
-        must.append(query_part)
-
-        if extra_musts:
-            must.extend(extra_musts) if isinstance(extra_musts, list) else must.append(extra_musts)
-
-        must_not = [
-            {
-                "terms": {
-                    "descriptions.en.keyword_lower": [
-                        "wikimedia disambiguation page",
-                        "wikimedia category",
-                        "wikimedia kml file",
-                        "wikimedia list article",
-                        "wikimedia template",
-                        "wikimedia module",
-                        "wikinews article",
-                        "wikimedia template page"
-                    ]
-                }
-            }
-        ]
-
-        return {
-            "query": {
-                "bool": {
-                    "must": must,
-                    "must_not": must_not
-                }
-            },
-            "size": size,
-            "highlight": highlight
-        }
+        return trigram_template.render(properties=properties,
+                                       search_term=search_term.lower(),
+                                       filter=filter_clauses(*extra_filters),
+                                       size=size,
+                                       highlight=highlight)
 
     def create_external_identifier_query(self, search_term,
                                          size,
                                          properties,
-                                         identifier_property):
+                                         identifier_property) -> bytes:
         must = list()
         search_value = f"{identifier_property.upper()}:{search_term}" \
             if identifier_property is not None \
@@ -188,34 +174,65 @@ class Search(object):
             }
             must.append(query_part)
 
-        must_not = [
-            {
+        return external_identifier_template.render(must=must,
+                                                   filter=filter_clauses(),
+                                                   size=size)
+
+    def create_exact_match_batch_query(self,
+                                       search_terms: List[str],
+                                       lower_case: bool,
+                                       size: int,
+                                       properties: List[str],
+                                       extra_musts: dict = None) -> bytes:
+        """
+        A single `terms` query matching any of search_terms exactly, the batch version of create_exact_match_query.
+        The hits are highlighted so that they can be assigned back to the search terms they match.
+        """
+        suffix = 'keyword_lower' if lower_case else 'keyword'
+        must = list()
+        highlight_fields = {
+            "fields": {}
+        }
+        for property in properties:
+            _field = "{}.{}".format(property, suffix)
+            must.append({
                 "terms": {
-                    "descriptions.en.keyword_lower": [
-                        "wikimedia disambiguation page",
-                        "wikimedia category",
-                        "wikimedia kml file",
-                        "wikimedia list article",
-                        "wikimedia template",
-                        "wikimedia module",
-                        "wikinews article",
-                        "wikimedia template page"
-                    ]
+                    _field: search_terms
                 }
-            }
-        ]
+            })
+            highlight_fields['fields'][_field] = {}
 
-        return {
-            "query": {
+        return exact_match_template.render(must=must,
+                                           filter=filter_clauses(extra_musts),
+                                           highlight=highlight_fields,
+                                           size=size)
+
+    def create_external_identifier_batch_query(self, search_values: List[str], size: int,
+                                               properties: List[str]) -> bytes:
+        """
+        The batch version of create_external_identifier_query, search_values are identifiers or P:ID pairs.
+        A `term` clause per value is kept in a `should` instead of a `terms` query, so that every hit gets the
+        same score as with a query for its value alone.
+        """
+        must = list()
+        highlight_fields = {
+            "fields": {}
+        }
+        for property in properties:
+            _field = "{}.keyword".format(property.lower())
+            must.append({
                 "bool": {
-                    "must": must,
-                    "must_not": must_not
+                    "should": [{"term": {_field: {"value": value}}} for value in search_values]
                 }
-            },
-            "size": size
-        }
+            })
+            highlight_fields['fields'][_field] = {}
 
-    def create_phrase_query(self, search_term: str, size: int, properties):
+        return exact_match_template.render(must=must,
+                                           filter=filter_clauses(),
+                                           highlight=highlight_fields,
+                                           size=size)
+
+    def create_phrase_query(self, search_term: str, size: int, properties) -> bytes:
 
         search_term_tokens = search_term.split(' ')
         slop = 0
@@ -226,40 +243,19 @@ class Search(object):
             query_type = "phrase"
             slop = 10
 
-        query = self.query
-        query['query']['bool']['must'][0]['multi_match']['query'] = search_term
-        query['query']['bool']['must'][0]['multi_match']['type'] = query_type
-        query['query']['bool']['must'][0]['multi_match']['slop'] = slop
-
-        query['size'] = size
-
-        if properties:
-            query['query']['bool']['must'][0]['multi_match']['fields'] = properties
+        return phrase_template.render(search_term=search_term,
+                                      type=query_type,
+                                      properties=properties or phrase_query_default_fields,
+                                      slop=slop,
+                                      size=size)
 
-        return query
-
-    def create_fuzzy_query(self, search_term: str, size: int, properties):
-        query = {
-            "query": {
-                "bool": {
-                    "should": [
-                        {
-                            "multi_match": {
-                                "query": search_term,
-                                "fields": properties,
-                                "fuzziness": "AUTO"
-                            }
-                        }
-                    ]
-                }
-            },
-            "size": size
-        }
-
-        return query
+    def create_fuzzy_query(self, search_term: str, size: int, properties) -> bytes:
+        return fuzzy_template.render(search_term=search_term,
+                                     properties=properties,
+                                     size=size)
 
     def create_fuzzy_augmented_query(self, search_term: str, size: int, lower_case: bool, properties: List[str],
-                                     extra_musts: dict = None):
+                                     extra_musts: dict = None) -> bytes:
         if lower_case:
             properties = [prop + '.keyword_lower' for prop in properties]
 
@@ -269,43 +265,12 @@ class Search(object):
         for prop in properties:
             _f = prop + '.keyword_lower' if lower_case else prop
             highlight['fields'][_f] = {}
-        query = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "multi_match": {
-                                "query": search_term,
-                                "fields": properties,
-                                "fuzziness": "AUTO",
-                                "prefix_length": 1,
-                                "max_expansions": 3
-                            }
-                        }
-                    ],
-                    "must_not": [
-                        {
-                            "terms": {
-                                "descriptions.en.keyword_lower": [
-                                    "wikimedia disambiguation page",
-                                    "wikimedia category",
-                                    "wikimedia kml file",
-                                    "wikimedia list article",
-                                    "wikimedia template",
-                                    "wikimedia module",
-                                    "wikinews article"
-                                ]
-                            }
-                        }
-                    ]
-                }
-            },
-            "size": size
-        }
-        if extra_musts:
-            query['query']['bool']['must'].append(extra_musts)
-        query['highlight'] = highlight
-        return query
+
+        return fuzzy_augmented_template.render(search_term=search_term,
+                                               properties=properties,
+                                               filter=filter_clauses(extra_musts),
+                                               size=size,
+                                               highlight=highlight)
 
     def create_fuzzy_augmented_union(self, fuzzy_augmented_hits, fuzzy_augmented_keyword_lower_hits):
         seen_ids = set()
@@ -377,53 +342,204 @@ class Search(object):
                                                           extra_musts=extra_musts))
                     hits = self.create_fuzzy_augmented_union(fuzzy_augmented_hits, fuzzy_augmented_keyword_lower_hits)
                 if hits is not None:
-                    hits_copy = hits.copy()  # prevent change on query cache
-                    for hit in hits_copy:
-                        if re.match(r'Q\d+', hit['_id']):
-                            _source = hit['_source']
-                            _id = hit['_id']
-                            highlight = hit.get('highlight', None)
-                            description = ""
-                            pagerank = 0.0
-                            all_labels, all_aliases = self.get_all_labels_aliases(_source.get('labels', {}),
-                                                                                  _source.get('aliases', {}),
-                                                                                  _source.get('ascii_labels', []),
-                                                                                  _source.get('abbreviated_name', {}),
-                                                                                  _source.get('extra_aliases', []),
-                                                                                  _source.get('external_identifiers',
-                                                                                              []),
-                                                                                  _source.get('redirect_text',
-                                                                                              {}),
-                                                                                  _source.get('wikipedia_anchor_text',
-                                                                                              {}),
-                                                                                  _source.get('wikitable_anchor_text',
-                                                                                              {}),
-                                                                                  highlight=highlight
-                                                                                  )
-
-                            if 'en' in _source['descriptions'] and len(_source['descriptions']['en']) > 0:
-                                description = "|".join(_source['descriptions']['en'])
-                            if 'pagerank' in _source:
-                                pagerank = _source['pagerank']
-
-                            candidate_dict[_id] = {'score': hit['_score'],
-                                                   'label_str': '|'.join(all_labels),
-                                                   'alias_str': '|'.join(all_aliases),
-                                                   'description_str': description,
-                                                   'pagerank_float': pagerank}
-
-                            if _id not in candidate_aux_dict:
-                                candidate_aux_dict[_id] = {}
-
-                            if auxiliary_fields is not None:
-                                for auxiliary_field in auxiliary_fields:
-                                    if auxiliary_field in _source:
-                                        candidate_aux_dict[_id][auxiliary_field] = _source[auxiliary_field]
+                    self.add_hits_to_candidates(hits, candidate_dict, candidate_aux_dict, auxiliary_fields)
 
             self.query_cache[parameter] = candidate_dict
 
         return self.query_cache[parameter], candidate_aux_dict
 
+    def search_terms_candidates_batch(self,
+                                      search_term_strs: List[str],
+                                      size: int,
+                                      properties: List[str],
+                                      query_type: str,
+                                      lower_case: bool = True,
+                                      auxiliary_fields: List[str] = None,
+                                      extra_musts: dict = None,
+                                      search_terms_original: List[str] = None,
+                                      identifier_property: str = None) -> List[tuple]:
+        """
+        The batch version of search_term_candidates for the keyword lookups, `exact-match` and `ex-id-match`.
+
+        All the search terms are looked up with a single query, the hits are assigned back to the search terms
+        whose normalized value they hold, and only the first `size` hits of every search term are kept.
+
+        Returns: a list with a tuple (candidate_dict, candidate_aux_dict) for every string in search_term_strs
+        """
+        if query_type not in batch_query_types:
+            raise UnsupportTypeError('Batch lookup is not supported for {}'.format(query_type))
+
+        if search_terms_original is None:
+            search_terms_original = [None] * len(search_term_strs)
+
+        # the normalized keyword values looked up for every search term of every cell
+        cells_values = list()
+        for search_term_str, search_term_original in zip(search_term_strs, search_terms_original):
+            term_values = list()
+            for search_term in search_term_str.split('|'):
+                if query_type == 'exact-match':
+                    values = [search_term.strip()]
+                    if search_term_original is not None and search_term_original != search_term:
+                        values.append(search_term_original)
+                    if lower_case:
+                        values = [x.lower() for x in values]
+                else:
+                    values = [f"{identifier_property.upper()}:{search_term}"
+                              if identifier_property is not None else search_term]
+                term_values.append(values)
+            cells_values.append(term_values)
+
+        unique_values = list(dict.fromkeys(v for term_values in cells_values for values in term_values for v in values))
+        hits_by_value = self.search_values_batch(unique_values, size, properties, query_type, lower_case,
+                                                 extra_musts=extra_musts)
+
+        if query_type == 'exact-match':
+            # like search_term_candidates, the search terms without hits are looked up in all the labels and aliases
+            missing_values = list(dict.fromkeys(v for term_values in cells_values for values in term_values
+                                                if not any(hits_by_value[v] for v in values) for v in values))
+            if missing_values:
+                hits_by_value.update(self.search_values_batch(missing_values, size, ['all_labels_aliases'],
+                                                              query_type, lower_case, extra_musts=extra_musts))
+
+        results = list()
+        for term_values in cells_values:
+            candidate_dict = {}
+            candidate_aux_dict = {}
+            for values in term_values:
+                hits = list()
+                seen_ids = set()
+                for value in values:
+                    for hit in hits_by_value[value]:
+                        if hit['_id'] not in seen_ids:
+                            seen_ids.add(hit['_id'])
+                            hits.append(hit)
+                self.add_hits_to_candidates(hits[:size], candidate_dict, candidate_aux_dict, auxiliary_fields)
+            results.append((candidate_dict, candidate_aux_dict))
+        return results
+
+    def search_values_batch(self, values: List[str], size: int, properties: List[str], query_type: str,
+                            lower_case: bool, extra_musts: dict = None) -> dict:
+        """
+        Looks up the keyword values with one query and returns the list of hits of every value, at most `size`
+        per value, in the order of the ES results.
+
+        The query asks for `size` hits per value, up to the ES result window. If the results fill the window,
+        some values might be missing hits, and the values are split in two halves which are looked up separately.
+        """
+        query_size = min(max_result_window, size * len(values))
+        if query_type == 'exact-match':
+            query = self.create_exact_match_batch_query(values, lower_case, query_size, properties,
+                                                        extra_musts=extra_musts)
+            fields = ['{}.{}'.format(p, 'keyword_lower' if lower_case else 'keyword') for p in properties]
+        else:
+            query = self.create_external_identifier_batch_query(values, query_size, properties)
+            fields = ['{}.keyword'.format(p.lower()) for p in properties]
+
+        hits = self.search_es(query)
+        if hits is not None and len(hits) >= query_size and len(values) > 1:
+            half = len(values) // 2
+            hits_by_value = self.search_values_batch(values[:half], size, properties, query_type, lower_case,
+                                                     extra_musts=extra_musts)
+            hits_by_value.update(self.search_values_batch(values[half:], size, properties, query_type, lower_case,
+                                                          extra_musts=extra_musts))
+            return hits_by_value
+
+        hits_by_value = {value: list() for value in values}
+        for hit in hits or []:
+            matched_values = None
+            for field in fields:
+                field_values = self.get_keyword_values(hit, field, lower_case)
+                if field_values is None:
+                    continue
+                matched_values = field_values if matched_values is None else matched_values & field_values
+            if matched_values is None:
+                matched_values = self.get_keyword_values(hit, None, lower_case)
+            for value in matched_values:
+                if value in hits_by_value and len(hits_by_value[value]) < size:
+                    hits_by_value[value].append(self.filter_highlight(hit, value, lower_case))
+        return hits_by_value
+
+    @staticmethod
+    def get_keyword_values(hit: dict, field: typing.Optional[str], lower_case: bool) -> typing.Optional[set]:
+        """
+        Returns the values of a keyword field of an ES hit, read from its highlight and from its _source, or None if
+        the hit has neither. If field is None, returns all the labels, aliases and identifiers in the _source.
+        """
+        values = set()
+        if field is not None:
+            for fragment in hit.get('highlight', {}).get(field, []):
+                values.update(highlight_pattern.findall(fragment))
+            path = field.split('.')[:-1]
+            source_values = [hit['_source']]
+            for key in path:
+                source_values = [_[key] for _ in source_values if isinstance(_, dict) and key in _]
+        else:
+            source_values = [hit['_source'].get(key) for key in name_fields]
+        values.update(flatten_strings(source_values))
+        if not values:
+            return None
+        return {x.lower() for x in values} if lower_case else values
+
+    @staticmethod
+    def filter_highlight(hit: dict, value: str, lower_case: bool) -> dict:
+        """
+        Returns the hit with only the highlighted fields which hold value, as if it was retrieved by a query for
+        value alone.
+        """
+        if 'highlight' not in hit:
+            return hit
+        highlight = dict()
+        for field, fragments in hit['highlight'].items():
+            for fragment in fragments:
+                if any((x.lower() if lower_case else x) == value for x in highlight_pattern.findall(fragment)):
+                    highlight[field] = fragments
+                    break
+        return {**hit, 'highlight': highlight or hit['highlight']}
+
+    def add_hits_to_candidates(self, hits: List[dict], candidate_dict: dict, candidate_aux_dict: dict,
+                               auxiliary_fields: List[str] = None):
+        """
+        Adds the QNodes of the ES hits, with their labels, aliases, description and pagerank, to candidate_dict and
+        their auxiliary fields to candidate_aux_dict.
+        """
+        hits_copy = hits.copy()  # prevent change on query cache
+        for hit in hits_copy:
+            if re.match(r'Q\d+', hit['_id']):
+                _source = hit['_source']
+                _id = hit['_id']
+                highlight = hit.get('highlight', None)
+                description = ""
+                pagerank = 0.0
+                all_labels, all_aliases = self.get_all_labels_aliases(_source.get('labels', {}),
+                                                                      _source.get('aliases', {}),
+                                                                      _source.get('ascii_labels', []),
+                                                                      _source.get('abbreviated_name', {}),
+                                                                      _source.get('extra_aliases', []),
+                                                                      _source.get('external_identifiers', []),
+                                                                      _source.get('redirect_text', {}),
+                                                                      _source.get('wikipedia_anchor_text', {}),
+                                                                      _source.get('wikitable_anchor_text', {}),
+                                                                      highlight=highlight)
+
+                if 'en' in _source['descriptions'] and len(_source['descriptions']['en']) > 0:
+                    description = "|".join(_source['descriptions']['en'])
+                if 'pagerank' in _source:
+                    pagerank = _source['pagerank']
+
+                candidate_dict[_id] = {'score': hit['_score'],
+                                       'label_str': '|'.join(all_labels),
+                                       'alias_str': '|'.join(all_aliases),
+                                       'description_str': description,
+                                       'pagerank_float': pagerank}
+
+                if _id not in candidate_aux_dict:
+                    candidate_aux_dict[_id] = {}
+
+                if auxiliary_fields is not None:
+                    for auxiliary_field in auxiliary_fields:
+                        if auxiliary_field in _source:
+                            candidate_aux_dict[_id][auxiliary_field] = _source[auxiliary_field]
+
     def get_node_info(self, search_nodes: typing.List[str]) -> dict:
         query = {
             "query": {
@@ -452,14 +568,14 @@ class Search(object):
             label_dict[node_id] = node_pagerank
         return label_dict
 
-    def get_query_hash(self, query: typing.Union[tuple, dict, list]):
+    def get_query_hash(self, query: typing.Union[tuple, dict, list, bytes]):
         """
         get the hash key for the query for cache
-        :param query: input query dict
+        :param query: input query dict or serialized query
         :return: a str represent the hash key
         """
         hash_generator = hashlib.md5()
-        hash_generator.update(str(query).encode('utf-8'))
+        hash_generator.update(query if isinstance(query, bytes) else str(query).encode('utf-8'))
         hash_search_result = hash_generator.hexdigest()
         hash_key = str(hash_search_result)
         return hash_key
@@ -527,7 +643,7 @@ class Search(object):
         return list(all_labels), list(all_aliases)
 
     @staticmethod
-    def create_ngram_query(search_term: str, language: str = 'en', size: int = 20, extra_musts: dict = None) -> dict:
+    def create_ngram_query(search_term: str, language: str = 'en', size: int = 20, extra_musts: dict = None) -> bytes:
         _search_terms = search_term.split(' ')
         _search_terms = [x[:20] for x in _search_terms]
 
@@ -537,29 +653,13 @@ class Search(object):
 
         exact_match_field = f'all_labels.{language}.keyword_lower'
 
-        query_part = {
-            "query_string": {
-                "fields": [
-                    f"{search_field}^1.0",
-                    f"{exact_match_field}^100"
-                ],
-                "query": search_term_truncated,
-                "default_operator": "AND"
-            }
-        }
-
-        ngrams_query = copy.deepcopy(ngram_query)
-        ngrams_query['query']['function_score']['query']['bool']['must'].append(query_part)
-
-        if extra_musts:
-            ngrams_query['query']['function_score']['query']['bool']['must'].append(extra_musts)
-
-        ngrams_query['size'] = size
-        ngrams_query['highlight'] = {
-            'fields': {
-                search_field: {},
-                exact_match_field: {}
-            }
-        }
-
-        return ngrams_query
+        return ngram_template.render(fields=[f"{search_field}^1.0", f"{exact_match_field}^100"],
+                                     search_term=search_term_truncated,
+                                     filter=filter_clauses(extra_musts),
+                                     size=size,
+                                     highlight={
+                                         'fields': {
+                                             search_field: {},
+                                             exact_match_field: {}
+                                         }
+                                     })
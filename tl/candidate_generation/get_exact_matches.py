@@ -11,7 +11,9 @@ class ExactMatches(object):
         self.utility = Utility(self.es, output_column_name)
 
     def get_exact_matches(self, column, lower_case=True, size=50, file_path=None,
-                          df=None, auxiliary_fields: List[str] = None, auxiliary_folder: str = None, isa: str = None):
+                          df=None, auxiliary_fields: List[str] = None, auxiliary_folder: str = None, isa: str = None,
+                          block_size: int = None,
+                          batch_size: int = None):
         """
         retrieves the identifiers of KG entities whose label or aliases match the input values exactly.
 
@@ -22,6 +24,9 @@ class ExactMatches(object):
             size: maximum number of candidates to retrieve, default is 50.
             file_path: input file in canonical format
             df: input dataframe in canonical format
+            block_size: if given, the candidates are returned as an iterator over dataframes, each holding the
+                        candidates of block_size cells
+            batch_size: if given, the candidates of batch_size cells are looked up with a single query
         Returns: a dataframe in candidates format
 
         """
@@ -55,4 +60,6 @@ class ExactMatches(object):
                                                  auxiliary_fields=auxiliary_fields,
                                                  auxiliary_folder=auxiliary_folder,
                                                  auxiliary_file_prefix='exact_matches_',
-                                                 extra_musts=extra_musts)
+                                                 extra_musts=extra_musts,
+                                                 block_size=block_size,
+                                                 batch_size=batch_size)
@@ -17,7 +17,9 @@ class ExIDMatches(object):
                           df: pd.DataFrame = None,
                           auxiliary_fields: List[str] = None,
                           auxiliary_folder: str = None,
-                          property: str = None):
+                          property: str = None,
+                          block_size: int = None,
+                          batch_size: int = None):
         """
 
         Args:
@@ -28,6 +30,9 @@ class ExIDMatches(object):
             auxiliary_fields: auxiliary fields to fetch from the ES index
             auxiliary_folder: folder where auxiliary data will be stored
             property: if specified, property:identifier pairs will be searched
+            block_size: if given, the candidates are returned as an iterator over dataframes, each holding the
+                        candidates of block_size cells
+            batch_size: if given, the candidates of batch_size cells are looked up with a single query
 
         Returns: candidates DataFrame
 
@@ -52,4 +57,6 @@ class ExIDMatches(object):
                                                  auxiliary_fields=auxiliary_fields,
                                                  auxiliary_folder=auxiliary_folder,
                                                  auxiliary_file_prefix='ex_id_matches_',
-                                                 identifier_property=property)
+                                                 identifier_property=property,
+                                                 block_size=block_size,
+                                                 batch_size=batch_size)
@@ -12,7 +12,8 @@ class FuzzyAugmented(object):
         self.utility = Utility(self.es, output_column_name)
 
     def get_matches(self, column, size=50, file_path=None,
-                    df=None, auxiliary_fields: List[str] = None, auxiliary_folder: str = None, isa: str = None):
+                    df=None, auxiliary_fields: List[str] = None, auxiliary_folder: str = None, isa: str = None,
+                    block_size: int = None):
         """
         Used the ElasticSearch which has the labels, aliases, wikipedia/wikitable anchor text, redirect text
         :param column: the column used to retrieve the candidates
@@ -20,6 +21,8 @@ class FuzzyAugmented(object):
         :param file_path: input file in canonical format
         :param df: input dataframe in canonical format
         :param output_column_name: the output column name where the retrieval scores are stored
+        :param block_size: if given, the candidates are returned as an iterator over dataframes, each holding the
+                           candidates of block_size cells
         :return: a dataframe in candidates format
         """
         if file_path is None and df is None:
@@ -50,4 +53,5 @@ class FuzzyAugmented(object):
                                                  auxiliary_fields=auxiliary_fields,
                                                  auxiliary_folder=auxiliary_folder,
                                                  auxiliary_file_prefix='fuzzy_augmented_',
-                                                 extra_musts=extra_musts)
+                                                 extra_musts=extra_musts,
+                                                 block_size=block_size)
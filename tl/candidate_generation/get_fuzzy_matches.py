@@ -10,7 +10,7 @@ class FuzzyMatches(object):
         self.utility = Utility(self.es, output_column_name)
 
     def get_exact_matches(self, column, properties="labels,aliases", size=50, file_path=None,
-                          df=None):
+                          df=None, block_size: int = None):
         """
         retrieves the identifiers of KG entities whose label or aliases match the input values with some edit distance allowed.
 
@@ -20,6 +20,8 @@ class FuzzyMatches(object):
             size: maximum number of candidates to retrieve, default is 50.
             file_path: input file in canonical format
             df: input dataframe in canonical format
+            block_size: if given, the candidates are returned as an iterator over dataframes, each holding the
+                        candidates of block_size cells
         Returns: a dataframe in candidates format
 
         """
@@ -32,4 +34,4 @@ class FuzzyMatches(object):
 
         df.fillna(value="", inplace=True)
 
-        return self.utility.create_candidates_df(df, column, size, properties, 'fuzzy-match')
+        return self.utility.create_candidates_df(df, column, size, properties, 'fuzzy-match', block_size=block_size)
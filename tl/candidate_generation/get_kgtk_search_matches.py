@@ -1,26 +1,80 @@
+import json
+import logging
+import os
+import threading
+
 import requests
 import pandas as pd
 from typing import List
 from concurrent.futures import ThreadPoolExecutor
 from itertools import repeat
+from requests.adapters import HTTPAdapter
 
 from tl.file_formats_validator import FFV
 from tl.exceptions import UnsupportTypeError
 from tl.exceptions import RequiredInputParameterMissingException
 from tl.candidate_generation.es_search import Search
 from tl.candidate_generation.utility import Utility
+from tl.utility.concurrency import ConcurrencyController
+
+
+class KGTKSearchCache(object):
+    """
+    A persistent cache of KGTK search API responses keyed by (label, size, language).
+
+    The cache is stored as a json lines file, one response per line, and is appended to as new
+    responses arrive, so that reruns over the same tables do not hit the API again.
+    """
+
+    def __init__(self, cache_path: str = None):
+        self.cache_path = cache_path
+        self.cache = {}
+        self.lock = threading.Lock()
+        if cache_path is not None and os.path.exists(cache_path):
+            with open(cache_path) as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        record = json.loads(line)
+                        self.cache[tuple(record['key'])] = record['value']
+
+    @staticmethod
+    def get_key(label: str, size: int, language: str) -> tuple:
+        return label, int(size), language
+
+    def get(self, key: tuple):
+        return self.cache.get(key, None)
+
+    def put(self, key: tuple, value: list):
+        with self.lock:
+            self.cache[key] = value
+            if self.cache_path is not None:
+                with open(self.cache_path, 'a') as f:
+                    f.write(json.dumps({'key': list(key), 'value': value}))
+                    f.write('\n')
 
 
 class KGTKSearchMatches(object):
-    def __init__(self, es_url, es_index, api_url='https://kgtk.isi.edu/api', es_user=None, es_pass=None):
+    def __init__(self, es_url, es_index, api_url='https://kgtk.isi.edu/api', es_user=None, es_pass=None,
+                 cache_path: str = None, timeout: float = 30):
         self.api_url = api_url
         self.ffv = FFV()
         self.es_search = Search(es_url, es_index, es_user, es_pass)
         self.utility = Utility(self.es_search)
+        self.timeout = timeout
+        self.cache = KGTKSearchCache(cache_path)
+        self.logger = logging.getLogger(__name__)
+        self.concurrency_controller = ConcurrencyController()
+
+        # one pooled session shared by all the worker threads, sized so that no thread waits for a connection
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency_controller.max_limit)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
 
     def get_matches(self, column, size=20, file_path=None, df=None, output_column_name: str = "retrieval_score",
                     auxiliary_fields: List[str] = None, auxiliary_folder: str = None,
-                    auxiliary_file_prefix='kgtk_search_', max_threads=50):
+                    auxiliary_file_prefix='kgtk_search_', max_threads=None, language='en'):
         """
         uses KGTK search API to retrieve identifiers of KG entities matching the input search term.
 
@@ -31,6 +85,10 @@ class KGTKSearchMatches(object):
             df: input dataframe in canonical format,
             output_column_name: the output column name where the normalized scores will be stored.Default is
                                 kgtk_retrieval_score
+            max_threads: maximum number of threads sending requests to the KGTK search API, default is the maximum
+                         limit of the process wide concurrency controller, which decides how many requests are
+                         in flight
+            language: language of the labels to search, default is en
         Returns: a dataframe in candidates format
 
         """
@@ -46,91 +104,106 @@ class KGTKSearchMatches(object):
         columns = df.columns
 
         uniq_labels = list(df[column].unique())
-        max_threads = min(len(uniq_labels), max_threads)
+        max_threads = max(1, min(len(uniq_labels), max_threads or self.concurrency_controller.max_limit))
 
         results_dict = {}
         with ThreadPoolExecutor(max_workers=max_threads) as executor:
             for _results_dict in executor.map(
-                    self.kgtk_api_search, uniq_labels, repeat(size)):
+                    self.kgtk_api_search, uniq_labels, repeat(size), repeat(language)):
                 results_dict.update(_results_dict)
-        # for uniq_label in uniq_labels:
-        #     results_dict.update(self.kgtk_api_search(size, uniq_label))
 
-        new_df_list = list()
-        seen_dict = {}
-        all_candidates = []
-        candidate_aux_dict = {}
-        for i, row in df.iterrows():
-            row_key = f"{row['column']}_{row['row']}_{row[column]}"
-            row_candidates = set()
-            if row_key not in seen_dict:
-                search_results = results_dict.get(row[column], [])
-                if len(search_results) > 0:
-                    for sr in search_results:
-                        _ = {}
-                        for c in columns:
-                            _[c] = row[c]
-
-                        _['kg_id'] = sr['qnode']
-                        row_candidates.add(sr['qnode'])
-                        _['pagerank'] = sr['pagerank']
-                        kg_label = []
-                        kg_description = ''
-
-                        if 'label' in sr and len(sr['label']) > 0:
-                            kg_label.extend(sr['label'])
-                        if 'alias' in sr and len(sr['alias']) > 0:
-                            kg_label.extend(sr['alias'])
-                        _['kg_labels'] = "|".join(kg_label)
-
-                        _['method'] = 'kgtk-search'
-
-                        if 'description' in sr and len(sr['description']) > 0:
-                            kg_description = "|".join(sr['description'])
-                        _['kg_descriptions'] = kg_description
-
-                        _[output_column_name] = sr['score']
-                        new_df_list.append(_)
-                    all_candidates.extend(self.es_search.get_node_info(list(row_candidates)))
-                else:
-                    _ = {}
-                    for c in columns:
-                        _[c] = row[c]
-
-                    _['kg_id'] = ''
-                    _['pagerank'] = ''
-                    _['kg_labels'] = ''
-                    _['method'] = 'kgtk-search'
-                    _['kg_descriptions'] = ''
-                    _[output_column_name] = ''
-                    new_df_list.append(_)
-                seen_dict[row_key] = 1
-
-        for candidate in all_candidates:
-            _id = candidate['_id']
-            _source = candidate['_source']
-            if _id not in candidate_aux_dict:
-                candidate_aux_dict[_id] = {}
-
-            if auxiliary_fields is not None:
-                for auxiliary_field in auxiliary_fields:
-                    if auxiliary_field in _source:
-                        candidate_aux_dict[_id][auxiliary_field] = _source[auxiliary_field]
+        search_df = self.create_search_results_df(results_dict, column, output_column_name)
+
+        # one row per cell, joined with all the search results for the label of the cell
+        new_columns = ['kg_id', 'pagerank', 'kg_labels', 'method', 'kg_descriptions', output_column_name]
+        cells_df = df.drop_duplicates(subset=['column', 'row', column])
+        cells_df = cells_df.drop(columns=[c for c in new_columns if c in columns])
+        new_df = cells_df.merge(search_df, on=column, how='left')
+        new_df = new_df.fillna('')
+        new_df['method'] = 'kgtk-search'
+        new_df = new_df[list(columns) + [c for c in new_columns if c not in columns]]
 
-        self.utility.write_auxiliary_files(auxiliary_folder, candidate_aux_dict, auxiliary_fields,
-                                           prefix=auxiliary_file_prefix)
+        if auxiliary_fields is not None:
+            candidate_aux_dict = self.get_auxiliary_data(list(search_df['kg_id'].unique()), auxiliary_fields)
+            self.utility.write_auxiliary_files(auxiliary_folder, candidate_aux_dict, auxiliary_fields,
+                                               prefix=auxiliary_file_prefix)
 
         if self.ffv.is_canonical_file(df):
-            return pd.DataFrame(new_df_list)
+            return new_df
 
         if self.ffv.is_candidates_file(df):
-            return pd.concat([df, pd.DataFrame(new_df_list)]).sort_values(by=['column', 'row', column])
+            return pd.concat([df, new_df]).sort_values(by=['column', 'row', column])
 
         raise UnsupportTypeError("The input file is neither a canonical file or a candidate file!")
 
-    def kgtk_api_search(self, uniq_label: str, size: int) -> dict:
+    @staticmethod
+    def create_search_results_df(results_dict: dict, column: str, output_column_name: str) -> pd.DataFrame:
+        """
+        Flattens the KGTK search API responses into a dataframe with one row per (label, candidate).
+        """
+        search_results = list()
+        for label, search_results_for_label in results_dict.items():
+            for sr in search_results_for_label:
+                kg_label = []
+                if 'label' in sr and len(sr['label']) > 0:
+                    kg_label.extend(sr['label'])
+                if 'alias' in sr and len(sr['alias']) > 0:
+                    kg_label.extend(sr['alias'])
+                kg_description = ''
+                if 'description' in sr and len(sr['description']) > 0:
+                    kg_description = "|".join(sr['description'])
+                search_results.append({
+                    column: label,
+                    'kg_id': sr['qnode'],
+                    'pagerank': sr['pagerank'],
+                    'kg_labels': "|".join(kg_label),
+                    'kg_descriptions': kg_description,
+                    output_column_name: sr['score']
+                })
+        return pd.DataFrame(search_results,
+                            columns=[column, 'kg_id', 'pagerank', 'kg_labels', 'kg_descriptions',
+                                     output_column_name])
+
+    def get_auxiliary_data(self, qnodes: List[str], auxiliary_fields: List[str], batch_size: int = 1000) -> dict:
+        candidate_aux_dict = {}
+        for i in range(0, len(qnodes), batch_size):
+            for candidate in self.es_search.get_node_info(qnodes[i:i + batch_size]) or []:
+                _id = candidate['_id']
+                _source = candidate['_source']
+                if _id not in candidate_aux_dict:
+                    candidate_aux_dict[_id] = {}
+                for auxiliary_field in auxiliary_fields:
+                    if auxiliary_field in _source:
+                        candidate_aux_dict[_id][auxiliary_field] = _source[auxiliary_field]
+        return candidate_aux_dict
+
+    def kgtk_api_search(self, uniq_label: str, size: int, language: str = 'en') -> dict:
         results_dict = dict()
-        api_search_url = f"{self.api_url}?q=" \
-                         f"{uniq_label}&extra_info=true&language=en&type=ngram&size={size}&lowercase=true"
-        results_dict[uniq_label] = requests.get(api_search_url).json()
+        cache_key = self.cache.get_key(uniq_label, size, language)
+        search_results = self.cache.get(cache_key)
+        if search_results is None:
+            params = {
+                'q': uniq_label,
+                'extra_info': 'true',
+                'language': language,
+                'type': 'ngram',
+                'size': size,
+                'lowercase': 'true'
+            }
+            try:
+                response = self.concurrency_controller.call(self.session.get, self.api_url, params=params,
+                                                            timeout=self.timeout)
+            except requests.RequestException as e:
+                # a label whose search timed out or failed has no candidates in this run, and is searched again
+                # by the next one
+                self.logger.error("Query KGTK search API error for {}: {}".format(uniq_label, e))
+                results_dict[uniq_label] = []
+                return results_dict
+            if response.status_code == 200:
+                search_results = response.json()
+                self.cache.put(cache_key, search_results)
+            else:
+                search_results = []
+                self.logger.error("Query KGTK search API error with response {}!".format(response.status_code))
+        results_dict[uniq_label] = search_results
         return results_dict
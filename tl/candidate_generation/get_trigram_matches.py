@@ -33,7 +33,8 @@ class TriGramMatches(object):
                             auxiliary_fields: List[str] = None,
                             auxiliary_folder: str = None,
                             property: str = None,
-                            isa: str = None):
+                            isa: str = None,
+                            block_size: int = None):
         """
 
         Args:
@@ -44,6 +45,8 @@ class TriGramMatches(object):
             auxiliary_fields: auxiliary fields to fetch from the ES index
             auxiliary_folder: folder where auxiliary data will be stored
             property: if specified, property:identifier pairs will be searched
+            block_size: if given, the candidates are returned as an iterator over dataframes, each holding the
+                        candidates of block_size cells
 
         Returns: candidates DataFrame
 
@@ -135,7 +138,8 @@ class TriGramMatches(object):
                                                       auxiliary_fields=auxiliary_fields,
                                                       auxiliary_folder=auxiliary_folder,
                                                       auxiliary_file_prefix='trigram_matches_',
-                                                      extra_musts=extra_musts) \
+                                                      extra_musts=extra_musts,
+                                                      block_size=block_size) \
             if df_non_pgt is not None \
             else \
             self.utility.create_candidates_df(
@@ -147,9 +151,12 @@ class TriGramMatches(object):
                 auxiliary_fields=auxiliary_fields,
                 auxiliary_folder=auxiliary_folder,
                 auxiliary_file_prefix='trigram_matches_',
-                extra_musts=extra_musts)
+                extra_musts=extra_musts,
+                block_size=block_size)
 
         if self.pgt_column:
+            if block_size:
+                return (block[block['method'] == 'trigram-match'] for block in result_df)
             result_df = result_df[result_df['method'] == 'trigram-match']
         return result_df
 
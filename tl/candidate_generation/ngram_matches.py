@@ -11,7 +11,8 @@ class NgramMatches(object):
         self.utility = Utility(self.es, output_column_name)
 
     def get_ngram_matches(self, column, size=20, file_path=None,
-                          df=None, auxiliary_fields: List[str] = None, auxiliary_folder: str = None, isa: str = None):
+                          df=None, auxiliary_fields: List[str] = None, auxiliary_folder: str = None, isa: str = None,
+                          block_size: int = None):
         """
         retrieves the identifiers of KG entities whose label or aliases ngrams match the search term
 
@@ -22,6 +23,8 @@ class NgramMatches(object):
             df: input dataframe in canonical format
             auxiliary_fields: auxiliary fields to fetch from ES
             auxiliary_folder: path where the auxiliary files will be stored
+            block_size: if given, the candidates are returned as an iterator over dataframes, each holding the
+                        candidates of block_size cells
         Returns: a dataframe in candidates format
 
         """
@@ -55,4 +58,5 @@ class NgramMatches(object):
                                                  auxiliary_fields=auxiliary_fields,
                                                  auxiliary_folder=auxiliary_folder,
                                                  auxiliary_file_prefix='ngram_matches_',
-                                                 extra_musts=extra_musts)
+                                                 extra_musts=extra_musts,
+                                                 block_size=block_size)
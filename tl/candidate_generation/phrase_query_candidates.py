@@ -11,7 +11,8 @@ class PhraseQueryMatches(object):
         self.es = Search(es_url, es_index, es_user=es_user, es_pass=es_pass)
         self.utility = Utility(self.es, score_column_name, previous_match_column_name)
 
-    def get_phrase_matches(self, column, properties="labels^2,aliases", size=50, file_path=None, df=None, filter_condition=None):
+    def get_phrase_matches(self, column, properties="labels^2,aliases", size=50, file_path=None, df=None, filter_condition=None,
+                           block_size=None):
         """
         retrieves the identifiers of KG entities base on phrase match queries.
 
@@ -22,6 +23,8 @@ class PhraseQueryMatches(object):
             file_path: input file in canonical format
             df: input dataframe in canonical format
             filter_condition: a string indicate the filter requirement
+            block_size: if given and there is no filter condition, the candidates are returned as an iterator over
+                        dataframes, each holding the candidates of block_size cells
         Returns: a dataframe in candidates format
 
         """
@@ -43,6 +46,10 @@ class PhraseQueryMatches(object):
         else:
             query_input_df = df
 
+        if not need_filter and block_size:
+            return self.utility.create_candidates_df(df, column, size, properties, 'phrase-match',
+                                                     block_size=block_size)
+
         from tl.utility.utility import Utility
 
         output_df = self.utility.create_candidates_df(query_input_df, column, size, properties, 'phrase-match')
@@ -0,0 +1,208 @@
+import json
+import re
+
+
+class RawJSON(str):
+    """
+    A json fragment which has already been serialized and is spliced into a rendered query as is.
+    """
+    pass
+
+
+class QueryTemplate(object):
+    """
+    An immutable Elasticsearch query body.
+
+    The template is a query dict in which some values are placeholders of the form "{{name}}". The static parts
+    of the query are serialized to bytes once, when the template is created, and `render` only serializes the
+    parameters and splices them in. Rendering does not modify the template, so a template can be shared by
+    all the threads sending queries.
+    """
+    __slots__ = ('_static_parts', '_names')
+
+    placeholder_pattern = re.compile(r'"\{\{(\w+)\}\}"')
+
+    def __init__(self, template: dict):
+        serialized = self.placeholder_pattern.split(json.dumps(template, separators=(',', ':')))
+        object.__setattr__(self, '_static_parts', tuple(part.encode('utf-8') for part in serialized[0::2]))
+        object.__setattr__(self, '_names', tuple(serialized[1::2]))
+
+    def __setattr__(self, key, value):
+        raise AttributeError('QueryTemplate is immutable')
+
+    @property
+    def parameters(self) -> tuple:
+        return self._names
+
+    def render(self, **params) -> bytes:
+        """
+        Returns the serialized query body with the placeholders replaced by the json serialization of `params`.
+        """
+        body = [self._static_parts[0]]
+        for name, static_part in zip(self._names, self._static_parts[1:]):
+            value = params[name]
+            if isinstance(value, RawJSON):
+                body.append(value.encode('utf-8'))
+            else:
+                body.append(json.dumps(value, separators=(',', ':')).encode('utf-8'))
+            body.append(static_part)
+        return b''.join(body)
+
+
+def filter_clauses(*extra_filters) -> RawJSON:
+    """
+    Returns the non-scoring filter clauses of a query: the extra filters which are not None, e.g. an `isa`
+    restriction, followed by the exclusion of the Wikimedia internal pages.
+    """
+    clauses = [json.dumps(f, separators=(',', ':')) for f in extra_filters if f]
+    clauses.append(wikimedia_filter)
+    return RawJSON('[{}]'.format(','.join(clauses)))
+
+
+wikimedia_descriptions = [
+    "wikimedia disambiguation page",
+    "wikimedia category",
+    "wikimedia kml file",
+    "wikimedia list article",
+    "wikimedia template",
+    "wikimedia module",
+    "wikinews article",
+    "wikimedia template page"
+]
+
+wikimedia_filter = RawJSON(json.dumps({
+    "bool": {
+        "must_not": [
+            {
+                "terms": {
+                    "descriptions.en.keyword_lower": wikimedia_descriptions
+                }
+            }
+        ]
+    }
+}, separators=(',', ':')))
+
+exact_match_template = QueryTemplate({
+    "query": {
+        "bool": {
+            "must": "{{must}}",
+            "filter": "{{filter}}"
+        }
+    },
+    "highlight": "{{highlight}}",
+    "size": "{{size}}"
+})
+
+trigram_template = QueryTemplate({
+    "query": {
+        "bool": {
+            "must": [
+                {
+                    "query_string": {
+                        "fields": "{{properties}}",
+                        "query": "{{search_term}}"
+                    }
+                }
+            ],
+            "filter": "{{filter}}"
+        }
+    },
+    "size": "{{size}}",
+    "highlight": "{{highlight}}"
+})
+
+external_identifier_template = QueryTemplate({
+    "query": {
+        "bool": {
+            "must": "{{must}}",
+            "filter": "{{filter}}"
+        }
+    },
+    "size": "{{size}}"
+})
+
+phrase_template = QueryTemplate({
+    "query": {
+        "bool": {
+            "must": [
+                {
+                    "multi_match": {
+                        "query": "{{search_term}}",
+                        "type": "{{type}}",
+                        "fields": "{{properties}}",
+                        "slop": "{{slop}}"
+                    }
+                }
+            ]
+        }
+    },
+    "size": "{{size}}"
+})
+
+fuzzy_template = QueryTemplate({
+    "query": {
+        "bool": {
+            "should": [
+                {
+                    "multi_match": {
+                        "query": "{{search_term}}",
+                        "fields": "{{properties}}",
+                        "fuzziness": "AUTO"
+                    }
+                }
+            ]
+        }
+    },
+    "size": "{{size}}"
+})
+
+fuzzy_augmented_template = QueryTemplate({
+    "query": {
+        "bool": {
+            "must": [
+                {
+                    "multi_match": {
+                        "query": "{{search_term}}",
+                        "fields": "{{properties}}",
+                        "fuzziness": "AUTO",
+                        "prefix_length": 1,
+                        "max_expansions": 3
+                    }
+                }
+            ],
+            "filter": "{{filter}}"
+        }
+    },
+    "size": "{{size}}",
+    "highlight": "{{highlight}}"
+})
+
+ngram_template = QueryTemplate({
+    "query": {
+        "function_score": {
+            "query": {
+                "bool": {
+                    "must": [
+                        {
+                            "query_string": {
+                                "fields": "{{fields}}",
+                                "query": "{{search_term}}",
+                                "default_operator": "AND"
+                            }
+                        }
+                    ],
+                    "filter": "{{filter}}"
+                }
+            },
+            "boost": 1,
+            "field_value_factor": {
+                "field": "pagerank",
+                "modifier": "none",
+                "factor": 10000
+            },
+            "boost_mode": "multiply"
+        }
+    },
+    "size": "{{size}}",
+    "highlight": "{{highlight}}"
+})
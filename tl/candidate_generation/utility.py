@@ -1,11 +1,14 @@
+import bisect
 import json
 import pandas as pd
 import sys
 
 from tl.file_formats_validator import FFV
 from tl.exceptions import UnsupportTypeError
+from tl.candidate_generation.es_search import batch_query_types
+from tl.utility.concurrency import ConcurrencyController
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
-from itertools import repeat
 
 
 class Utility(object):
@@ -19,59 +22,168 @@ class Utility(object):
     def create_candidates_df(self, df, column, size, properties, method,
                              lower_case=False, auxiliary_fields=None,
                              auxiliary_folder=None, auxiliary_file_prefix='',
-                             extra_musts=None, max_threads=50, identifier_property=None):
-        properties = [_.strip() for _ in properties.split(',')]
+                             extra_musts=None, max_threads=None, identifier_property=None, block_size=None,
+                             batch_size=None):
+        """
+        Queries ES for the candidates of every cell in df.
+
+        If block_size is None, returns a dataframe with the candidates of all the cells. Otherwise, returns an
+        iterator over dataframes holding the candidates of block_size cells each, in the order of the cells in the
+        input. A block is emitted as soon as the queries of all its cells have finished, so that the output can be
+        written while the remaining queries are running. If df is a candidates file, each block also contains the
+        input rows of its cells. Every block has the columns of the whole output, in the same order.
+
+        If batch_size is given, the `exact-match` and `ex-id-match` candidates of batch_size cells are looked up
+        with a single query.
+        """
+        if not self.ffv.is_canonical_file(df) and not self.ffv.is_candidates_file(df):
+            raise UnsupportTypeError(
+                "The input df is neither a canonical format"
+                " or a candidate format!"
+            )
+
+        blocks = self.create_candidates_blocks(df, column, size, properties, method,
+                                               lower_case=lower_case,
+                                               auxiliary_fields=auxiliary_fields,
+                                               auxiliary_folder=auxiliary_folder,
+                                               auxiliary_file_prefix=auxiliary_file_prefix,
+                                               extra_musts=extra_musts,
+                                               max_threads=max_threads,
+                                               identifier_property=identifier_property,
+                                               block_size=block_size or 1000,
+                                               batch_size=batch_size)
+        columns = self.output_columns(df)
+        if block_size is not None:
+            return ((pd.concat([cells_df, pd.DataFrame(candidates_format)]) if cells_df is not None
+                     else pd.DataFrame(candidates_format)).reindex(columns=columns)
+                    for cells_df, candidates_format in blocks)
+
         candidates_format = list()
+        for _, _candidates_format in blocks:
+            candidates_format.extend(_candidates_format)
+        if self.ffv.is_canonical_file(df):
+            return pd.DataFrame(candidates_format).reindex(columns=columns)
+        return pd.concat([df, pd.DataFrame(candidates_format)]).reindex(columns=columns)
+
+    def output_columns(self, df) -> list:
+        """
+        Returns the columns of the candidates of df: the columns of df followed by the fields of a candidate which
+        are not in df, in the order written by `format_candidates`.
+        """
+        candidate_columns = ['kg_id', 'kg_labels', 'kg_aliases', 'method', 'kg_descriptions', 'pagerank',
+                             self.score_column_name]
+        return list(df.columns) + [c for c in candidate_columns if c not in df.columns]
+
+    def create_candidates_blocks(self, df, column, size, properties, method,
+                                 lower_case=False, auxiliary_fields=None,
+                                 auxiliary_folder=None, auxiliary_file_prefix='',
+                                 extra_musts=None, max_threads=None, identifier_property=None, block_size=1000,
+                                 batch_size=None):
+        """
+        Yields tuples (input rows of the cells or None for a canonical file, list of candidates) for blocks of
+        block_size cells, in the order of the cells in the input. The input rows of a candidates file which are not
+        in any cell, e.g. with an empty search column, are not searched but yielded with the input rows of the cells
+        they come before in (column, row) order, or of the last cell. An empty input yields one block without
+        candidates, so that the output always has its header. The auxiliary files are written after the last block.
+        """
+        properties = [_.strip() for _ in properties.split(',')]
         df_columns = df.columns
         all_candidates_aux_dict = {}
-        max_threads = min(df.shape[0], max_threads)
+        # the threads only wait on ES, the number of requests in flight is decided by the concurrency controller
+        max_threads = max(1, min(df.shape[0], max_threads or ConcurrencyController().max_limit))
 
         if self.ffv.is_canonical_file(df):
+            relevant_columns = df_columns
             rows = df.to_dict("records")
-            with ThreadPoolExecutor(max_workers=max_threads) as executor:
-                for _candidates_format, candidates_aux_dict in executor.map(
-                        self.create_candidates, rows, repeat(df_columns),
-                        repeat(column), repeat(size), repeat(properties),
-                        repeat(method), repeat(lower_case),
-                        repeat(auxiliary_fields), repeat(extra_musts), repeat(identifier_property)):
-                    all_candidates_aux_dict = {**all_candidates_aux_dict,
-                                               **candidates_aux_dict}
-                    candidates_format.extend(_candidates_format)
-            self.write_auxiliary_files(auxiliary_folder,
-                                       all_candidates_aux_dict,
-                                       auxiliary_fields,
-                                       prefix=auxiliary_file_prefix)
-            return pd.DataFrame(candidates_format)
-        elif self.ffv.is_candidates_file(df):
+            cell_dfs = None
+            rows_without_cell_df = None
+        else:
             grouped = df.groupby(by=['column', 'row', column])
+            # groupby drops the rows with an empty key, they are not searched but kept in the output
+            rows_without_cell_df = df[df[['column', 'row', column]].isna().any(axis=1)]
             relevant_columns = [c for c in df_columns if
                                 c not in ['kg_id', 'kg_labels', 'method',
                                           'kg_descriptions',
                                           self.previous_match_column_name]]
             rows = list()
+            cell_dfs = list()
+            cell_keys = list()
             for key_tuple, gdf in grouped:
-                gdf.reset_index(inplace=True)
+                cell_dfs.append(gdf)
+                cell_keys.append(key_tuple[:2])
+                gdf = gdf.reset_index()
                 rows.append({c: gdf.at[0, c] for c in relevant_columns})
-            with ThreadPoolExecutor(max_workers=max_threads) as executor:
-                for _candidates_format, candidates_aux_dict in executor.map(
-                        self.create_candidates, rows,
-                        repeat(relevant_columns), repeat(column),
-                        repeat(size), repeat(properties), repeat(method),
-                        repeat(lower_case), repeat(auxiliary_fields),
-                        repeat(extra_musts)):
-                    all_candidates_aux_dict = {**all_candidates_aux_dict,
-                                               **candidates_aux_dict}
-                    candidates_format.extend(_candidates_format)
-            self.write_auxiliary_files(auxiliary_folder,
-                                       all_candidates_aux_dict,
-                                       auxiliary_fields,
-                                       prefix=auxiliary_file_prefix)
-            return pd.concat([df, pd.DataFrame(candidates_format)])
-        else:
-            raise UnsupportTypeError(
-                "The input df is neither a canonical format"
-                " or a candidate format!"
-            )
+            if cell_dfs:
+                self.add_rows_without_cell(cell_dfs, cell_keys, rows_without_cell_df)
+
+        candidates_format = list()
+        block_start = 0
+        args = (relevant_columns, column, size, properties, method, lower_case, auxiliary_fields, extra_musts,
+                identifier_property)
+        with ThreadPoolExecutor(max_workers=max_threads) as executor:
+            if batch_size and method in batch_query_types:
+                batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+                results = (result for batch_results in
+                           self.ordered_results(executor, self.create_candidates_batch, batches,
+                                                max_pending=max(block_size // batch_size, 4 * max_threads),
+                                                args=args)
+                           for result in batch_results)
+            else:
+                results = self.ordered_results(executor, self.create_candidates, rows,
+                                               max_pending=max(block_size, 4 * max_threads),
+                                               args=args)
+            for i, (_candidates_format, candidates_aux_dict) in enumerate(results):
+                all_candidates_aux_dict.update(candidates_aux_dict)
+                candidates_format.extend(_candidates_format)
+                if i + 1 - block_start == block_size or i + 1 == len(rows):
+                    cells_df = pd.concat(cell_dfs[block_start:i + 1]) if cell_dfs is not None else None
+                    yield cells_df, candidates_format
+                    candidates_format = list()
+                    block_start = i + 1
+
+        if len(rows) == 0:
+            yield rows_without_cell_df, []
+
+        self.write_auxiliary_files(auxiliary_folder,
+                                   all_candidates_aux_dict,
+                                   auxiliary_fields,
+                                   prefix=auxiliary_file_prefix)
+
+    @staticmethod
+    def add_rows_without_cell(cell_dfs: list, cell_keys: list, rows_without_cell_df: pd.DataFrame):
+        """
+        Adds every input row without a cell to the input rows of the first cell after it in (column, row) order,
+        the cells being sorted by groupby, or to the ones of the last cell if there is none or its column or row is
+        empty.
+        """
+        positions = {}
+        # the index of a candidates file is not unique, the rows are selected by position
+        for i, (column_value, row_value) in enumerate(zip(rows_without_cell_df['column'],
+                                                          rows_without_cell_df['row'])):
+            if pd.isna(column_value) or pd.isna(row_value):
+                position = len(cell_dfs)
+            else:
+                position = bisect.bisect_right(cell_keys, (column_value, row_value))
+            positions.setdefault(position, []).append(i)
+        for position, row_positions in positions.items():
+            if position < len(cell_dfs):
+                cell_dfs[position] = pd.concat([rows_without_cell_df.iloc[row_positions], cell_dfs[position]])
+            else:
+                cell_dfs[-1] = pd.concat([cell_dfs[-1], rows_without_cell_df.iloc[row_positions]])
+
+    @staticmethod
+    def ordered_results(executor, func, rows, max_pending, args=()):
+        """
+        Yields func(row, *args) for every row in the order of rows. At most max_pending calls are submitted to
+        the executor ahead of the one being waited for, which bounds the number of results held in memory.
+        """
+        pending = deque()
+        for row in rows:
+            pending.append(executor.submit(func, row, *args))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
 
     def create_candidates(self, row, relevant_columns, column, size,
                           properties, method, lower_case,
@@ -95,11 +207,40 @@ class Utility(object):
             search_term_original=search_term_original,
             identifier_property=identifier_property)
 
+        return self.format_candidates(_, relevant_columns, method, candidate_dict), candidate_aux_dict
+
+    def create_candidates_batch(self, rows, relevant_columns, column, size,
+                                properties, method, lower_case,
+                                auxiliary_fields=None, extra_musts=None, identifier_property=None):
+        """
+        The batch version of create_candidates, the candidates of all the rows are looked up with one query.
+        """
+        search_terms_original = None
+        if 'label' in relevant_columns and 'label' != column:
+            search_terms_original = [row['label'] for row in rows]
+
+        results = self.es.search_terms_candidates_batch(
+            [row[column] for row in rows], size, properties,
+            method, lower_case=lower_case,
+            auxiliary_fields=auxiliary_fields,
+            extra_musts=extra_musts,
+            search_terms_original=search_terms_original,
+            identifier_property=identifier_property)
+
+        return [(self.format_candidates(row, relevant_columns, method, candidate_dict), candidate_aux_dict)
+                for row, (candidate_dict, candidate_aux_dict) in zip(rows, results)]
+
+    def format_candidates(self, row, relevant_columns, method, candidate_dict):
+        """
+        Returns the rows in candidates format for the candidates of a cell, or a row with an empty kg_id if there are
+        no candidates.
+        """
+        candidates_format = list()
         if not candidate_dict:
             cf_dict = {}
 
             for k in relevant_columns:
-                cf_dict[k] = _[k]
+                cf_dict[k] = row[k]
 
             cf_dict['kg_id'] = ""
             cf_dict['kg_labels'] = ""
@@ -113,7 +254,7 @@ class Utility(object):
             for kg_id in candidate_dict:
                 cf_dict = {}
                 for k in relevant_columns:
-                    cf_dict[k] = _[k]
+                    cf_dict[k] = row[k]
 
                 cf_dict['kg_id'] = kg_id
                 cf_dict['kg_labels'] = candidate_dict[kg_id]['label_str']
@@ -125,7 +266,20 @@ class Utility(object):
                 cf_dict[self.score_column_name] = (candidate_dict[kg_id]
                 ['score'])
                 candidates_format.append(cf_dict)
-        return candidates_format, candidate_aux_dict
+        return candidates_format
+
+    @staticmethod
+    def write_candidates(candidates, output=sys.stdout):
+        """
+        Writes a dataframe of candidates, or an iterator over blocks of candidates, as csv to output. Blocks are
+        written and flushed as they arrive, with the header written once.
+        """
+        if isinstance(candidates, pd.DataFrame):
+            candidates.to_csv(output, index=False)
+            return
+        for i, block in enumerate(candidates):
+            block.to_csv(output, index=False, header=i == 0)
+            output.flush()
 
     def write_auxiliary_files(self, auxiliary_folder, all_candidates_aux_dict,
                               auxiliary_fields, prefix=''):
@@ -0,0 +1,46 @@
+import traceback
+import tl.exceptions
+from tl.utility.logging import Logger
+
+
+def parser():
+    return {
+        'help': 'builds an indexed context store, read by context-match, from context tsv or json lines files.'
+    }
+
+
+def add_arguments(parser):
+    """
+    Parse Arguments
+    Args:
+        parser: (argparse.ArgumentParser)
+
+    """
+
+    parser.add_argument('--input-files', action='store', type=str, dest='input_files', required=True,
+                        help='a comma separated list of context files, either tsv files with the columns '
+                             '`qnode context` or `node1 node2`, or json lines files. The files can be gzipped. '
+                             'The context of a QNode in several tsv files is concatenated in the order of the files.')
+
+    parser.add_argument('--output-store', action='store', type=str, dest='output_store', required=True,
+                        help='the folder where the context store will be written')
+
+
+def run(**kwargs):
+    from tl.utility.context_store import ContextStore
+    import time
+    try:
+        start = time.time()
+        input_files = [_.strip() for _ in kwargs['input_files'].split(',') if _.strip()]
+        entries = ContextStore.build(input_files, kwargs['output_store'])
+        end = time.time()
+        logger = Logger(kwargs["logfile"])
+        logger.write_to_file(args={
+            "command": "build-context-store",
+            "time": end - start,
+            "entries": entries
+        })
+    except:
+        message = 'Command: build-context-store\n'
+        message += 'Error Message:  {}\n'.format(traceback.format_exc())
+        raise tl.exceptions.TLException(message)
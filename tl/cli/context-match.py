@@ -19,7 +19,8 @@ def add_arguments(parser):
     # input file
     parser.add_argument('input_file', nargs='?', type=argparse.FileType('r'), default=sys.stdin)
     parser.add_argument('--context-file', type=str, dest='context_file', required=False,
-                        help="The file is used to look up context values for matching.")
+                        help="The file is used to look up context values for matching. A json lines file can be "
+                             "gzipped, or a context store built with `tl build-context-store` can be used.")
     parser.add_argument('--debug', action='store_true',
                         help="if set, an kgtk debug logger will be saved at home directory. "
                              "Debug adds two new columns to the output denoting the properties matched and the "
@@ -33,7 +34,8 @@ def add_arguments(parser):
                         help='The minimum threshold for similarity with input context for quantity matching. '
                              'Default: 0.85')
     parser.add_argument('--custom-context-file', type=str, dest='custom_context_file', required=False,
-                        help="The file is used to look up context values for matching.")
+                        help="The file is used to look up context values for matching. A json lines file can be "
+                             "gzipped, or a context store built with `tl build-context-store` can be used.")
     parser.add_argument('--string-separator', action='store', type=str, dest='string_separator', default=",",
                         help="Any separators to separate from in the context substrings.")
 
@@ -48,6 +50,26 @@ def add_arguments(parser):
     parser.add_argument('--save-relevant-properties', action='store_true', default=False,
                         dest='save_relevant_properties',
                         help="if set, relevant properties are written a file.")
+    parser.add_argument('--property-model', action='store', dest='property_model', default=None,
+                        help="a json file with the relevant properties learned for a dataset or a table. If it has no "
+                             "model for the table, all the properties are matched and the relevant ones are added "
+                             "to it, otherwise only the relevant properties of the model are matched.")
+    parser.add_argument('--property-model-key', action='store', dest='property_model_key', default=None,
+                        help="the key of the model in the property model file, e.g. the name of the dataset, so "
+                             "that all the tables of a dataset share a model. Default: a signature of the table.")
+    parser.add_argument('--sample-size', action='store', type=int, dest='sample_size', default=None,
+                        help="if set, all the properties are first matched for a random sample of this many rows, "
+                             "and the whole table is then matched against the top properties of the sample only.")
+    parser.add_argument('--sample-fallback', action='store', dest='sample_fallback', default='pair',
+                        choices=('pair', 'none'),
+                        help="what the pairs of columns without relevant properties in the sample match, "
+                             "'pair': all the properties, 'none': no property. Default: pair.")
+    parser.add_argument('--context-matches', action='store', dest='context_matches', default=None,
+                        help="a file of the context matches of the table. If it exists the matches are loaded from it "
+                             "instead of being computed, otherwise they are computed and saved to it, as a csv file "
+                             "if its name ends with .csv and as a binary .npz file otherwise.")
+    parser.add_argument('--use-cpus', action='store', type=int, dest='use_cpus', default=None,
+                        help="the number of processes matching the rows of the table. Default: all the cpus.")
     # output
     parser.add_argument('-o', '--output-column-name', action='store', dest='output_column', default="context_score",
                         help='The output column is the named column of the score for the matches '
@@ -66,22 +88,28 @@ def run(**kwargs):
         similarity_quantity_threshold = kwargs.pop("similarity_quantity_threshold")
         ignore_column_name = kwargs.pop("ignore_column_name")
 
+        start = time.time()
         obj = TableContextMatches(context_path=context_file_path, context_dict=None, input_path=input_file_path,
-                                  context_matches_path=None, label_column='label_clean',
+                                  context_matches_path=kwargs['context_matches'], label_column='label_clean',
                                   ignore_column=ignore_column_name,
                                   relevant_properties_file=kwargs['context_properties_path'],
                                   use_relevant_properties=kwargs['use_relevant_properties'],
                                   save_relevant_properties=kwargs['save_relevant_properties'],
                                   string_similarity_threshold=similarity_string_threshold,
                                   quantity_similarity_threshold=similarity_quantity_threshold,
-                                  output_column_name=output_column_name)
-        start = time.time()
+                                  output_column_name=output_column_name,
+                                  property_model_path=kwargs['property_model'],
+                                  property_model_key=kwargs['property_model_key'],
+                                  sample_size=kwargs['sample_size'],
+                                  sample_fallback=kwargs['sample_fallback'],
+                                  use_cpus=kwargs['use_cpus'])
         result_df = obj.input_df
         end = time.time()
         logger = Logger(kwargs["logfile"])
         logger.write_to_file(args={
             "command": "context-match",
             "time": end - start,
+            **obj.telemetry
         })
         result_df.to_csv(sys.stdout, index=False)
     except:
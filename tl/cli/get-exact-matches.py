@@ -46,6 +46,15 @@ def add_arguments(parser):
     parser.add_argument('--isa', action='store', type=str, dest='isa', default=None,
                         help='only candidates which are instance of this Qnode will be returned')
 
+    parser.add_argument('--block-size', action='store', type=int, dest='block_size', default=100,
+                        help='the candidates are written in blocks of this many cells, as soon as the queries of '
+                             'all the cells in a block have finished. 0 writes all the candidates at the end. '
+                             'Default is 100')
+
+    parser.add_argument('--batch-size', action='store', type=int, dest='batch_size', default=0,
+                        help='look up the candidates of this many cells with a single query. 0 sends a query per '
+                             'cell. Default is 0')
+
     parser.add_argument('input_file', nargs='?', type=argparse.FileType('r'), default=sys.stdin)
 
 
@@ -53,6 +62,8 @@ def run(**kwargs):
     from tl.candidate_generation import get_exact_matches
     import pandas as pd
     import time
+    from tl.candidate_generation.utility import Utility as CandidatesUtility
+    from tl.utility.concurrency import ConcurrencyController
     try:
         auxiliary_fields = kwargs.get('auxiliary_fields', None)
         auxiliary_folder = kwargs.get('auxiliary_folder', None)
@@ -74,14 +85,17 @@ def run(**kwargs):
                                    size=kwargs['size'], df=df,
                                    auxiliary_fields=auxiliary_fields,
                                    auxiliary_folder=auxiliary_folder,
-                                   isa=kwargs['isa'])
+                                   isa=kwargs['isa'],
+                                   block_size=kwargs['block_size'] or None,
+                                   batch_size=kwargs['batch_size'] or None)
+        CandidatesUtility.write_candidates(odf, sys.stdout)
         end = time.time()
         logger = Logger(kwargs["logfile"])
         logger.write_to_file(args={
             "command": "get-exact-matches",
-            "time": end-start
+            "time": end-start,
+            **ConcurrencyController().get_telemetry()
         })
-        odf.to_csv(sys.stdout, index=False)
     except:
         message = 'Command: get-exact-matches\n'
         message += 'Error Message:  {}\n'.format(traceback.format_exc())
@@ -31,6 +31,11 @@ def add_arguments(parser):
     parser.add_argument('-o', '--output-column', action='store', type=str, dest='output_column_name', default="retrieval_score",
                         help='the output column name where the normalized scores will be stored.Default is retrieval_score')
 
+    parser.add_argument('--block-size', action='store', type=int, dest='block_size', default=100,
+                        help='the candidates are written in blocks of this many cells, as soon as the queries of '
+                             'all the cells in a block have finished. 0 writes all the candidates at the end. '
+                             'Default is 100')
+
     parser.add_argument('input_file', nargs='?', type=argparse.FileType('r'), default=sys.stdin)
 
 
@@ -38,20 +43,24 @@ def run(**kwargs):
     from tl.candidate_generation import get_fuzzy_matches
     import pandas as pd
     import time
+    from tl.candidate_generation.utility import Utility as CandidatesUtility
+    from tl.utility.concurrency import ConcurrencyController
     try:
         df = pd.read_csv(kwargs['input_file'], dtype=object)
         start = time.time()
         em = get_fuzzy_matches.FuzzyMatches(es_url=kwargs['url'], es_index=kwargs['index'], es_user=kwargs['user'],
                                             es_pass=kwargs['password'], output_column_name=kwargs['output_column_name'])
         odf = em.get_exact_matches(kwargs['column'], properties=kwargs['properties'],
-                                   size=kwargs['size'], df=df)
+                                   size=kwargs['size'], df=df,
+                                   block_size=kwargs['block_size'] or None)
+        CandidatesUtility.write_candidates(odf, sys.stdout)
         end = time.time()
         logger = Logger(kwargs["logfile"])
         logger.write_to_file(args={
             "command": "get-fuzzy-matches",
-            "time": end-start
+            "time": end-start,
+            **ConcurrencyController().get_telemetry()
         })
-        odf.to_csv(sys.stdout, index=False)
     except:
         message = 'Command: get-fuzzy-matches\n'
         message += 'Error Message:  {}\n'.format(traceback.format_exc())
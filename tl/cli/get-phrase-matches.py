@@ -35,6 +35,11 @@ def add_arguments(parser):
                         default="retrieval_score",
                         help='the output column name of previous match results')
 
+    parser.add_argument('--block-size', action='store', type=int, dest='block_size', default=100,
+                        help='the candidates are written in blocks of this many cells, as soon as the queries of '
+                             'all the cells in a block have finished. 0 writes all the candidates at the end. '
+                             'Default is 100')
+
     parser.add_argument('input_file', nargs='?', type=argparse.FileType('r'), default=sys.stdin)
 
     # used for filtering
@@ -46,6 +51,8 @@ def run(**kwargs):
     from tl.candidate_generation import phrase_query_candidates
     import pandas as pd
     import time
+    from tl.candidate_generation.utility import Utility as CandidatesUtility
+    from tl.utility.concurrency import ConcurrencyController
     try:
         df = pd.read_csv(kwargs['input_file'], dtype=object)
         start = time.time()
@@ -56,14 +63,16 @@ def run(**kwargs):
                                                         previous_match_column_name=kwargs["previous_match_column_name"])
 
         odf = em.get_phrase_matches(kwargs['column'], properties=kwargs['properties'], size=kwargs['size'],
-                                    df=df, filter_condition=kwargs['filter_condition'])
+                                    df=df, filter_condition=kwargs['filter_condition'],
+                                    block_size=kwargs['block_size'] or None)
+        CandidatesUtility.write_candidates(odf, sys.stdout)
         end = time.time()
         logger = Logger(kwargs["logfile"])
         logger.write_to_file(args={
             "command": "get-phrase-matches",
-            "time": end-start
+            "time": end-start,
+            **ConcurrencyController().get_telemetry()
         })
-        odf.to_csv(sys.stdout, index=False)
     except:
         message = 'Command: get-phrase-matches\n'
         message += 'Error Message:  {}\n'.format(traceback.format_exc())
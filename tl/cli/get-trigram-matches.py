@@ -50,6 +50,11 @@ def add_arguments(parser):
                         help='column which specifies whether a candidate is part of pseudo ground truth or not. '
                              'if specified, the trigram search will be performed on all non pseudo ground truth cells')
 
+    parser.add_argument('--block-size', action='store', type=int, dest='block_size', default=100,
+                        help='the candidates are written in blocks of this many cells, as soon as the queries of '
+                             'all the cells in a block have finished. 0 writes all the candidates at the end. '
+                             'Default is 100')
+
     parser.add_argument('input_file', nargs='?', type=argparse.FileType('r'), default=sys.stdin)
 
 
@@ -57,6 +62,8 @@ def run(**kwargs):
     from tl.candidate_generation.get_trigram_matches import TriGramMatches
     import pandas as pd
     import time
+    from tl.candidate_generation.utility import Utility as CandidatesUtility
+    from tl.utility.concurrency import ConcurrencyController
     try:
         auxiliary_fields = kwargs.get('auxiliary_fields', None)
         auxiliary_folder = kwargs.get('auxiliary_folder', None)
@@ -82,14 +89,16 @@ def run(**kwargs):
                                       auxiliary_fields=auxiliary_fields,
                                       auxiliary_folder=auxiliary_folder,
                                       property=kwargs['property'],
-                                      isa=kwargs['isa'])
+                                      isa=kwargs['isa'],
+                                      block_size=kwargs['block_size'] or None)
+        CandidatesUtility.write_candidates(odf, sys.stdout)
         end = time.time()
         logger = Logger(kwargs["logfile"])
         logger.write_to_file(args={
             "command": "get-trigram-matches",
-            "time": end - start
+            "time": end - start,
+            **ConcurrencyController().get_telemetry()
         })
-        odf.to_csv(sys.stdout, index=False)
     except:
         message = 'Command: get-trigram-matches\n'
         message += 'Error Message:  {}\n'.format(traceback.format_exc())
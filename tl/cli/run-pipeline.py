@@ -1,4 +1,5 @@
 import argparse
+import os
 import sys
 import traceback
 from tl.exceptions import TLException
@@ -34,6 +35,10 @@ def add_arguments(parser):
                                          "input file.")
     parser.add_argument('--parallel-count', action='store', nargs='?', dest='parallel_count',
                         default="1", help="The amount of processes to be run at the same time. Default is 1")
+    parser.add_argument('--max-concurrency', action='store', type=int, dest='max_concurrency', default=50,
+                        help="The maximum number of requests in flight to the search servers summed over all the "
+                             "pipelines running at the same time. Each pipeline adapts its own limit below its "
+                             "share of this budget. Default is 50")
     # output
     parser.add_argument('--output', action='store', nargs='?', dest='output_name',
                         default="output_{}", help="defines a name for the output file for each input file.")
@@ -51,6 +56,8 @@ def run(**kwargs):
         raise TLException("pipeline command must be given.")
 
     parallel_count = int(kwargs['parallel_count'])
+    # share the request budget of the search servers among the pipelines, the commands of each pipeline read it
+    os.environ['TL_MAX_CONCURRENCY'] = str(max(1, kwargs['max_concurrency'] // parallel_count))
     input_files = kwargs["input"]
     running_configs = []
     gpu_resources = kwargs.get("gpu_resources")
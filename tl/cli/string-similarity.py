@@ -39,6 +39,10 @@ def add_arguments(parser):
     parser.add_argument('--threshold', action='store', dest='threshold', type=float, default=0.0,
                         help='str threshold')
 
+    parser.add_argument('--workers', action='store', type=int, dest='workers', default=1,
+                        help='The number of processes computing the similarities of the unique pairs of labels. '
+                             'Default: 1.')
+
 
 def run(**kwargs):
     from tl.features.string_similarity import StringSimilarity
@@ -56,6 +60,8 @@ def run(**kwargs):
         logger = Logger(kwargs["logfile"])
         logger.write_to_file(args={
             "command": "string-similarity-" + str(method),
+            "workers": kwargs["workers"],
+            **similarity_calculation_unit.telemetry,
             "time": end - start
         })
         odf.to_csv(sys.stdout, index=False)
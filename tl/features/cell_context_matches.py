@@ -1,12 +1,16 @@
-import re
-import json
+import math
+import multiprocessing
 import operator
+import os
 import sys
-import dateutil.parser as dp
+import time
 import pandas as pd
 from typing import List, Tuple, Set
-from rltk import similarity
 from tl.exceptions import TLException
+from tl.utility.context_store import ContextStore
+from tl.features.property_model import PropertyModel
+from tl.features.typed_value import typed_value
+from tl.features.monge_elkan import symmetric_monge_elkan_similarity
 import numpy as np
 
 ccm_columns = ['type', 'score', 'property', 'row',
@@ -15,6 +19,186 @@ ccm_columns = ['type', 'score', 'property', 'row',
 valid_property_types = {'i', 'd', 'q', 'e'}
 
 
+# the TableContextMatches whose rows are matched by the workers of its pool
+worker_table_context_matches = None
+
+# the number of (context value, cell value, type) similarities memoized for a table
+similarity_memo_size = 1 << 16
+
+
+def match_shard(shard: tuple) -> tuple:
+    """
+    Purpose: Matches the candidates of a shard of rows in a worker of the pool of TableContextMatches.
+    Returns: The triples matched, the counters of the shard, e.g. its number of comparisons, and the time it took.
+    """
+    start = time.time()
+    columns, candidates = shard
+    table_context_matches = worker_table_context_matches
+    table_context_matches.triples = ContextTriples()
+    table_context_matches.ccm_dict = {}
+    for counter in TableContextMatches.counters:
+        setattr(table_context_matches, counter, 0)
+    table_context_matches.match_candidates(candidates, columns)
+    return (table_context_matches.triples,
+            {counter: getattr(table_context_matches, counter) for counter in TableContextMatches.counters},
+            time.time() - start)
+
+
+class ContextTriples:
+    """
+    Columnar store of the context triples of a table. The strings of a triple are interned, and the triples are
+    kept in a NumPy array of string ids, one column per field in `triple_fields`, and a parallel array of scores.
+    """
+
+    triple_fields = ['type', 'property', 'row', 'col1', 'col1_item', 'col1_string', 'col2', 'col2_string',
+                     'col2_item', 'best_match']
+
+    def __init__(self, capacity: int = 1024):
+        self.strings = []
+        self.string_ids = {}
+        self.ids = np.empty((capacity, len(self.triple_fields)), dtype=np.int32)
+        self.scores = np.empty(capacity, dtype=float)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __getstate__(self):
+        # only the strings and the triples, not the free capacity, are pickled
+        return self.strings, self.ids[:self.size], self.scores[:self.size]
+
+    def __setstate__(self, state):
+        self.strings, self.ids, self.scores = state
+        self.string_ids = {string: string_id for string_id, string in enumerate(self.strings)}
+        self.size = len(self.scores)
+
+    def save(self, path: str):
+        """
+        Saves the triples to a NumPy .npz file, with one array of string ids per field, the scores, and the strings
+        dictionary as a single utf-8 buffer with the offsets of the strings in it.
+        """
+        encoded_strings = [str(string).encode('utf-8') for string in self.strings]
+        arrays = {f'ids_{field}': self.ids[:self.size, i] for i, field in enumerate(self.triple_fields)}
+        with open(path, 'wb') as f:
+            np.savez_compressed(f,
+                                scores=self.scores[:self.size],
+                                strings=np.frombuffer(b''.join(encoded_strings), dtype=np.uint8),
+                                string_offsets=np.cumsum([0] + [len(string) for string in encoded_strings]),
+                                **arrays)
+
+    @classmethod
+    def load(cls, path: str, fields: List[str] = None) -> 'ContextTriples':
+        """
+        Loads the triples saved to path. Only the arrays of fields, all of them if fields is None, are read from the
+        file, the other fields of the triples are None.
+        """
+        with np.load(path) as data:
+            scores = data['scores']
+            triples = cls(capacity=len(scores))
+            triples.ids[:len(scores)] = -1
+            for field in fields or cls.triple_fields:
+                triples.ids[:len(scores), cls.triple_fields.index(field)] = data[f'ids_{field}']
+            buffer = data['strings'].tobytes()
+            string_offsets = data['string_offsets'].tolist()
+        triples.scores[:len(scores)] = scores
+        triples.size = len(scores)
+        triples.strings = [buffer[start:end].decode('utf-8') for start, end in zip(string_offsets[:-1],
+                                                                                    string_offsets[1:])]
+        triples.string_ids = {string: string_id for string_id, string in enumerate(triples.strings)}
+        return triples
+
+    def intern(self, string: str) -> int:
+        """
+        Returns the id of string, None is -1.
+        """
+        if string is None:
+            return -1
+        string_id = self.string_ids.get(string, None)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.string_ids[string] = string_id
+            self.strings.append(string)
+        return string_id
+
+    def string(self, string_id: int) -> str:
+        return None if string_id < 0 else self.strings[string_id]
+
+    def reserve(self, size: int):
+        """
+        Doubles the arrays until they hold size triples.
+        """
+        capacity = max(len(self.scores), 1)
+        while capacity < size:
+            capacity *= 2
+        if capacity > len(self.scores):
+            self.ids = np.concatenate((self.ids, np.empty((capacity - len(self.scores), len(self.triple_fields)),
+                                                          dtype=np.int32)))
+            self.scores = np.concatenate((self.scores, np.empty(capacity - len(self.scores))))
+
+    def add(self, score: float, **triple) -> int:
+        """
+        Adds a triple, given its score and the strings of `triple_fields`, and returns its offset.
+        """
+        self.reserve(self.size + 1)
+        self.ids[self.size] = [self.intern(triple[field]) for field in self.triple_fields]
+        self.scores[self.size] = score
+        self.size += 1
+        return self.size - 1
+
+    def extend(self, triples: 'ContextTriples') -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Adds all the triples of another store, e.g. those matched by a worker. Returns the string ids of the added
+        triples, in this store, and their offsets.
+        """
+        # the last id maps None to itself
+        string_ids = np.array([self.intern(string) for string in triples.strings] + [-1], dtype=np.int32)
+        ids = string_ids[triples.ids[:triples.size]]
+        self.reserve(self.size + triples.size)
+        offsets = np.arange(self.size, self.size + triples.size)
+        self.ids[offsets] = ids
+        self.scores[offsets] = triples.scores[:triples.size]
+        self.size += triples.size
+        return ids, offsets
+
+    def group(self, fields: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Groups the triples by the strings of fields. Returns the string ids of the groups, one row per group sorted
+        by the ids, and the group of every triple.
+        """
+        columns = [self.triple_fields.index(field) for field in fields]
+        keys, inverse = np.unique(self.ids[:self.size, columns], axis=0, return_inverse=True)
+        return keys, inverse.reshape(-1)
+
+    def get(self, offset: int) -> dict:
+        triple = {field: self.string(string_id) for field, string_id in zip(self.triple_fields, self.ids[offset])}
+        triple['score'] = float(self.scores[offset])
+        return {field: triple[field] for field in ccm_columns + ['best_match']}
+
+    def aggregate_properties(self, offsets: np.ndarray) -> List[Tuple[str, str, float, float, int]]:
+        """
+        Returns (property, type, best score, average score, count) of the properties of the triples at offsets,
+        in the order the properties first appear, the type is that of the first triple of the property.
+        """
+        if len(offsets) == 0:
+            return []
+        properties = self.ids[offsets, 1]
+        scores = self.scores[offsets]
+        unique_properties, first, inverse = np.unique(properties, return_index=True, return_inverse=True)
+        counts = np.bincount(inverse)
+        sums = np.bincount(inverse, weights=scores)
+        best_scores = np.full(len(unique_properties), -1.0)
+        np.maximum.at(best_scores, inverse, scores)
+        types = self.ids[offsets[first], 0]
+        result = []
+        for i in np.argsort(first, kind='stable'):
+            result.append((self.strings[unique_properties[i]],
+                           self.strings[types[i]],
+                           float(best_scores[i]),
+                           float(sums[i] / counts[i]),
+                           int(counts[i])))
+        return result
+
+
 class CellContextMatches:
     """
     Contains the context matches for a single cell to all other cells in the same row.
@@ -24,15 +208,17 @@ class CellContextMatches:
     def __init__(self,
                  row: str,
                  col: str,
+                 triples: ContextTriples = None
                  ):
         """
-        Create an empty CellContextMatches for a specific cell.
+        Create an empty CellContextMatches for a specific cell, whose triples are added to the triples of its table.
         """
         self.row = row
         self.col = col
 
-        # self.ccm = pd.DataFrame(columns=ccm_columns)
-        self.ccm = dict()
+        self.triples = triples if triples is not None else ContextTriples()
+        # the offsets of the triples of the cell, {col2: {col1_item: [offset, ...]}}
+        self.offsets = dict()
         self.col1_items = set()
 
     def add_triple(self,
@@ -50,23 +236,24 @@ class CellContextMatches:
         """
         Add a single triple to CellContextMatches.
         """
-        triple = {
-            'type': type,
-            'score': score,
-            'property': property,
-            'row': row,
-            'col1': col1,
-            'col1_item': col1_item,
-            'col1_string': col1_string,
-            'col2': col2,
-            'col2_string': col2_string,
-            'col2_item': col2_item,
-            'best_match': best_match
-        }
-        if col2 not in self.ccm:
-            self.ccm[col2] = list()
-
-        self.ccm[col2].append(triple)
+        offset = self.triples.add(score=score,
+                                  type=type,
+                                  property=property,
+                                  row=row,
+                                  col1=col1,
+                                  col1_item=col1_item,
+                                  col1_string=col1_string,
+                                  col2=col2,
+                                  col2_string=col2_string,
+                                  col2_item=col2_item,
+                                  best_match=best_match)
+        self.add_offset(col2, col1_item, offset)
+
+    def add_offset(self, col2: str, col1_item: str, offset: int):
+        """
+        Adds the offset of a triple of the cell already in its ContextTriples.
+        """
+        self.offsets.setdefault(col2, dict()).setdefault(col1_item, list()).append(offset)
         self.col1_items.add(col1_item)
 
     def has_candidate(self, col1_item: str):
@@ -75,14 +262,22 @@ class CellContextMatches:
         """
         return col1_item in self.col1_items
 
+    def get_offsets(self, col2: str, q_node: str = None) -> np.ndarray:
+        """
+        Returns the offsets, in the order they were added, of the triples to col2 of q_node or of all the candidates.
+        """
+        col2_offsets = self.offsets.get(col2, {})
+        if q_node:
+            return np.array(col2_offsets.get(q_node, []), dtype=int)
+        return np.sort(np.array([offset for offsets in col2_offsets.values() for offset in offsets], dtype=int))
+
     def get_triples(self):
         """
         Return a list of all the triples
         """
         out = []
-        for k in self.ccm:
-            triples = self.ccm[k]
-            out.extend(triples)
+        for k in self.offsets:
+            out.extend(self.get_triples_to_column(k))
 
         return out
 
@@ -92,7 +287,7 @@ class CellContextMatches:
         """
         if self.col == col2:
             raise Exception(f'Cannot find context for a column with itself. col1: {self.col}, col2: {col2}')
-        return self.ccm.get(col2, [])
+        return [self.triples.get(offset) for offset in self.get_offsets(col2)]
 
     def get_properties(self, col2: str, q_node: str = None) -> List[Tuple[str, str, float, int]]:
         """
@@ -107,36 +302,7 @@ class CellContextMatches:
         if self.col == col2:
             raise Exception(f'Cannot find context for a column with itself. col1: {self.col}, col2: {col2}')
 
-        result = []
-
-        col2_records = self.ccm.get(col2, [])
-        if q_node:
-            col2_records = [s for s in col2_records if s.get('col1_item') == q_node]
-        prop_count = {}
-        for record in col2_records:
-            property = record['property']
-            score = record['score']
-            if property not in prop_count:
-                prop_count[property] = {
-                    'count': 0,
-                    'max_score': -1.0,
-                    'type': record['type'],
-                    'sum': 0
-                }
-            prop_count[property]['count'] += 1
-            prop_count[property]['sum'] += score
-            if score > prop_count[property]['max_score']:
-                prop_count[property]['max_score'] = score
-        for property in prop_count:
-            number_of_occurences = prop_count[property]['count']
-            avg_score = prop_count[property]['sum'] / number_of_occurences
-            max_score = prop_count[property]['max_score']
-            result.append((property,
-                           prop_count[property]['type'],
-                           max_score,
-                           avg_score,
-                           number_of_occurences))
-        return result
+        return self.triples.aggregate_properties(self.get_offsets(col2, q_node))
 
 
 class TableContextMatches:
@@ -145,6 +311,9 @@ class TableContextMatches:
     the same row.
     """
 
+    # the counters summed over the shards of the rows
+    counters = ['comparisons', 'skipped_comparisons', 'similarity_memo_hits', 'similarity_memo_misses']
+
     def __init__(self,
                  context_path: str = None,
                  context_dict: dict = None,
@@ -158,15 +327,21 @@ class TableContextMatches:
                  save_relevant_properties: bool = False,
                  string_similarity_threshold: float = 0.7,
                  quantity_similarity_threshold: float = 0.3,
-                 output_column_name: str = "context_score"
+                 output_column_name: str = "context_score",
+                 property_model_path: str = None,
+                 property_model_key: str = None,
+                 sample_size: int = None,
+                 sample_fallback: str = 'pair',
+                 use_cpus: int = None
                  ):
         """
       Maybe better to have a set of columns
       Create a ContextMatches datastructure to store the context matches between columns in a row.
-      Each entry in the ContextMatches array is a list of dicts, where each dict contains
+      Each entry in the ContextMatches array is a CellContextMatches, whose triples contain
       row, col1, col2, property, score, col1_item, col2_string and col2_item.
       The internal datastructure must return the matches between two columns in a rows in constant time,
-      so the backing store must be NumPy array.
+      so the triples of all the cells are backed by the NumPy arrays of a ContextTriples, and every cell keeps
+      the offsets of its triples to each other column and candidate.
         """
         self.ignore_column = ignore_column
         if self.ignore_column:
@@ -174,10 +349,11 @@ class TableContextMatches:
         else:
             self.prefix_column_name = ""
         self.row_col_label_dict = {}
-        if context_path is not None:
-            context_dict = self.read_context_file(context_path)
         self.output_column_name = output_column_name
         self.ccm_dict = {}
+        self.triples = ContextTriples()
+        self.context_dict = None
+        self.use_cpus = use_cpus or multiprocessing.cpu_count()
         self.string_similarity_threshold = string_similarity_threshold
         self.quantity_similarity_threshold = quantity_similarity_threshold
         self.input_df = None
@@ -187,21 +363,128 @@ class TableContextMatches:
         self.use_relevant_properties = use_relevant_properties
         self.save_relevant_properties = save_relevant_properties
         self.relevant_properties = {}
+        # whether the pairs of columns without relevant properties match all the properties
+        self.fallback_to_all_properties = False
         if use_relevant_properties:
             self.relevant_properties = self.read_relevant_properties()
+        # the matches saved by an earlier run on the same table are loaded instead of being matched again
+        loads_context_matches = context_matches_path is not None and os.path.exists(context_matches_path)
+        if context_path is not None and not loads_context_matches:
+            context_dict = self.read_context_file(context_path, qnodes=set(input_df['kg_id'].dropna()))
         input_df['row'] = input_df['row'].astype('str')
         input_df['column'] = input_df['column'].astype('str')
         self.main_entity_column = self.find_main_entity_column(input_df, label_column)
+
+        # the number of property values compared to the cells, and of those skipped as not relevant
+        self.comparisons = 0
+        self.skipped_comparisons = 0
+        # the similarities of (context value, cell value, type), bounded to similarity_memo_size
+        self.similarity_memo = {}
+        self.similarity_memo_hits = 0
+        self.similarity_memo_misses = 0
+        self.relevant_properties_df = None
+        self.relevant_properties_coverage = None
+        self.telemetry = {}
+        self.property_model = None
+        self.property_model_key = None
+        uses_property_model = False
+        if property_model_path is not None:
+            self.property_model = PropertyModel(property_model_path)
+            self.property_model_key = property_model_key or PropertyModel.table_signature(input_df, label_column)
+            uses_property_model = self.property_model.get(self.property_model_key) is not None
+            if uses_property_model and not use_relevant_properties:
+                self.relevant_properties = self.property_model.relevant_properties(self.property_model_key)
+                self.use_relevant_properties = True
+
+        if loads_context_matches:
+            self.initialize(input_df, context_dict, label_column, context_matches_path=context_matches_path)
+            self.telemetry['context_matches'] = 'loaded'
+            return
+
+        start = time.time()
+        if sample_size and not self.use_relevant_properties:
+            self.learn_relevant_properties_from_sample(input_df, context_dict, label_column, sample_size,
+                                                       sample_fallback)
         self.initialize(input_df, context_dict, label_column)
+        matching_time = time.time() - start
+        if 'sample_rows' in self.telemetry:
+            self.telemetry.update({
+                'comparisons': self.comparisons,
+                'skipped_comparisons': self.skipped_comparisons
+            })
+        if self.property_model is not None:
+            self.update_property_model(uses_property_model, matching_time)
 
         if context_matches_path is not None:
-            self.load_from_disk(context_matches_path)
+            self.serialize(context_matches_path)
+            self.telemetry['context_matches'] = 'saved'
 
-    def read_relevant_properties(self) -> dict:  # or whatever datastructure makes sense
-        if self.relevant_properties_file is None:
-            raise TLException('Please specify a valid path for relevant properties.')
+    def update_property_model(self, uses_property_model: bool, matching_time: float):
+        """
+        Learns the property model of the table if it has none, or reports how the run with the property model
+        compares to the run which learned it. A model learned from a sample has no figures of a full run to compare
+        to.
+        """
+        self.telemetry.update({
+            'property_model_key': self.property_model_key,
+            'comparisons': self.comparisons,
+            'skipped_comparisons': self.skipped_comparisons,
+            'matching_time': round(matching_time, 4)
+        })
+        if uses_property_model:
+            model = self.property_model.get(self.property_model_key)
+            self.telemetry.update({
+                'property_model': 'used',
+                'property_model_sample_rows': model.get('sample_rows'),
+                # the share of the property score of the full run covered by the properties that were matched
+                'property_coverage': model['coverage'],
+                'full_comparisons': model['comparisons'],
+                'full_matching_time': model['time'],
+                'speedup': round(model['time'] / matching_time, 2) if model['time'] and matching_time > 0 else None
+            })
+        else:
+            sample_rows = self.telemetry.get('sample_rows')
+            self.property_model.add(self.property_model_key, self.relevant_properties_df,
+                                    self.relevant_properties_coverage, self.comparisons, round(matching_time, 4),
+                                    sample_rows=sample_rows)
+            self.telemetry.update({
+                'property_model': 'created',
+                'property_model_sample_rows': sample_rows,
+                # the coverage of a run which did not match all the properties is not that of a full run
+                'property_coverage': self.relevant_properties_coverage if sample_rows is None else None
+            })
+
+    def learn_relevant_properties_from_sample(self, input_df: pd.DataFrame, context_dict: dict, label_column: str,
+                                              sample_size: int, sample_fallback: str):
+        """
+        Matches all the properties for a random sample of sample_size rows, and keeps the top properties of
+        every pair of columns as the relevant properties for matching the whole table.
+        sample_fallback is 'pair' if the pairs of columns without relevant properties in the sample match all the
+        properties, or 'none' if they match none.
+        """
+        if sample_fallback not in ('pair', 'none'):
+            raise TLException(f'Unknown sample fallback: {sample_fallback}, expected pair or none')
+        rows = pd.Series(sorted(input_df['row'].unique()))
+        if len(rows) <= sample_size:
+            # the sample would be the whole table
+            return
+        sampled_rows = set(rows.sample(n=sample_size, random_state=0))
+        self.initialize(input_df[input_df['row'].isin(sampled_rows)].copy(), context_dict, label_column)
+        self.telemetry.update({
+            'sample_rows': sample_size,
+            'sample_comparisons': self.comparisons
+        })
+
+        self.relevant_properties = self.relevant_properties_dict(self.relevant_properties_df)
+        self.use_relevant_properties = True
+        self.fallback_to_all_properties = sample_fallback == 'pair'
+        # the whole table is matched from scratch
+        self.ccm_dict = {}
+        self.triples = ContextTriples()
+        self.row_col_label_dict = {}
 
-        relevant_properties_df = pd.read_csv(self.relevant_properties_file)
+    @staticmethod
+    def relevant_properties_dict(relevant_properties_df: pd.DataFrame) -> dict:
         relevant_properties_group = relevant_properties_df.groupby(['column', 'col2'])
         relevant_properties_dict = {}
         for cell, group in relevant_properties_group:
@@ -211,6 +494,12 @@ class TableContextMatches:
 
         return relevant_properties_dict
 
+    def read_relevant_properties(self) -> dict:  # or whatever datastructure makes sense
+        if self.relevant_properties_file is None:
+            raise TLException('Please specify a valid path for relevant properties.')
+
+        return self.relevant_properties_dict(pd.read_csv(self.relevant_properties_file))
+
     def write_relevant_properties(self, relevant_properties_df: pd.DataFrame):
         if self.relevant_properties_file is None:
             raise TLException('Please specify a valid path for relevant properties.')
@@ -223,7 +512,8 @@ class TableContextMatches:
             column_relevant_properties = self.relevant_properties[column_column_pair]
             if property in column_relevant_properties:
                 return True
-        return False
+            return False
+        return self.fallback_to_all_properties
 
     def find_main_entity_column(self, input_df, label_column) -> str:
         col_labels_dict = {}
@@ -235,7 +525,7 @@ class TableContextMatches:
             return max_cols[0]
         return '0'
 
-    def initialize(self, raw_input_df, context_dict, label_column):
+    def initialize(self, raw_input_df, context_dict, label_column, context_matches_path: str = None):
 
         raw_input_df['kg_labels'].fillna("", inplace=True)
         raw_input_df['kg_aliases'].fillna("", inplace=True)
@@ -272,13 +562,18 @@ class TableContextMatches:
                     context_column = i + 1
                     row_col_dict_key = f"{row}_{context_column}"
                     if row_col_dict_key not in self.row_col_label_dict:
-                        try:
-                            date = dp.parse(context_val)
-                            context_val = str(date.year)
-                        except:
-                            pass
+                        context_val = typed_value(context_val).year or context_val
                         self.row_col_label_dict[row_col_dict_key] = context_val
                         columns.add(str(context_column))
+        if context_matches_path is not None:
+            # only the fields used to score the candidates are loaded
+            self.load_from_disk(context_matches_path, fields=['type', 'property', 'row', 'col1', 'col1_item',
+                                                              'col2'])
+            self.input_df = self.process(row_column_pairs, columns)
+            return
+
+        # the candidates with a context, (row, col, kg_id, kg_label_str), of every row
+        row_candidates = {}
         for row, col, kg_id, kg_id_label_str, kg_id_alias_str in zip(self.input_df['row'],
                                                                      self.input_df['column'],
                                                                      self.input_df['kg_id'],
@@ -295,33 +590,101 @@ class TableContextMatches:
             ccm_key = f"{row}_{col}"
 
             if ccm_key not in self.ccm_dict:
-                self.ccm_dict[ccm_key] = CellContextMatches(row, col)
+                self.ccm_dict[ccm_key] = CellContextMatches(row, col, self.triples)
             if kg_id_context is not None:
                 for col2 in columns:
                     if (col != col2) and (col == self.main_entity_column or col2 == self.main_entity_column):
 
                         ccm_key_2 = f"{row}_{col2}"
                         if ccm_key_2 not in self.ccm_dict:
-                            self.ccm_dict[ccm_key_2] = CellContextMatches(row, col2)
-                        context_results = self.compute_context_similarity(kg_id_context, col,
-                                                                          col2,
-                                                                          self.row_col_label_dict.get(f"{row}_{col2}",
-                                                                                                      None))
-                        for context_result in context_results:
-                            self.add_match(row=row,
-                                           col1=col,
-                                           col1_item=kg_id,
-                                           col1_string=kg_label_str,
-                                           col2=col2,
-                                           col2_item=context_result['col2_item'],
-                                           col2_string=context_result['col2_string'],
-                                           type=context_result['type'],
-                                           property=context_result['property'],
-                                           score=context_result['score'],
-                                           best_match=context_result['best_match']
-                                           )
+                            self.ccm_dict[ccm_key_2] = CellContextMatches(row, col2, self.triples)
+                row_candidates.setdefault(row, []).append((row, col, kg_id, kg_label_str))
+        self.context_dict = context_dict
+        self.match_rows(row_candidates, columns)
         self.input_df = self.process(row_column_pairs, columns)
 
+    def match_rows(self, row_candidates: dict, columns: set):
+        """
+        Matches the candidates of every row to the other cells of the row. With more than one cpu the rows are
+        split in shards matched by a pool of forked processes, which share the context with this process, and the
+        triples matched by every shard are added to the triples of the table in the order of the shards.
+        """
+        start = time.time()
+        cpus = min(self.use_cpus, max(1, len(row_candidates)))
+        shard_times = []
+        # a list keeps the order of the columns of this process in the workers
+        columns = list(columns)
+        if cpus > 1:
+            global worker_table_context_matches
+            worker_table_context_matches = self
+            rows = list(row_candidates)
+            shard_size = math.ceil(len(rows) / (cpus * 4))
+            shards = [(columns, [candidate for row in rows[i:i + shard_size] for candidate in row_candidates[row]])
+                      for i in range(0, len(rows), shard_size)]
+            with multiprocessing.get_context('fork').Pool(cpus) as pool:
+                for triples, counts, shard_time in pool.imap(match_shard, shards):
+                    self.add_triples(triples)
+                    for counter, count in counts.items():
+                        setattr(self, counter, getattr(self, counter) + count)
+                    shard_times.append(shard_time)
+            worker_table_context_matches = None
+        else:
+            self.match_candidates([candidate for candidates in row_candidates.values() for candidate in candidates],
+                                  columns)
+            shard_times.append(time.time() - start)
+        self.telemetry.update({
+            'cpus': cpus,
+            'matched_rows': len(row_candidates),
+            'shards': len(shard_times),
+            'shard_time_mean': round(float(np.mean(shard_times)), 4),
+            'shard_time_max': round(float(np.max(shard_times)), 4),
+            'row_matching_time': round(time.time() - start, 4),
+            'similarity_memo_hits': self.similarity_memo_hits,
+            'similarity_memo_misses': self.similarity_memo_misses,
+            'similarity_memo_hit_rate': round(self.similarity_memo_hits / max(1, self.similarity_memo_hits +
+                                                                              self.similarity_memo_misses), 4)
+        })
+
+    def match_candidates(self, candidates: List[tuple], columns: List[str]):
+        """
+        Matches the context of every candidate (row, col, kg_id, kg_label_str) to the other cells of its row.
+        """
+        for row, col, kg_id, kg_label_str in candidates:
+            kg_id_context = self.context_dict[kg_id]
+            for col2 in columns:
+                if (col != col2) and (col == self.main_entity_column or col2 == self.main_entity_column):
+                    context_results = self.compute_context_similarity(kg_id_context, col,
+                                                                      col2,
+                                                                      self.row_col_label_dict.get(f"{row}_{col2}",
+                                                                                                  None))
+                    for context_result in context_results:
+                        self.add_match(row=row,
+                                       col1=col,
+                                       col1_item=kg_id,
+                                       col1_string=kg_label_str,
+                                       col2=col2,
+                                       col2_item=context_result['col2_item'],
+                                       col2_string=context_result['col2_string'],
+                                       type=context_result['type'],
+                                       property=context_result['property'],
+                                       score=context_result['score'],
+                                       best_match=context_result['best_match']
+                                       )
+
+    def add_triples(self, triples: ContextTriples):
+        """
+        Adds the triples matched by a shard, or loaded from disk, to the triples of the table and to the cells they
+        belong to.
+        """
+        ids, offsets = self.triples.extend(triples)
+        fields = [ContextTriples.triple_fields.index(field) for field in ['row', 'col1', 'col2', 'col1_item']]
+        for (row, col1, col2, col1_item), offset in zip(ids[:, fields].tolist(), offsets.tolist()):
+            row, col1 = self.triples.string(row), self.triples.string(col1)
+            ccm_key = f"{row}_{col1}"
+            if ccm_key not in self.ccm_dict:
+                self.ccm_dict[ccm_key] = CellContextMatches(row, col1, self.triples)
+            self.ccm_dict[ccm_key].add_offset(self.triples.string(col2), self.triples.string(col1_item), offset)
+
     def process(self, row_column_pairs: set, n_context_columns: set):
         context_scores, properties, similarities = self.compute_context_scores(n_context_columns, row_column_pairs)
         self.input_df[self.output_column_name] = context_scores
@@ -338,7 +701,9 @@ class TableContextMatches:
 
     def compute_context_scores(self, n_context_columns: set, row_column_pairs: set) -> (
             List[int], List[str], List[int]):
-        self.compute_property_scores(row_column_pairs, n_context_columns)
+        aggregates = self.aggregate_triples()
+        self.compute_property_scores(row_column_pairs, n_context_columns, aggregates)
+        best_properties = self.best_properties(aggregates)
         context_score_list = []
         context_property_list = []
         context_similarity_list = []
@@ -348,18 +713,12 @@ class TableContextMatches:
             property_matched = []
             similarity_matched = []
             sum_of_properties = 0
-            r_c = f"{row}_{col}"
             for col2 in n_context_columns:
                 if col2 != col and (col == self.main_entity_column or col2 == self.main_entity_column):
-                    returned_properties = self.ccm_dict[r_c].get_properties(col2, q_node=q_node)
-                    if not returned_properties:
+                    best_property = best_properties.get((row, col, col2, q_node), None)
+                    if best_property is None:
                         continue
-                    best_score = 0
-                    property_ = None
-                    for properties in returned_properties:
-                        if properties[2] > best_score:
-                            property_ = properties[0]
-                            best_score = properties[2]
+                    property_, best_score = best_property
                     # if property_ not in current_relevant_properties: pass
                     property_matched.append(property_ + "(" + str(best_score) + ")")
                     similarity_matched.append(best_score)
@@ -373,36 +732,75 @@ class TableContextMatches:
             context_property_list.append(property_matched)
         return context_score_list, context_property_list, context_similarity_list
 
-    def compute_property_scores(self, row_column_pairs: set, n_context_columns: set):
-        properties_df_list = []
-        for r_c in row_column_pairs:
-            row_col = r_c.split("_")
-            row = row_col[0]
-            col = row_col[1]
-            for col2 in n_context_columns:
-                if (col2 != col) and (col2 == self.main_entity_column or col == self.main_entity_column):
-                    m = self.ccm_dict[r_c].get_properties(col2)
-                    int_prop = pd.DataFrame(m, columns=["property_", "type", "best_score", "avg_score", "n_occurences"])
-                    int_prop['row'] = row
-                    int_prop['column'] = col
-                    int_prop['col2'] = col2
-                    properties_df_list.append(int_prop)
-            if len(properties_df_list) > 0:
-                properties_df = pd.concat(properties_df_list)
-                property_value_list = []
-                grouped_obj = properties_df.groupby(['column', 'col2', 'property_'])
-                for cell, group in grouped_obj:
-                    property_score = (group['avg_score'].sum(axis=0))
-                    property_value_list.append([cell[2], cell[0], cell[1], property_score])
-                property_value_df = pd.DataFrame(property_value_list,
-                                                 columns=['property_', 'column', 'col2', 'property_score'])
-                property_value_df = property_value_df.sort_values(by=['column', 'property_score'],
-                                                                  ascending=[True, False])
-                # Saving the top 3 properties for each column column pair that we have.
-                # <column, col2> is equivalent to <from, to>
-                most_important_property_df = property_value_df.groupby(['column', 'col2']).head(3)
-            else:
-                most_important_property_df = pd.DataFrame(columns=['property_', 'column', 'col2', 'property_score'])
+    def aggregate_triples(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Aggregates all the triples of the table in a single pass by (row, col1, col2, col1_item, property).
+        Returns the string ids of these keys, the key of every triple, and the best score and the offset of the
+        first triple of every key.
+        """
+        keys, key_of_triple = self.triples.group(['row', 'col1', 'col2', 'col1_item', 'property'])
+        scores = self.triples.scores[:len(self.triples)]
+        best_scores = np.full(len(keys), -1.0)
+        np.maximum.at(best_scores, key_of_triple, scores)
+        first_offsets = np.full(len(keys), len(self.triples))
+        np.minimum.at(first_offsets, key_of_triple, np.arange(len(self.triples)))
+        return keys, key_of_triple, best_scores, first_offsets
+
+    def best_properties(self, aggregates: tuple) -> dict:
+        """
+        Returns {(row, col1, col2, col1_item): (property, best score)}, the property with the best score of every
+        candidate of a cell to another column, the first property to match wins a tie, as in get_properties.
+        """
+        keys, _, best_scores, first_offsets = aggregates
+        if len(keys) == 0:
+            return {}
+        # the keys are sorted, the keys of a candidate and a column are contiguous
+        candidate_starts = np.concatenate(([True], np.any(keys[1:, :4] != keys[:-1, :4], axis=1)))
+        candidates = np.cumsum(candidate_starts)
+        order = np.lexsort((first_offsets, -best_scores, candidates))
+        best = order[np.concatenate(([True], candidates[order][1:] != candidates[order][:-1]))]
+        strings = self.triples.strings
+        return {(strings[row], strings[col1], strings[col2], strings[col1_item]): (strings[property_],
+                                                                                  float(best_scores[i]))
+                for i, (row, col1, col2, col1_item, property_) in zip(best, keys[best])}
+
+    def compute_property_scores(self, row_column_pairs: set, n_context_columns: set, aggregates: tuple = None):
+        """
+        Scores every property of a pair of columns by the sum over the cells of the column of its average score
+        to the other column, and keeps the top 3 properties of every pair of columns as the relevant properties.
+        """
+        if aggregates is None:
+            aggregates = self.aggregate_triples()
+        keys, key_of_triple, _, _ = aggregates
+        strings = self.triples.strings
+        property_value_list = []
+        if len(keys) > 0:
+            # the average score of a property over all the candidates of a cell to another column
+            cells, cell_of_key = np.unique(keys[:, [0, 1, 2, 4]], axis=0, return_inverse=True)
+            cell_of_triple = cell_of_key.reshape(-1)[key_of_triple]
+            scores = self.triples.scores[:len(self.triples)]
+            avg_scores = np.bincount(cell_of_triple, weights=scores) / np.bincount(cell_of_triple)
+            matched = np.array([f"{strings[row]}_{strings[col]}" in row_column_pairs and strings[col2] in
+                                n_context_columns for row, col, col2, _ in cells], dtype=bool)
+            properties, property_of_cell = np.unique(cells[matched][:, 1:], axis=0, return_inverse=True)
+            property_scores = np.bincount(property_of_cell.reshape(-1), weights=avg_scores[matched])
+            for (col, col2, property_), property_score in zip(properties, property_scores):
+                property_value_list.append([strings[property_], strings[col], strings[col2], float(property_score)])
+        # in the order of the (column, col2, property_) groups
+        property_value_list.sort(key=lambda property_value: (property_value[1], property_value[2],
+                                                             property_value[0]))
+        property_value_df = pd.DataFrame(property_value_list,
+                                         columns=['property_', 'column', 'col2', 'property_score'])
+        property_value_df = property_value_df.sort_values(by=['column', 'property_score'],
+                                                          ascending=[True, False])
+        # Saving the top 3 properties for each column column pair that we have.
+        # <column, col2> is equivalent to <from, to>
+        most_important_property_df = property_value_df.groupby(['column', 'col2']).head(3)
+        self.relevant_properties_df = most_important_property_df
+        total_property_score = property_value_df['property_score'].sum()
+        self.relevant_properties_coverage = round(
+            float(most_important_property_df['property_score'].sum() / total_property_score), 4) \
+            if total_property_score > 0 else 1.0
         if self.save_relevant_properties:
             self.write_relevant_properties(most_important_property_df)
 
@@ -429,6 +827,7 @@ class TableContextMatches:
             if not self.use_relevant_properties or (self.use_relevant_properties
                                                     and
                                                     self.is_relevant_property(col, col2, property)):
+                self.comparisons += 1
                 score, best_str_match = self.computes_similarity(prop_val_dict['v'],
                                                                  col2_string_set,
                                                                  prop_val_dict['t'])
@@ -445,31 +844,18 @@ class TableContextMatches:
                         "property": property,
                         'col2_item': prop_val_dict.get('i', None)
                     })
+            else:
+                self.skipped_comparisons += 1
 
         return result
 
-    def return_a_number(self, col2_string: str) -> float:
-        col2_string_stripped = col2_string.replace('"', '')
-        to_match_1 = col2_string_stripped.replace(",", "")
-        numeric_col2_value = None
-        try:
-            if " " in to_match_1:
-                split_v = to_match_1.split(" ")
-                for s in split_v:
-                    if self.return_a_number(s):
-                        numeric_col2_value = self.return_a_number(s)
-            else:
-                numeric_col2_value = float(to_match_1)
-        except ValueError:
-            return np.nan
-        return numeric_col2_value
+    @staticmethod
+    def return_a_number(col2_string: str) -> float:
+        return typed_value(col2_string).number
 
     @staticmethod
     def preprocess(word: str) -> list:
-        word = word.lower()
-        preprocessed_word = re.sub(r'[^\w\s]', '', word)
-        preprocessed_word = preprocessed_word.split(" ")
-        return preprocessed_word
+        return typed_value(word).tokens
 
     def compute_quantity_similarity(self, quantity_1: float, quantity_2: float) -> float:
         """
@@ -496,15 +882,7 @@ class TableContextMatches:
                     best_matched = context_value
                     break
                 else:
-                    current_sim = 0
-                    if context_values_type == 'q':
-                        col2_num = self.return_a_number(col2_string)
-                        if col2_num:
-                            current_sim = self.compute_quantity_similarity(float(col2_num), float(context_value))
-                    elif context_values_type == 'i':
-                        current_sim = similarity.hybrid.symmetric_monge_elkan_similarity(self.preprocess(context_value),
-                                                                                         self.preprocess(col2_string),
-                                                                                         lower_bound=self.string_similarity_threshold)
+                    current_sim = self.pair_similarity(context_value, col2_string, context_values_type)
                     if current_sim > max_sim:
                         max_sim = current_sim
                         best_matched = context_value
@@ -512,6 +890,33 @@ class TableContextMatches:
                             break
         return max_sim, best_matched
 
+    def pair_similarity(self, context_value: str, col2_string: str, context_values_type: str) -> float:
+        """
+        Returns the similarity of a context value of a type and a different cell value. Popular context values are
+        compared to the same cells for many candidates, so the similarities of a table are memoized, and the oldest
+        one is dropped when the memo is full.
+        """
+        key = (context_value, col2_string, context_values_type)
+        current_sim = self.similarity_memo.get(key, None)
+        if current_sim is not None:
+            self.similarity_memo_hits += 1
+            return current_sim
+        self.similarity_memo_misses += 1
+
+        current_sim = 0
+        if context_values_type == 'q':
+            col2_num = typed_value(col2_string).number
+            if col2_num:
+                current_sim = self.compute_quantity_similarity(float(col2_num), float(context_value))
+        elif context_values_type == 'i':
+            current_sim = symmetric_monge_elkan_similarity(
+                typed_value(context_value).tokens, typed_value(col2_string).tokens,
+                lower_bound=self.string_similarity_threshold)
+        if len(self.similarity_memo) >= similarity_memo_size:
+            del self.similarity_memo[next(iter(self.similarity_memo))]
+        self.similarity_memo[key] = current_sim
+        return current_sim
+
     def add_match(self, row, col1, col1_item, col1_string, col2, col2_item, col2_string, type, property, score,
                   best_match):
         """
@@ -523,6 +928,10 @@ class TableContextMatches:
 
         ccm_key = f'{row}_{col1}'
         ccm_key_2 = f'{row}_{col2}'
+        # the cells of a shard are created as its triples are matched in a worker
+        for key, col in [(ccm_key, col1), (ccm_key_2, col2)]:
+            if key not in self.ccm_dict:
+                self.ccm_dict[key] = CellContextMatches(row, col, self.triples)
 
         self.ccm_dict[ccm_key].add_triple(
             row=row,
@@ -562,7 +971,13 @@ class TableContextMatches:
         return self.ccm_dict[f'{row}_{col}']
 
     def serialize(self, output_path):
-        """Construct a serialization to save to disk."""
+        """
+        Construct a serialization to save to disk, a csv file of the triples if output_path ends with .csv, otherwise
+        a binary .npz file of the triple store with its strings dictionary encoded.
+        """
+        if not output_path.endswith('.csv'):
+            self.triples.save(output_path)
+            return
 
         out = list()
         for key in self.ccm_dict:
@@ -571,42 +986,55 @@ class TableContextMatches:
 
         pd.DataFrame(out).to_csv(output_path, index=False)
 
-    def load_from_disk(self, path):
+    def load_from_disk(self, path, fields: List[str] = None):
         """
-        Populate the contents of a ContextMatch from a file on disk
+        Populate the contents of a ContextMatch from a file on disk written by serialize. Only the arrays of fields,
+        all of them if fields is None, are read from a binary file.
         """
-        concatenated_df = pd.read_csv(path)
+        if not path.endswith('.csv'):
+            self.add_triples(ContextTriples.load(path, fields=fields))
+            return
+
+        concatenated_df = pd.read_csv(path, dtype=str)
+        concatenated_df = concatenated_df.astype(object).where(concatenated_df.notnull(), None)
         records = concatenated_df.to_dict('records')
         for record in records:
             row = record['row']
             property = record['property']
-            if property.startswith('P'):
-                col = record['col1']
-            elif property.startswith('_'):  # inverse property
-                col = record['col2']
-            else:
+            if not property.startswith('P') and not property.startswith('_'):
                 raise Exception(f'invalid property: {property}')
 
+            # the triples of a cell, inverse properties included, are from its column
+            col = record['col1']
             ccm_key = f"{row}_{col}"
             if ccm_key not in self.ccm_dict:
-                self.ccm_dict[ccm_key] = CellContextMatches(row, col)
+                self.ccm_dict[ccm_key] = CellContextMatches(row, col, self.triples)
             self.ccm_dict[ccm_key].add_triple(row=row,
                                               col1=col,
                                               col1_item=record['col1_item'],
                                               col1_string=record['col1_string'],
                                               type=record['type'],
-                                              score=record['score'],
+                                              score=float(record['score']),
                                               property=property,
                                               col2=record['col2'],
                                               col2_string=record['col2_string'],
-                                              col2_item=record['col2_item']
+                                              col2_item=record['col2_item'],
+                                              best_match=record['best_match']
                                               )
 
     @staticmethod
-    def read_context_file(context_file: str) -> dict:
-        f = open(context_file)
-        context_dict = {}
-        for line in f:
-            context_dict.update(json.loads(line.strip()))
-
-        return context_dict
+    def read_context_file(context_file: str, qnodes: set = None) -> dict:
+        """
+        Reads the context of the QNodes in qnodes, or of all the QNodes if qnodes is None, from a json lines file,
+        optionally gzipped, or from a context store built with `tl build-context-store`. The lines of a json lines
+        file without the QNodes are skipped without being decoded.
+        """
+        if ContextStore.is_context_store(context_file):
+            store = ContextStore(context_file)
+            if qnodes is None:
+                qnodes = [key.decode('utf-8') for key in store.keys]
+            context_dict = store.materialize(qnodes)
+            store.close()
+            return context_dict
+
+        return ContextStore.load_json_context(context_file, qnodes=qnodes)
@@ -1,14 +1,38 @@
 import pandas as pd
 import re
-import rltk.similarity as similarity
 from tl.exceptions import RequiredInputParameterMissingException
 from statistics import mode
 import gzip
-from pyrallel import ParallelProcessor
+import multiprocessing
 from multiprocessing import cpu_count
 import itertools
 import collections
+import functools
 import os
+import numpy as np
+from tl.utility.context_store import ContextStore
+from tl.features.token_blocking import TokenBags, candidate_pairs
+from tl.features.typed_value import typed_value
+from tl.features.monge_elkan import symmetric_monge_elkan_similarity
+
+# The MatchContext whose rows are matched by the processes of its worker pool
+worker_match_context = None
+
+
+def map_rows(batch: tuple, match_context: 'MatchContext' = None) -> tuple:
+    """
+    Purpose: Matches a batch of rows, in a worker of the pool of MatchContext or in the main process.
+    Returns: The indices of the rows, their debug strings, properties, similarities and inverse context results, as
+    lists with one item per row.
+    """
+    only_inverse, label_bags, important_properties_per_observation, rows = batch
+    match_context = match_context or worker_match_context
+    match_context.only_inverse = only_inverse
+    mapped = [match_context.mapper(idx, q_node, q_node_label, val, label_bags, important_properties_per_observation)
+              for idx, q_node, q_node_label, val in rows]
+    if not mapped:
+        return [], [], [], [], []
+    return tuple(list(column) for column in zip(*mapped))
 
 
 class MatchContext(object):
@@ -57,7 +81,9 @@ class MatchContext(object):
                 self.context_similarity_column = "context_similarity"
                 self.context_debug_column = "context_property_similarity_q_node"
         self.output_column_name = output_column_name
-        self.context = self.read_context_file(context_path=context_path, custom_context_path=custom_context_path)
+        # only the context of the candidates is ever looked up
+        self.context = self.read_context_file(context_path=context_path, custom_context_path=custom_context_path,
+                                              qnodes=set(self.final_data['kg_id'].dropna()))
         self.similarity_string_threshold = similarity_string_threshold
         self.similarity_quantity_threshold = similarity_quantity_threshold
         self.string_separator = string_separator.replace('"', '')
@@ -69,30 +95,45 @@ class MatchContext(object):
         # The following is a dictionary that stores the q_nodes that match with multiple properties
         # with equal similarity.
         self.equal_matched_properties = {}
+        # The parsed context of every q_node looked up so far
+        self.q_node_contexts = {}
+        self.worker_pool = None
         if not use_cpus:
             self.use_cpus = cpu_count()
         else:
             self.use_cpus = min(cpu_count(), use_cpus)
 
-    def read_context_file(self, context_path=None, custom_context_path=None) -> dict:
+    @staticmethod
+    def read_context_file(context_path=None, custom_context_path=None, qnodes: set = None) -> dict:
+        """
+        Reads the context of the QNodes in qnodes, or of all the QNodes if qnodes is None. The context and custom
+        context paths are either tsv files or context stores built with `tl build-context-store`, from which only
+        the context of qnodes is read.
+        """
         context_dict = {}
         custom_context_dict = {}
         if context_path:
-            f = open(context_path)
-            node1_column = "qnode"
-            node2_column = "context"
-            context_dict = self._read_context_file_line(f, node1_column, node2_column)
-            f.close()
+            if ContextStore.is_context_store(context_path):
+                context_dict = MatchContext._read_context_store(context_path, qnodes)
+            else:
+                f = open(context_path)
+                node1_column = "qnode"
+                node2_column = "context"
+                context_dict = MatchContext._read_context_file_line(f, node1_column, node2_column, qnodes)
+                f.close()
         if custom_context_path:
-            extension = os.path.splitext(custom_context_path)[1]
-            if extension == '.gz':
-                f = gzip.open(custom_context_path, 'rt')
+            if ContextStore.is_context_store(custom_context_path):
+                custom_context_dict = MatchContext._read_context_store(custom_context_path, qnodes)
             else:
-                f = open(custom_context_path)
-            node1_column = "node1"
-            node2_column = "node2"
-            custom_context_dict = self._read_context_file_line(f, node1_column, node2_column)
-            f.close()
+                extension = os.path.splitext(custom_context_path)[1]
+                if extension == '.gz':
+                    f = gzip.open(custom_context_path, 'rt')
+                else:
+                    f = open(custom_context_path)
+                node1_column = "node1"
+                node2_column = "node2"
+                custom_context_dict = MatchContext._read_context_file_line(f, node1_column, node2_column, qnodes)
+                f.close()
 
         merged_context_dict = collections.defaultdict(str)
         for key, val in itertools.chain(context_dict.items(), custom_context_dict.items()):
@@ -100,7 +141,16 @@ class MatchContext(object):
         return merged_context_dict
 
     @staticmethod
-    def _read_context_file_line(f, node1_column: str, node2_column: str) -> dict:
+    def _read_context_store(path: str, qnodes: set = None) -> dict:
+        store = ContextStore(path)
+        if qnodes is None:
+            qnodes = [key.decode('utf-8') for key in store.keys]
+        context_dict = store.materialize(qnodes)
+        store.close()
+        return context_dict
+
+    @staticmethod
+    def _read_context_file_line(f, node1_column: str, node2_column: str, qnodes: set = None) -> dict:
         context_dict = {}
         feature_idx = -1
         node_idx = -1
@@ -109,7 +159,7 @@ class MatchContext(object):
             if node1_column in row and node2_column in row:  # first line
                 feature_idx = row.index(node2_column)
                 node_idx = row.index(node1_column)
-            else:
+            elif qnodes is None or row[node_idx] in qnodes:
                 context_dict[row[node_idx]] = row[feature_idx]
 
         return context_dict
@@ -146,26 +196,24 @@ class MatchContext(object):
             if old_property != new_property:
                 self.equal_matched_properties[q_node] = [old_property, new_property]
 
-    def match_context_with_type(self, context: str, q_node: str, all_property_set: set, context_data_type: str,
-                                property_check: str) -> (str, float):
+    def match_context_with_type(self, context: str, q_node: str, q_node_context: 'QNodeContext',
+                                context_data_type: str, property_check: str) -> (str, float):
         """
         Purpose: Matching the given context (of type numerical/quantity/string/date) to the property
         with highest similarity
         Args:
             context: Passed piece of context that needs to be matched.
             q_node: kg_id of the current row.
-            all_property_set: Contains the list of properties and their values for the given q_node.
+            q_node_context: The parsed properties and their values for the given q_node.
             context_data_type = "q", "i", "d" represents that the property value is of type quantity, item and date
             year respectively.
         Returns: The Property matched and the similarity by which the property matched to the passed context.
         :param property_check:
         :param q_node:
-        :param all_property_set:
+        :param q_node_context:
         :param context:
         :param context_data_type:
         """
-
-        property_set = {prop for prop in all_property_set if prop.lower().startswith(context_data_type.lower())}
         prop_val = ""
         max_sim = 0.0
         value_matched_to = ""
@@ -177,84 +225,95 @@ class MatchContext(object):
                 check_for = float(context.replace('"', ''))
             except ValueError:
                 check_for = ""
+            # Only the quantities close enough to reach the threshold are scored, in the order of the context
+            for position in q_node_context.quantities_within(check_for, self.similarity_quantity_threshold):
+                prop = q_node_context.quantity_properties[position]
+                if property_check is None or property_check == prop:
+                    value = self.quantity_score(q_node_context.quantities[position], check_for)
+                    if value >= self.similarity_quantity_threshold and value > max_sim:
+                        prop_val = prop
+                        max_sim = value
+                        value_matched_to = q_node_context.quantity_strings[position]
+                        self.equal_matched_properties.pop(q_node, None)
+                    elif value >= self.similarity_quantity_threshold and value == max_sim:
+                        self.multiple_properties_match(q_node, prop_val, prop)
+
         elif context_data_type == 'd':
             check_for = context.split(".")[0]
             check_for = self.remove_punctuation(check_for)
-        else:
-            check_for = self.preprocess(context)
+            # The last property with the same value wins
+            for prop in q_node_context.date_index.get(check_for, []):
+                if property_check is None or property_check == prop:
+                    prop_val = prop
+                    max_sim = 1.0
+                    value_matched_to = check_for
+                    self.equal_matched_properties.pop(q_node, None)
 
-        for prop in property_set:
-            prop = prop.split(":")
-            p_value = prop[0]
-            if (property_check is not None and property_check == prop[1]) or property_check is None:
-                if context_data_type == 'q':
-                    check_with_temp = p_value[1:]
-                    check_with_temp = check_with_temp.replace('"', '')
-                    # The following line handles cases q12wr or equivalent.
-                    try:
-                        check_with = float(check_with_temp)
-                    except ValueError:
-                        continue
-                    if isinstance(check_with, float) or isinstance(check_with, int):
-                        value = self.quantity_score(check_with, check_for)
-                        if value >= self.similarity_quantity_threshold and value > max_sim:
-                            prop_val = prop[1]
-                            max_sim = value
-                            value_matched_to = check_with_temp
-                            self.equal_matched_properties.pop(q_node, None)
-                        elif value >= self.similarity_quantity_threshold and value == max_sim:
-                            self.multiple_properties_match(q_node, prop_val, prop[1])
-
-                else:
-                    check_with = self.remove_punctuation(p_value[1:])
-                    if context_data_type == 'd':
-                        if check_for == check_with:
-                            prop_val = prop[1]
-                            max_sim = 1.0
-                            value_matched_to = check_with
-                            self.equal_matched_properties.pop(q_node, None)
-                        elif check_for == check_with:
-                            self.multiple_properties_match(q_node, prop_val, prop[1])
-                    elif context_data_type == "i":
-                        sim = similarity.hybrid.symmetric_monge_elkan_similarity(self.preprocess(check_with), check_for)
-                        if sim >= self.similarity_string_threshold and sim > max_sim:
-                            if len(prop) > 1:  # Resolves error if the context does not have a property
-                                prop_val = prop[1]
-                                if (not prop[1].startswith("P")) and (prop[-2].startswith("P")):
-                                    prop_val = prop[-2]
-                                max_sim = sim
-                                value_matched_to = check_with
-                                if len(prop) > 2:
-                                    q_node_matched_to = prop[2]
-                                self.equal_matched_properties.pop(q_node, None)
-                        elif sim >= self.similarity_string_threshold and sim == max_sim and len(prop) > 1:
-                            self.multiple_properties_match(q_node, prop_val, prop[1])
+        else:
+            check_for_bags = self.context_token_bags(context)
+            check_for = check_for_bags.bags[0]
+            # Only the items whose similarity can reach the threshold are compared, in the order of the context
+            for position, _ in candidate_pairs(q_node_context.item_bags, check_for_bags,
+                                               self.similarity_string_threshold):
+                prop = q_node_context.item_properties[position]
+                if property_check is None or property_check == prop:
+                    check_with = q_node_context.item_values[position]
+                    matched_prop = q_node_context.item_matched_properties[position]
+                    matched_q_node = q_node_context.item_q_nodes[position]
+                    sim = symmetric_monge_elkan_similarity(q_node_context.item_tokens[position], check_for)
+                    if sim >= self.similarity_string_threshold and sim > max_sim:
+                        prop_val = matched_prop
+                        max_sim = sim
+                        value_matched_to = check_with
+                        if matched_q_node is not None:
+                            q_node_matched_to = matched_q_node
+                        self.equal_matched_properties.pop(q_node, None)
+                    elif sim >= self.similarity_string_threshold and sim == max_sim:
+                        self.multiple_properties_match(q_node, prop_val, prop)
 
         max_sim = round(max_sim, 4)
         return prop_val, max_sim, value_matched_to, q_node_matched_to
 
-    def preprocess(self, word: str) -> list:
-        word = word.lower()
-        preprocessed_word = self.remove_punctuation(word)
-        preprocessed_word = preprocessed_word.split(" ")
-        return preprocessed_word
+    def get_q_node_context(self, q_node: str):
+        """
+        Returns the context of q_node parsed into a QNodeContext, or None if q_node has no context. The context of a
+        QNode is parsed once and cached for the run.
+        """
+        if q_node not in self.q_node_contexts:
+            context_value = self.context.get(q_node, None)
+            self.q_node_contexts[q_node] = QNodeContext(context_value, strip_quotes=not self.is_custom) \
+                if context_value else None
+        return self.q_node_contexts[q_node]
+
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def context_token_bags(context: str) -> TokenBags:
+        """
+        Returns the tokens of a piece of context, indexed for blocking. The same piece of context is matched against
+        every candidate of a cell, so it is tokenized once.
+        """
+        return TokenBags([MatchContext.preprocess(context)])
+
+    @staticmethod
+    def preprocess(word: str) -> list:
+        return typed_value(word).tokens
 
     @staticmethod
     def remove_punctuation(input_string: str) -> str:
         result = re.sub(r'[^\w\s]', '', input_string)
         return result
 
-    def process_context_string(self, s_context: str, q_node: str, all_property_set: set, property_check: str) -> (
+    def process_context_string(self, s_context: str, q_node: str, q_node_context: 'QNodeContext', property_check: str) -> (
             str, float):
         """
         Purpose: Before matching with the properties, necessary processing to handle cases where the comma-separated
         values match to the same properties.
         Args:
             s_context: Passed piece of context that needs to be matched.
-            all_property_set: Contains the list of properties and their values for the given q_node.
+            q_node_context: The parsed properties and their values for the given q_node.
         Returns: The Property matched and the similarity by which the property matched to the passed context.
         :param property_check:
-        :param all_property_set:
+        :param q_node_context:
         :param s_context:
         :param q_node:
         """
@@ -270,7 +329,7 @@ class MatchContext(object):
             sub_s_context_dict = dict.fromkeys(sub_context_list).keys()
             for sub_s_context in sub_s_context_dict:
                 p, s, temp_value_matched_to, temp_q_node_matched_to = self.match_context_with_type(
-                    sub_s_context, q_node, all_property_set, context_data_type="i", property_check=property_check)
+                    sub_s_context, q_node, q_node_context, context_data_type="i", property_check=property_check)
                 if p != "":
                     temp.append(p)
                     sim_list.append(s)
@@ -313,84 +372,68 @@ class MatchContext(object):
 
         else:
             p_val, sim, value_matched_to, q_node_matched_to = self.match_context_with_type(s_context,
-                                                                                           q_node, all_property_set,
+                                                                                           q_node, q_node_context,
                                                                                            context_data_type="i",
                                                                                            property_check=property_check)
         max_sim = round(sim, 4)
         return p_val, max_sim, value_matched_to, q_node_matched_to
 
-    def inverse_property_calculation_and_score_calculation(self, column_val):
-        columns = ["column", "row", "property", "number_of_occurrences", 'min_sim']
-        properties_set = pd.DataFrame(columns=columns)
-        self.properties_with_score_metric = pd.DataFrame(columns=['column', 'property', 'value', 'min_sim'])
-        # counter is the index for the properties_set
-        counter = 0
-        for value_of_row, value_of_column, list_of_properties, list_of_sim in zip(self.data['row'],
-                                                                                  self.data['column'],
-                                                                                  self.data[
-                                                                                      'reverse_context_property'],
-                                                                                  self.data[
-                                                                                      'reverse_context_similarity']):
-            dict_of_properties = {(list_of_properties[i], i): i for i in range(len(list_of_properties))}
-            for (d_property, j) in dict_of_properties:
+    def count_property_values(self, property_column: str, similarity_column: str, by_position: bool = True) -> list:
+        """
+        Purpose: Calculates the value of every property that the rows matched to, from the number of times it
+        occurs in each row.
+        Args:
+            property_column: The column with the list of properties matched by each row.
+            similarity_column: The column with the list of similarities of the matched properties.
+            by_position: Whether the same property at different positions counts as different properties.
+        Returns: A list of [property, position, value, min_sim], in the order the properties and positions appear
+        in the data. The position is None if by_position is False.
+        """
+        # Part 1 - a: Calculating the number of occurrences in each cell.
+        # (property, row, position) -> [number_of_occurrences, min_sim]
+        occurrences = {}
+        for value_of_row, list_of_properties, list_of_sim in zip(self.data['row'], self.data[property_column],
+                                                                 self.data[similarity_column]):
+            for j, d_property in enumerate(list_of_properties):
                 if d_property != "":
-                    if d_property not in properties_set.property.values:
-                        # Add a new row
-                        properties_set.loc[counter] = [value_of_column, value_of_row, d_property, "1",
-                                                       list_of_sim[j]]
-                        counter = counter + 1
+                    key = (d_property, value_of_row, str(j + 1) if by_position else None)
+                    if key in occurrences:
+                        # Increment the count if same position
+                        occurrence = occurrences[key]
+                        occurrence[0] += 1
+                        occurrence[1] = str(max(float(occurrence[1]), float(list_of_sim[j])))
                     else:
-                        # Increment the count if same position, else add another row with the new position
-                        ind = properties_set[(properties_set['property'] == d_property) & (
-                                properties_set['row'] == value_of_row)].index.values
-                        if len(ind) != 0:
-                            old_count = properties_set['number_of_occurrences'].values[ind]
-                            new_count = float(old_count[0]) + 1
-                            old_sim = properties_set['min_sim'].values[ind]
-                            new_sim = str(max(float(old_sim), float(list_of_sim[j])))
-                            properties_set.iloc[ind, properties_set.columns.get_loc('number_of_occurrences')] = str(
-                                new_count)
-                            properties_set.iloc[ind, properties_set.columns.get_loc('min_sim')] = new_sim
-                        else:
-                            properties_set.loc[counter] = [value_of_column, value_of_row, d_property, "1",
-                                                           list_of_sim[j]]
-                            counter = counter + 1
-                            # Part 1 - b - Calculating each individual property's value (also considers position)
-        property_value_list = []
-        for occurrences in zip(properties_set['number_of_occurrences']):
-            # Record the occurrences of a particular property.
-            if float(occurrences[0]) > 0:
-                value = round(1 / float(occurrences[0]), 4)
-            else:
-                value = 0
-            property_value_list.append(value)
-        properties_set['prop_val'] = property_value_list
-
-        properties_l_df = properties_set['property']
-        properties_list = properties_l_df.values.tolist()
-        c_prop_set = dict.fromkeys(properties_list).keys()
-        row_list = properties_set['row']
-        row_l = row_list.values.tolist()
-        c_row_set = dict.fromkeys(row_l).keys()
-        counter = 0
-        for prop in c_prop_set:
-            # Update : Added the minimum similarity values for each property
-            ind = properties_set[
-                (properties_set['property'] == prop)].index.values
-            if len(ind) != 0:
-                min_values_list = []
-                property_cal = 0
-                for i in ind:
-                    prop_val = properties_set['prop_val'].values[i]
-                    property_cal = round((property_cal + float(prop_val)), 4)
-                    min_values_list.append(properties_set['min_sim'].values[i])
-                min_sim_value = min(min_values_list)
-                f_prop_cal = round(property_cal / len(c_row_set), 4)
-                self.properties_with_score_metric.loc[counter] = [str(column_val) + "_inv", prop, f_prop_cal,
-                                                                  min_sim_value]
-                counter = counter + 1
+                        occurrences[key] = [1, list_of_sim[j]]
+
+        # Part 1 - b - Calculating each individual property's value (also considers position)
+        property_order = {}
+        position_order = {}
+        rows = set()
+        # (property, position) -> [value, similarities]
+        property_values = {}
+        for (d_property, value_of_row, position), (number_of_occurrences, min_sim) in occurrences.items():
+            property_order.setdefault(d_property, len(property_order))
+            position_order.setdefault(position, len(position_order))
+            rows.add(value_of_row)
+            property_value = property_values.setdefault((d_property, position), [0, []])
+            property_value[0] = round(property_value[0] + round(1 / number_of_occurrences, 4), 4)
+            property_value[1].append(min_sim)
+
+        # Update : Added the minimum similarity values for each property
+        return [[d_property, position, round(property_cal / len(rows), 4), min(min_values_list)]
+                for (d_property, position), (property_cal, min_values_list) in
+                sorted(property_values.items(), key=lambda item: (property_order[item[0][0]],
+                                                                  position_order[item[0][1]]))]
+
+    def inverse_property_calculation_and_score_calculation(self, column_val):
+        property_values = self.count_property_values('reverse_context_property', 'reverse_context_similarity',
+                                                     by_position=False)
+        self.properties_with_score_metric = pd.DataFrame(
+            [[str(column_val) + "_inv", d_property, value, min_sim] for d_property, _, value, min_sim in
+             property_values], columns=['column', 'property', 'value', 'min_sim'])
         self.properties_with_score_metric = self.properties_with_score_metric.sort_values(['value'],
                                                                                           ascending=False)
+        property_value_dict = {d_property: value for d_property, _, value, _ in property_values}
         final_scores_list = []
         final_value_debug_str_list = []
         for properties_list, sim_list, value_debug_str_list, current_score, current_actual_score in zip(
@@ -400,18 +443,12 @@ class MatchContext(object):
                     'reverse_context_property_similarity_q_node'],
                 self.data[self.output_column_name], self.data['actual_' + self.output_column_name]):
             sum_prop = 0
-            property_values_list = []
             for i in range(len(properties_list)):
                 curr_property = properties_list[i]
                 if curr_property != "":
                     sim_value = sim_list[i].split("$$")[0]
-
-                    ind_df = self.properties_with_score_metric[
-                        (self.properties_with_score_metric['property'] == curr_property)]
-                    value = ind_df['value'].tolist()
-                    prop_value = value[0]
+                    prop_value = property_value_dict[curr_property]
                     sum_prop = round(sum_prop + (float(prop_value) * float(sim_value)), 4)
-                    property_values_list.append(prop_value)
                     value_debug_str_list[i] = value_debug_str_list[i].replace(curr_property,
                                                                               curr_property + "(" + str(
                                                                                   prop_value) + ")")
@@ -428,106 +465,30 @@ class MatchContext(object):
         """
         # Starting the score calculations
         # Part 1: Calculating Property values for each of the property that appear in the data file
-        # Part 1 - a: Calculating the number of occurrences in each cell.
-        columns = ["column", "row", "property", "position", "number_of_occurrences", 'min_sim']
-        properties_set = pd.DataFrame(columns=columns)
-        self.properties_with_score_metric = pd.DataFrame(columns=['column', 'property', 'position', 'value', 'min_sim'])
-        # counter is the index for the properties_set
-        counter = 0
-        for value_of_row, value_of_column, list_of_properties, list_of_sim in zip(self.data['row'],
-                                                                                  self.data['column'],
-                                                                                  self.data[
-                                                                                      self.context_property_column],
-                                                                                  self.data[
-                                                                                      self.context_similarity_column]):
-
-            dict_of_properties = {(list_of_properties[i], i): i for i in range(len(list_of_properties))}
-            for (d_property, j) in dict_of_properties:
-                position = j + 1
-                if d_property != "":
-                    if d_property not in properties_set.property.values:
-                        # Add a new row
-                        properties_set.loc[counter] = [value_of_column, value_of_row, d_property,
-                                                       str(position), "1", list_of_sim[j]]
-                        counter = counter + 1
-                    else:
-                        # Increment the count if same position, else add another row with the new position
-                        ind = properties_set[(properties_set['property'] == d_property) & (
-                                properties_set['row'] == value_of_row) & (
-                                                     properties_set['position'] == str(position))].index.values
-                        if len(ind) != 0:
-                            old_count = properties_set['number_of_occurrences'].values[ind]
-                            new_count = float(old_count[0]) + 1
-                            old_sim = properties_set['min_sim'].values[ind]
-                            new_sim = str(max(float(old_sim), float(list_of_sim[j])))
-                            properties_set.iloc[ind, properties_set.columns.get_loc('number_of_occurrences')] = str(
-                                new_count)
-                            properties_set.iloc[ind, properties_set.columns.get_loc('min_sim')] = new_sim
-                        else:
-                            properties_set.loc[counter] = [value_of_column, value_of_row, d_property,
-                                                           str(position), "1", list_of_sim[j]]
-                            counter = counter + 1
-                            # Part 1 - b - Calculating each individual property's value (also considers position)
-        property_value_list = []
-        for occurrences in zip(properties_set['number_of_occurrences']):
-            # Record the occurrences of a particular property.
-            if float(occurrences[0]) > 0:
-                value = round(1 / float(occurrences[0]), 4)
-            else:
-                value = 0
-            property_value_list.append(value)
-        properties_set['prop_val'] = property_value_list
-
-        properties_l_df = properties_set['property']
-        properties_list = properties_l_df.values.tolist()
-        c_prop_set = dict.fromkeys(properties_list).keys()
-        positions_list = properties_set['position']
-        position_l = positions_list.values.tolist()
-        c_pos_set = dict.fromkeys(position_l).keys()
-        row_list = properties_set['row']
-        row_l = row_list.values.tolist()
-        c_row_set = dict.fromkeys(row_l).keys()
-        counter = 0
-        for prop in c_prop_set:
-            for pos in c_pos_set:
-                # Update : Added the minimum similarity values for each property
-                ind = properties_set[
-                    (properties_set['property'] == prop) & (properties_set['position'] == pos)].index.values
-                if len(ind) != 0:
-                    min_values_list = []
-                    property_cal = 0
-                    for i in ind:
-                        prop_val = properties_set['prop_val'].values[i]
-                        property_cal = round((property_cal + float(prop_val)), 4)
-                        min_values_list.append(properties_set['min_sim'].values[i])
-                    min_sim_value = min(min_values_list)
-                    f_prop_cal = round(property_cal / len(c_row_set), 4)
-                    self.properties_with_score_metric.loc[counter] = [str(column_value), prop, pos, f_prop_cal,
-                                                                      min_sim_value]
-                    counter = counter + 1
+        property_values = self.count_property_values(self.context_property_column, self.context_similarity_column)
+        self.properties_with_score_metric = pd.DataFrame(
+            [[str(column_value), d_property, position, value, min_sim] for d_property, position, value, min_sim in
+             property_values], columns=['column', 'property', 'position', 'value', 'min_sim'])
         self.properties_with_score_metric = self.properties_with_score_metric.sort_values(['value'], ascending=False)
 
     def calculate_score(self):
         # Sum up the individual property values for a row (update:multiply with the similarity)
+        property_value_dict = {(d_property, position): value for d_property, position, value in
+                               zip(self.properties_with_score_metric['property'],
+                                   self.properties_with_score_metric['position'],
+                                   self.properties_with_score_metric['value'])}
         final_scores_list = []
         final_value_debug_str_list = []
         for properties_list, sim_list, value_debug_str_list in zip(self.data[self.context_property_column],
                                                                    self.data[self.context_similarity_column],
                                                                    self.data[self.context_debug_column]):
             sum_prop = 0
-            property_values_list = []
             for i in range(len(properties_list)):
                 curr_property = properties_list[i]
                 if curr_property != "":
                     sim_value = sim_list[i].split("$$")[0]
-
-                    ind_df = self.properties_with_score_metric[
-                        (self.properties_with_score_metric['property'] == curr_property) & (
-                                self.properties_with_score_metric['position'] == str(i + 1))]
-                    value = ind_df['value'].tolist()
-                    prop_value = value[0]
+                    prop_value = property_value_dict[(curr_property, str(i + 1))]
                     sum_prop = round(sum_prop + (float(prop_value) * float(sim_value)), 4)
-                    property_values_list.append(prop_value)
                     value_debug_str_list[i] = value_debug_str_list[i].replace(curr_property,
                                                                               curr_property + "(" + str(
                                                                                   prop_value) + ")")
@@ -547,6 +508,8 @@ class MatchContext(object):
         """
         # Identify the major important columns in all the columns present.
         all_columns_properties_values_df = pd.DataFrame()
+        properties_values_dfs = []
+        result_dfs = []
         corresponding_num_labels = {}
         grouped_object = self.final_data_subset.groupby(['column'])
         for cell, group in grouped_object:
@@ -574,9 +537,8 @@ class MatchContext(object):
                 self.process_data_context(cell, labels_to_process_for_infer_context, current_saved_properties_df)
             else:
                 self.process_data_context(cell, [], current_saved_properties_df)
-            all_columns_properties_values_df = pd.concat([all_columns_properties_values_df,
-                                                          self.properties_with_score_metric])
-            self.result_data = pd.concat([self.result_data, self.data])
+            properties_values_dfs.append(self.properties_with_score_metric)
+            result_dfs.append(self.data)
         if self.to_result_data is not None:
             only_inverse_context_data = self.to_result_data.groupby(['column'])
             for cell, group in only_inverse_context_data:
@@ -587,7 +549,10 @@ class MatchContext(object):
                                                            if k not in current_labels if k != ""}
                     self.process_data_context(cell, labels_to_process_for_infer_context, None, only_inverse = True)
 
-                self.result_data = pd.concat([self.result_data, self.data])
+                result_dfs.append(self.data)
+        self.close_worker_pool()
+        # The results of all the columns are concatenated once
+        self.result_data = pd.concat([self.result_data] + result_dfs)
 
         # self.result_data = pd.concat([self.result_data, self.to_result_data])
         self.result_data = self.result_data.sort_values(by='index_1')
@@ -602,83 +567,70 @@ class MatchContext(object):
         self.result_data['actual_' + self.output_column_name] = self.result_data[
             'actual_' + self.output_column_name].fillna(0.0)
         self.result_data = self.result_data.astype(object)
-        self.result_data['reverse_context_property'] = ""
-        self.result_data['reverse_context_similarity'] = ""
-        self.result_data['reverse_context_property_similarity_q_node'] = ""
+        # The inverse context results of every q_node, merged into the rows of that q_node at once
+        inverse_context_rows = []
         for q_node_1 in self.inverse_context_dict:
             q_node_val = self.inverse_context_dict[q_node_1]
             property_list = []
             similarity_list = []
-            q_node_matched_from_list = []
-            q_node_value_list = []
             debug_value = []
             for property_l in q_node_val:
                 [q_node_value, sim, q_node_matched_from] = q_node_val[property_l]
-                q_node_matched_from_list.append(q_node_matched_from)
-                q_node_value_list.append(q_node_value)
                 property_list.append(property_l)
                 similarity_list.append(sim)
                 debug_value.append("/".join([property_l, q_node_matched_from, str(sim), q_node_value]))
-            try:
-
-                index_values = self.result_data[self.result_data['kg_id'] == q_node_1].index.values
-                for index_val in index_values:
-                    self.result_data.iloc[
-                        index_val, self.result_data.columns.get_loc('reverse_context_similarity')] = similarity_list
-                    self.result_data.iloc[
-                        index_val, self.result_data.columns.get_loc('reverse_context_property')] = property_list
-                    self.result_data.iloc[index_val, self.result_data.columns.get_loc(
-                        'reverse_context_property_similarity_q_node')] = debug_value
-            except IndexError:
-                continue
+            inverse_context_rows.append([q_node_1, property_list, similarity_list, debug_value])
+        inverse_context_columns = ['reverse_context_property', 'reverse_context_similarity',
+                                   'reverse_context_property_similarity_q_node']
+        inverse_context_df = pd.DataFrame(inverse_context_rows, columns=['kg_id'] + inverse_context_columns,
+                                          dtype=object)
+        self.result_data = self.result_data.drop(columns=inverse_context_columns, errors='ignore')
+        self.result_data = pd.merge(self.result_data, inverse_context_df, on='kg_id', how='left')
+        self.result_data[inverse_context_columns] = self.result_data[inverse_context_columns].fillna("")
         grouped_object = self.result_data.groupby(['column'])
-        result_data_2 = pd.DataFrame()
+        result_data_dfs = []
         for cell, group in grouped_object:
             self.data = group.reset_index(drop=True)
             if cell not in major_column:
                 self.inverse_property_calculation_and_score_calculation(cell)
-                result_data_2 = pd.concat([result_data_2, self.data])
-            else:
-                result_data_2 = pd.concat([result_data_2, self.data])
-            all_columns_properties_values_df = pd.concat(
-                [all_columns_properties_values_df, self.properties_with_score_metric])
+            result_data_dfs.append(self.data)
+            properties_values_dfs.append(self.properties_with_score_metric)
+        result_data_2 = pd.concat(result_data_dfs) if result_data_dfs else pd.DataFrame()
+        all_columns_properties_values_df = pd.concat([all_columns_properties_values_df] + properties_values_dfs)
         result_data_2 = result_data_2.drop(columns=['column_row'])
         if self.save_property_scores:
             all_columns_properties_values_df.to_csv(self.save_property_scores, index=False)
         return result_data_2
 
-    def matches_to_check_for(self, v, q_node, all_property_set, property_check):
-        # For quantity matching, we will give multiple tries to handle cases where numbers are separated with
-        new_v = v.replace('"', '')
-        to_match_1 = new_v.replace(",", "")
-        to_match_2 = to_match_1.replace(".", "0")
-
-        num_v = None
+    @staticmethod
+    def parse_number(v: str) -> (str, bool, str):
+        """
+        Purpose: Reads a piece of context as a number. The same piece of context is matched against every candidate
+        of a cell, so it is parsed once by the shared typed values.
+        Returns: The context without quotes and thousands separators, whether it is a number and the last number
+        in it if it has several words.
+        """
+        return typed_value(v).numeric_parts
 
-        if " " in to_match_2:
-            split_v = to_match_1.split(" ")
-            for s in split_v:
-                if not s == ".":
-                    new_s = s.replace(".", "0")
-                    if new_s.isnumeric():
-                        num_v = s
+    def matches_to_check_for(self, v, q_node, q_node_context, property_check):
+        to_match_1, is_numeric, num_v = self.parse_number(v)
 
-        if to_match_1.isnumeric() or to_match_2.isnumeric() or num_v is not None:
+        if is_numeric or num_v is not None:
             property_v, sim, value_matched_to, q_node_matched_to = self.match_context_with_type(
-                to_match_1, q_node, all_property_set, context_data_type="d", property_check=property_check)
+                to_match_1, q_node, q_node_context, context_data_type="d", property_check=property_check)
             if (property_v == "") and (to_match_1.count(".") <= 1):
                 # Number of decimals shouldn't be greater than one.
-                if to_match_1.isnumeric() or to_match_2.isnumeric():
+                if is_numeric:
                     property_v, sim, value_matched_to, q_node_matched_to = self.match_context_with_type(
                         to_match_1, q_node,
-                        all_property_set,
+                        q_node_context,
                         context_data_type="q", property_check=property_check)
                 elif num_v is not None:
                     property_v, sim, value_matched_to, q_node_matched_to = self.match_context_with_type(
-                        num_v, q_node, all_property_set, context_data_type="q", property_check=property_check)
+                        num_v, q_node, q_node_context, context_data_type="q", property_check=property_check)
                     property_v_2, sim_2, value_matched_to_2, q_node_matched_to_2 = self.process_context_string(
                         v, q_node,
-                        all_property_set, property_check=property_check)
+                        q_node_context, property_check=property_check)
                     if sim_2 > sim:
                         property_v = property_v_2
                         sim = sim_2
@@ -686,49 +638,39 @@ class MatchContext(object):
                         q_node_matched_to = q_node_matched_to_2
         else:
             property_v, sim, value_matched_to, q_node_matched_to = self.process_context_string(
-                v, q_node, all_property_set, property_check
+                v, q_node, q_node_context, property_check
             )
         return property_v, sim, value_matched_to, q_node_matched_to
 
-    def match_for_inverse_context(self, q_node, all_property_set, labels_for_inverse_context, q_label):
-        context_data_type = 'i'
-        property_set = {prop for prop in all_property_set if prop.lower().startswith(context_data_type.lower())}
+    def match_for_inverse_context(self, q_node, q_node_context, label_bags, q_label):
         prop = ""
         matched_to = ""
         max_sim = 0
         q_node_matched = ""
         from_q_node_matched = ""
-        for property_l in property_set:
-            split_list = property_l.split(":")
-            label_val = split_list[0]
-            label_val_clean = label_val[1:]
-            label_val_clean_list = label_val_clean.split(" ")
-            property_value = split_list[1]
-            q_node_val = split_list[2]
-            for m in labels_for_inverse_context:
-                label_value_row = labels_for_inverse_context[m]
-                label_value_list = label_value_row.split(" ")
-                sim = similarity.hybrid.symmetric_monge_elkan_similarity(label_value_list, label_val_clean_list)
-                if sim >= self.similarity_string_threshold:
-                    if sim > max_sim:
-                        prop = property_value
-                        max_sim = sim
-                        matched_to = q_label
-                        q_node_matched = q_node_val
-                        from_q_node_matched = q_node
+        # Only the pairs of an item and a label whose similarity can reach the threshold are compared
+        for i, j in candidate_pairs(q_node_context.inverse_bags, label_bags, self.similarity_string_threshold):
+            sim = symmetric_monge_elkan_similarity(label_bags.bags[j], q_node_context.inverse_tokens[i])
+            if sim >= self.similarity_string_threshold:
+                if sim > max_sim:
+                    prop = q_node_context.inverse_properties[i]
+                    max_sim = sim
+                    matched_to = q_label
+                    q_node_matched = q_node_context.inverse_q_nodes[i]
+                    from_q_node_matched = q_node
         max_sim = round(max_sim, 4)
         result_list = [q_node_matched, prop, matched_to, str(max_sim), from_q_node_matched]
 
         return result_list
 
-    def mapper(self, idx, q_node, q_node_label, val, labels_for_inverse_context, important_properties_per_observation):
+    def mapper(self, idx, q_node, q_node_label, val, label_bags, important_properties_per_observation):
         """
         Purpose: Mapper to the parallel processor to process each row parallely
         Returns: The index of row, property string and the context similarity
                  string
         :param important_properties_per_observation:
         :param q_node_label:
-        :param labels_for_inverse_context:
+        :param label_bags: The tokens of the labels of the column, for the inverse context.
         :param idx:
         :param q_node:
         :param val:
@@ -737,15 +679,9 @@ class MatchContext(object):
         sim_list = []
         matched_to_list = []
         # if there is empty context in the data file
-        context_value = self.context.get(q_node, None)
-        if context_value:
-            all_property_list = re.split(r'(?<!\\)\|', context_value)
-            if not self.is_custom:
-                all_property_list[0] = all_property_list[0][1:]
-                all_property_list[-1] = all_property_list[-1][:-1]
-        else:
+        q_node_context = self.get_q_node_context(q_node)
+        if q_node_context is None:
             return idx, [], [], ["0.0"], []
-        all_property_set = set(all_property_list)
         if not self.only_inverse:
             try:
                 val_list = val.split("|")
@@ -763,7 +699,7 @@ class MatchContext(object):
                 if self.remove_punctuation(v) != "":
                     property_v, sim, value_matched_to, q_node_matched_to = self.matches_to_check_for(v,
                                                                                                      q_node,
-                                                                                                     all_property_set,
+                                                                                                     q_node_context,
                                                                                                      property_check)
                     prop_list.append(property_v)
                     sim_list.append(str(sim))
@@ -773,7 +709,7 @@ class MatchContext(object):
             matched_to_list = []
             prop_list = []
             sim_list = []
-        results = self.match_for_inverse_context(q_node, all_property_set, labels_for_inverse_context, q_node_label)
+        results = self.match_for_inverse_context(q_node, q_node_context, label_bags, q_node_label)
         return idx, matched_to_list, prop_list, sim_list, results
 
     def collector(self, idx, value_debug_str, prop_str, sim_str, results):
@@ -796,6 +732,32 @@ class MatchContext(object):
                     current_element = {results[1]: results[2:]}
                     self.inverse_context_dict[results[0]] = current_element
 
+    def collect(self, indices, value_debug_strs, prop_strs, sim_strs, results_list):
+        """
+        Purpose: collects the output of the mapper for a batch of rows, as lists with one item per row.
+        """
+        for idx, value_debug_str, prop_str, sim_str, results in zip(indices, value_debug_strs, prop_strs, sim_strs,
+                                                                    results_list):
+            self.collector(idx, value_debug_str, prop_str, sim_str, results)
+
+    def get_worker_pool(self):
+        """
+        Returns the pool of processes that match the rows, started the first time it is needed and then used for
+        all the columns. The workers are forked, so they share the context of the QNodes with this process instead
+        of getting a copy of it.
+        """
+        global worker_match_context
+        if self.worker_pool is None:
+            worker_match_context = self
+            self.worker_pool = multiprocessing.get_context('fork').Pool(self.use_cpus)
+        return self.worker_pool
+
+    def close_worker_pool(self):
+        if self.worker_pool is not None:
+            self.worker_pool.close()
+            self.worker_pool.join()
+            self.worker_pool = None
+
     def process_data_context(self, column_val, labels_to_process_for_inverse_context, current_saved_properties_df,
                              only_inverse = False):
         """
@@ -805,32 +767,25 @@ class MatchContext(object):
         """
         self.only_inverse = only_inverse
         self.final_property_similarity_list = []
-        cpus = self.use_cpus
+        cpus = min(self.use_cpus, max(1, self.data.shape[0]))
         if current_saved_properties_df is not None:
             important_properties_per_observation = dict(
                 zip(current_saved_properties_df['position'].values, current_saved_properties_df['property'].values))
         else:
             important_properties_per_observation = None
-        batch = self.data.shape[0] // cpus
+        label_bags = TokenBags([labels_to_process_for_inverse_context[m].split(" ")
+                                for m in labels_to_process_for_inverse_context])
+        rows = list(zip(self.data.index.values.tolist(), self.data["kg_id"], self.data['label_clean'],
+                        self.data["context"]))
         if cpus > 1:
-            pp = ParallelProcessor(cpus, mapper=lambda args: self.mapper(*args),
-                                   collector=self.collector, batch_size=batch)
-            pp.start()
-            range_len = len(self.data.index.values)
-            label_list = [labels_to_process_for_inverse_context] * range_len
-            important_properties_per_observation_list = [important_properties_per_observation] * range_len
-            pp.map(
-                zip(self.data.index.values.tolist(), self.data["kg_id"], self.data['label_clean'], self.data["context"],
-                    label_list, important_properties_per_observation_list))
-            pp.task_done()
-            pp.join()
+            # Every worker gets a few batches of rows, the rest of the input is shared with the fork
+            batch_size = max(1, -(-len(rows) // (cpus * 4)))
+            batches = [(only_inverse, label_bags, important_properties_per_observation, rows[i:i + batch_size])
+                       for i in range(0, len(rows), batch_size)]
+            for batch_results in self.get_worker_pool().imap(map_rows, batches):
+                self.collect(*batch_results)
         else:
-            for idx, q_node, q_node_label, val in zip(self.data.index.values.tolist(), self.data["kg_id"],
-                                                      self.data['label_clean'], self.data["context"]):
-                idx, value_debug_str, prop_str, sim_str, results = self.mapper(idx, q_node, q_node_label, val,
-                                                                               labels_to_process_for_inverse_context,
-                                                                               important_properties_per_observation)
-                self.collector(idx, value_debug_str, prop_str, sim_str, results)
+            self.collect(*map_rows((only_inverse, label_bags, important_properties_per_observation, rows), self))
 
         property_sim_df = pd.DataFrame(self.final_property_similarity_list,
                                        columns=["idx", self.context_property_column,
@@ -873,24 +828,11 @@ class MatchContext(object):
                         continue
                     elif p_property == "":
                         # Need to check if this property is present for the particular q_node
-                        context_value = self.context.get(q_node, None)
-                        # Create a list of this values. In some cases the kg_id may not be present in the context_file.
-                        if context_value:
-                            # Initial Structuring
-                            all_property_list = re.split(r'(?<!\\)\|', context_value)
-                            if not self.is_custom:
-                                all_property_list[0] = all_property_list[0][1:]
-                                all_property_list[-1] = all_property_list[-1][:-1]
-                            all_property_set = set(all_property_list)
-                            # Separate list of only properties.
-                            is_present = False
-                            for prop in all_property_set:
-                                prop = prop.split(":")
-                                if len(prop) > 1:
-                                    if prop[1] == imp_prop:
-                                        # Early Stop - The property is present but has not matched to the context
-                                        is_present = True
-                                        break
+                        q_node_context = self.get_q_node_context(q_node)
+                        # In some cases the kg_id may not be present in the context_file.
+                        if q_node_context is not None:
+                            # Early Stop - The property is present but has not matched to the context
+                            is_present = imp_prop in q_node_context.properties
                             # The property is not present at the location
                             if not is_present:
                                 new_sim_val = round(
@@ -935,3 +877,102 @@ class MatchContext(object):
                 self.data.at[df_ind, self.context_similarity_column] = similarity_list
                 self.data.at[df_ind, self.context_debug_column] = context_property_similarity_q_node_list
         self.calculate_score()
+
+
+class QNodeContext(object):
+    """
+    The context of a QNode, parsed once into the values of each type together with their properties so that
+    matching a cell does not split and clean the context string over and over again.
+
+    Every entry of the context is `<type><value>:<property>[:<qnode>]`, with the type "q", "d" or "i" for a
+    quantity, a date or an item. Repeated entries are kept once, in the order of the context string.
+    """
+
+    def __init__(self, context_value: str, strip_quotes: bool = True):
+        all_property_list = re.split(r'(?<!\\)\|', context_value)
+        if strip_quotes:
+            all_property_list[0] = all_property_list[0][1:]
+            all_property_list[-1] = all_property_list[-1][:-1]
+
+        self.properties = set()
+        self.quantities = []
+        self.quantity_strings = []
+        self.quantity_properties = []
+        self.dates = []
+        self.date_properties = []
+        # The properties of every date value, in the order of the context
+        self.date_index = {}
+        self.item_values = []
+        self.item_tokens = []
+        self.item_properties = []
+        self.item_matched_properties = []
+        self.item_q_nodes = []
+        self.inverse_tokens = []
+        self.inverse_properties = []
+        self.inverse_q_nodes = []
+
+        for entry in dict.fromkeys(all_property_list):
+            prop = entry.split(":")
+            if len(prop) < 2:
+                # Resolves error if the context does not have a property
+                continue
+            p_value = prop[0]
+            self.properties.add(prop[1])
+            context_data_type = p_value[:1].lower()
+            if context_data_type == 'q':
+                check_with = p_value[1:].replace('"', '')
+                # The following handles cases q12wr or equivalent.
+                try:
+                    self.quantities.append(float(check_with))
+                except ValueError:
+                    continue
+                self.quantity_strings.append(check_with)
+                self.quantity_properties.append(prop[1])
+            elif context_data_type == 'd':
+                date = MatchContext.remove_punctuation(p_value[1:])
+                self.dates.append(date)
+                self.date_properties.append(prop[1])
+                self.date_index.setdefault(date, []).append(prop[1])
+            elif context_data_type == 'i':
+                check_with = MatchContext.remove_punctuation(p_value[1:])
+                matched_property = prop[1]
+                if (not prop[1].startswith("P")) and (prop[-2].startswith("P")):
+                    matched_property = prop[-2]
+                self.item_values.append(check_with)
+                self.item_tokens.append(MatchContext.preprocess(check_with))
+                self.item_properties.append(prop[1])
+                self.item_matched_properties.append(matched_property)
+                self.item_q_nodes.append(prop[2] if len(prop) > 2 else None)
+                if len(prop) > 2:
+                    self.inverse_tokens.append(p_value[1:].split(" "))
+                    self.inverse_properties.append(prop[1])
+                    self.inverse_q_nodes.append(prop[2])
+
+        # The tokens of the items, indexed for blocking
+        self.item_bags = TokenBags(self.item_tokens)
+        self.inverse_bags = TokenBags(self.inverse_tokens)
+
+        # The quantities sorted by value, with their positions in the context
+        self.quantity_order = np.argsort(np.array(self.quantities, dtype=float), kind='stable')
+        self.sorted_quantities = np.array(self.quantities, dtype=float)[self.quantity_order]
+
+    def quantities_within(self, quantity, threshold: float) -> list:
+        """
+        Returns the positions, in the order of the context, of the quantities whose quantity_score with quantity
+        can reach threshold. The score of two quantities is the ratio of the smaller to the larger one if they have
+        the same sign and at most 0 otherwise, so they are found by binary search in the sorted quantities.
+        """
+        if not isinstance(quantity, float) or threshold <= 0:
+            return list(range(len(self.quantities)))
+        if threshold > 1:
+            return []
+        if quantity > 0:
+            low, high = quantity * threshold, quantity / threshold
+        else:
+            low, high = quantity / threshold, quantity * threshold
+        # widen the bounds so that rounding never leaves out a quantity at the threshold
+        low -= abs(low) * 1e-9
+        high += abs(high) * 1e-9
+        start = np.searchsorted(self.sorted_quantities, low, side='left')
+        end = np.searchsorted(self.sorted_quantities, high, side='right')
+        return np.sort(self.quantity_order[start:end]).tolist()
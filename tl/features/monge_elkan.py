@@ -0,0 +1,57 @@
+import functools
+
+import rltk.utils as utils
+from rltk.similarity.jaro import jaro_winkler_similarity
+
+# The number of token pairs whose similarity is kept by every process
+token_pair_cache_size = 1 << 20
+
+
+@functools.lru_cache(maxsize=token_pair_cache_size)
+def token_pair_similarity(token_1: str, token_2: str) -> float:
+    """
+    Returns the jaro winkler similarity of two tokens. The same tokens, e.g. "united", "states" or "city", are
+    compared again and again by every Monge-Elkan caller, so the similarities of the recent pairs are cached.
+    """
+    return jaro_winkler_similarity(token_1, token_2)
+
+
+def monge_elkan_similarity(bag1: list, bag2: list, lower_bound: float = None) -> float:
+    """
+    The `monge_elkan_similarity` of rltk, with jaro winkler between the tokens, reading the token similarities
+    from the cache of `token_pair_similarity`. It returns the same similarity as rltk, early exits included.
+    """
+    utils.check_for_none(bag1, bag2)
+    utils.check_for_type(list, bag1, bag2)
+
+    score_sum = 0
+    for idx, ele1 in enumerate(bag1):
+        max_score = utils.MIN_FLOAT
+        for ele2 in bag2:
+            max_score = max(max_score, token_pair_similarity(ele1, ele2))
+        score_sum += max_score
+
+        # if it satisfies early exit condition
+        if lower_bound:
+            rest_max = len(bag1) - 1 - idx  # assume the rest scores are all 1
+            if float(score_sum + rest_max) / float(len(bag1)) < lower_bound:
+                return 0.0
+
+    sim = float(score_sum) / float(len(bag1))
+    if lower_bound and sim < lower_bound:
+        return 0.0
+    return sim
+
+
+def symmetric_monge_elkan_similarity(bag1: list, bag2: list, lower_bound: float = None) -> float:
+    """
+    The `symmetric_monge_elkan_similarity` of rltk, (monge_elkan_similarity(b1, b2) +
+    monge_elkan_similarity(b2, b1)) / 2, with the cached token similarities.
+    """
+    s1 = monge_elkan_similarity(bag1, bag2, lower_bound=lower_bound)
+    if lower_bound and s1 == 0:
+        return 0.0
+    s2 = monge_elkan_similarity(bag2, bag1, lower_bound=lower_bound)
+    if lower_bound and s2 == 0:
+        return 0.0
+    return (s1 + s2) / 2
@@ -0,0 +1,72 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+
+class PropertyModel(object):
+    """
+    The relevant properties of the context of a dataset or a table, learned once by matching all the properties and
+    used by later runs of `context-match` to only match these properties.
+
+    A property model is a json file holding one model per key, the key of a table is either the name of its dataset
+    or the signature of the table. A model holds the relevant properties for every `<column>_<col2>` pair, the share
+    of the property score they covered and the number of comparisons and the time it took to match all the
+    properties, so that later runs can report what they saved. A model learned by a run which only matched all the
+    properties of a sample of rows holds the size of the sample instead, and no coverage, comparisons or time.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.models = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.models = json.load(f)
+
+    @staticmethod
+    def table_signature(input_df: pd.DataFrame, label_column: str) -> str:
+        """
+        Returns a signature of the cells of a table, the same table always gets the same signature whatever the
+        order of its rows and candidates.
+        """
+        cells = sorted({(str(row), str(col), str(label)) for row, col, label in
+                        zip(input_df['row'], input_df['column'], input_df[label_column])})
+        return hashlib.sha1(json.dumps(cells).encode('utf-8')).hexdigest()[:16]
+
+    def get(self, key: str) -> dict:
+        return self.models.get(key, None)
+
+    def relevant_properties(self, key: str) -> dict:
+        """
+        Returns the relevant properties of a model as a dict {`<column>_<col2>`: set of properties}, like
+        `TableContextMatches.read_relevant_properties`.
+        """
+        return {column_column_pair: set(properties)
+                for column_column_pair, properties in self.models[key]['properties'].items()}
+
+    def add(self, key: str, relevant_properties_df: pd.DataFrame, coverage: float, comparisons: int,
+            matching_time: float, sample_rows: int = None):
+        """
+        Adds a model learned from the relevant properties of a run which matched all the properties, as written by
+        `TableContextMatches.compute_property_scores`, and saves the property model. If the run only matched all the
+        properties of sample_rows rows, the figures of the run are not those of a full run and are not kept.
+        """
+        if sample_rows is not None:
+            coverage, comparisons, matching_time = None, None, None
+        properties = {}
+        for column, col2, property_ in zip(relevant_properties_df['column'], relevant_properties_df['col2'],
+                                           relevant_properties_df['property_']):
+            properties.setdefault(f"{column}_{col2}", []).append(property_)
+        self.models[key] = {
+            'properties': properties,
+            'coverage': coverage,
+            'comparisons': comparisons,
+            'time': matching_time,
+            'sample_rows': sample_rows
+        }
+        self.save()
+
+    def save(self):
+        with open(self.path, 'w') as f:
+            json.dump(self.models, f, indent=2)
@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
 from functools import partial
 import rltk.similarity as sim
+from tl.features import monge_elkan
 
 
 def word_tokenizer(s):
@@ -33,10 +34,15 @@ How to add new stringSimilarityModule classes:
 3. Basically, only the function `_similarity` is necessary to be implemented.
 4. if your similarity calculation required the full text for indexing or other help functions, 
    please include this in __init__ function. You can refer to "TfidfSimilarity" class as an example.  
+5. if an upper bound of the similarity is much cheaper to compute than the similarity, e.g. from the lengths of the
+   strings, implement `_upper_bound`, so that the pairs which cannot reach the threshold are not compared.
 """
 
 
 class StringSimilarityModule(ABC):
+    # whether the unit is built from the cells of the table, so that it cannot be rebuilt from its name
+    table_dependent = False
+
     def __init__(self, tl_args, **method_args):
         # tl_args is necessary if operation specification (like case sensitive) is needed
         # kwargs is necessary if tokenization (need all data in df) is needed
@@ -50,6 +56,9 @@ class StringSimilarityModule(ABC):
             if k.startswith('tokenizer_'):
                 tokenizer_kwargs[k[len('tokenizer_'):]] = v
         self._arg_str = ','.join(['{}={}'.format(k, v) for k, v in method_args.items()])
+        # the number of pairs given to `similarity` and the number of them pruned by `_upper_bound`
+        self.compared_pairs = 0
+        self.pruned_pairs = 0
 
         if hasattr(self, '_tokenizer'):
             self._tokenize = get_tokenizer(self._tokenizer, **tokenizer_kwargs)
@@ -67,6 +76,10 @@ class StringSimilarityModule(ABC):
         if hasattr(self, '_tokenize'):
             str1 = self._tokenize(str1)
             str2 = self._tokenize(str2)
+        self.compared_pairs += 1
+        if threshold > 0 and self._upper_bound(str1, str2) < threshold:
+            self.pruned_pairs += 1
+            return 0.0
         # the threshold here may only be effective if it is implemented by the underlying function
         similarity = self._similarity(str1, str2, threshold)
         # force the score to be 0 if it is less than the threshold
@@ -79,6 +92,11 @@ class StringSimilarityModule(ABC):
         # detail implementation of the method
         raise NotImplementedError
 
+    def _upper_bound(self, str1, str2) -> float:
+        # an upper bound of `_similarity`, never lower than the score it returns, the pair is not compared if the
+        # bound is lower than the threshold
+        return 1.0
+
 
 class LevenshteinSimilarity(StringSimilarityModule):
     # levenshtein
@@ -86,6 +104,13 @@ class LevenshteinSimilarity(StringSimilarityModule):
     def _similarity(self, str1: str, str2: str, threshold: float):
         return sim.levenshtein_similarity(str1, str2, lower_bound=threshold)
 
+    def _upper_bound(self, str1: str, str2: str):
+        # at least as many edits as the difference of the lengths are needed
+        max_len = max(len(str1), len(str2))
+        if max_len == 0:
+            return 1.0
+        return 1.0 - float(abs(len(str1) - len(str2))) / max_len
+
 
 class JaroWinklerSimilarity(StringSimilarityModule):
     # jaro_winkler
@@ -168,6 +193,13 @@ class HybridJaccardSimilarity(StringSimilarityModule):
     def _similarity(self, str1: list, str2: list, threshold: float):
         return sim.hybrid_jaccard_similarity(set(str1), set(str2), lower_bound=threshold)
 
+    def _upper_bound(self, str1: list, str2: list):
+        # at most every token of the smaller set is matched to a token of the larger set
+        size1, size2 = len(set(str1)), len(set(str2))
+        if size1 == 0 or size2 == 0:
+            return 1.0
+        return float(min(size1, size2)) / max(size1, size2)
+
 
 class MongeElkanSimilarity(StringSimilarityModule):
     # monge_elkan:tokenizer=word
@@ -176,7 +208,7 @@ class MongeElkanSimilarity(StringSimilarityModule):
         super().__init__(tl_args, **kwargs)
 
     def _similarity(self, str1: list, str2: list, threshold: float):
-        return sim.monge_elkan_similarity(str1, str2, lower_bound=threshold)
+        return monge_elkan.monge_elkan_similarity(str1, str2, lower_bound=threshold)
 
 
 class SymmetricMongeElkanSimilarity(StringSimilarityModule):
@@ -190,12 +222,14 @@ class SymmetricMongeElkanSimilarity(StringSimilarityModule):
         super().__init__(tl_args, **kwargs)
 
     def _similarity(self, str1: list, str2: list, threshold: float):
-        return sim.symmetric_monge_elkan_similarity(str1, str2, lower_bound=threshold)
+        return monge_elkan.symmetric_monge_elkan_similarity(str1, str2, lower_bound=threshold)
 
 
 class TfidfSimilarity(StringSimilarityModule):
     # tfidf:tokenizer=word
 
+    table_dependent = True
+
     def __init__(self, tl_args, **kwargs):
         super().__init__(tl_args, **kwargs)
 
@@ -225,3 +259,14 @@ class TfidfSimilarity(StringSimilarityModule):
         tf_y = sim.compute_tf(str2)
         tfidf_y = {k: v * self._tfidf.idf[k] for k, v in tf_y.items()}
         return sim.tf_idf_cosine_similarity(tfidf_x, tfidf_y)
+
+
+def similarity_unit_from_name(name: str, tl_args: dict) -> StringSimilarityModule:
+    """
+    Returns a new similarity unit built from the name of a unit, as returned by `get_name`, for example
+    "JaccardSimilarity(tokenizer=ngram,tokenizer_n=3)", with its method args read back as strings like the ones given
+    to `string-similarity`.
+    """
+    class_name, arg_str = name[:-1].split('(', 1)
+    method_args = dict(arg.split('=', 1) for arg in arg_str.split(',')) if arg_str else {}
+    return globals()[class_name](tl_args=tl_args, **method_args)
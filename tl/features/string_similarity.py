@@ -1,3 +1,6 @@
+import math
+import multiprocessing
+import numpy as np
 import pandas as pd
 import typing
 import copy
@@ -7,11 +10,46 @@ from tl.exceptions import UnsupportTypeError, RequiredColumnMissingException
 
 DEFAULT_COLUMN_COMB_NAME = ("label_clean", "kg_labels")
 
+# the similarity units of a worker of the pool of StringSimilarity, built from the names of the units
+worker_similarity_units = None
+
+
+def initialize_worker(unit_names: typing.List[str], tl_args: dict):
+    global worker_similarity_units
+    worker_similarity_units = [tl.features.similarity_units.similarity_unit_from_name(name, tl_args)
+                               for name in unit_names]
+
+
+def score_shard(shard: tuple) -> list:
+    """
+    Purpose: Scores a shard of the unique label pairs in a worker of the pool of StringSimilarity.
+    Returns: The scores of the pairs, whether they are all integers and the number of pairs pruned, for every
+             similarity unit.
+    """
+    pairs, threshold = shard
+    return [score_pairs(each_similarity_unit, pairs, threshold) for each_similarity_unit in worker_similarity_units]
+
+
+def score_pairs(similarity_unit, pairs: list, threshold: float) -> (np.ndarray, bool, int):
+    """
+    Returns the scores of a similarity unit for (target label, candidate label) pairs, as a float array, whether
+    the unit only returned integers, as soundex does, and the number of pairs the unit pruned with its upper bound.
+    """
+    pruned_pairs = similarity_unit.pruned_pairs
+    scores = [similarity_unit.similarity(str(target_label), str(each_label), threshold=threshold)
+              for target_label, each_label in pairs]
+    return (np.array(scores, dtype=float), all(isinstance(score, int) for score in scores),
+            similarity_unit.pruned_pairs - pruned_pairs)
+
 
 class StringSimilarity:
     def __init__(self, similarity_method: typing.List[str], **kwargs):
         self.similarity_units = []
         self.df = copy.deepcopy(kwargs["df"]).fillna("")
+        self.workers = kwargs.get("workers", None) or 1
+        # the workers rebuild the similarity units from their names, with the args which do not depend on the table
+        self.worker_tl_args = {"ignore_case": kwargs.get("ignore_case", False)}
+        self.telemetry = {}
         self.target_label_column_name, self.candidate_label_column_name = kwargs.get("target_columns", (None, None))
 
         for each_col in [self.target_label_column_name, self.candidate_label_column_name]:
@@ -66,16 +104,96 @@ class StringSimilarity:
         pass
 
     def get_similarity_score(self, threshold=0.0):
-        self.df['concatenated_targets'] = list(zip(self.df[self.candidate_label_column_name],
-                                                   self.df[self.target_label_column_name],
-                                                   self.df['label'],
-                                                   self.df['method']))
-        self.df[self.compared_column_names] = self.df['concatenated_targets'].map(
-            lambda x: self.string_similarity(x, threshold))
-        self.df.drop(columns=['concatenated_targets'], inplace=True)
+        unique_pairs, row_pairs, row_offsets = self.label_pairs()
+        self.telemetry = {
+            'row_pairs': len(row_pairs),
+            'unique_pairs': len(unique_pairs)
+        }
+        if len(row_offsets) == 0:
+            self.df[self.compared_column_names] = pd.Series(dtype=object)
+            return self.df
 
+        max_scores = np.zeros(len(row_offsets))
+        # whether the max score of a row was first reached by a unit only returning integers, as soundex does
+        integer_scores = np.zeros(len(row_offsets), dtype=bool)
+        pruned_total = 0
+        unit_pruning_rates = {}
+        for each_similarity_unit, (scores, integer_unit, pruned_pairs) in zip(self.similarity_units,
+                                                                             self.unit_scores(unique_pairs, threshold)):
+            pruned_total += pruned_pairs
+            unit_pruning_rates[each_similarity_unit.get_name()] = round(pruned_pairs / len(unique_pairs), 4)
+            # the scores which are nan are skipped, as by `string_similarity`
+            unit_max_scores = np.fmax.reduceat(scores[row_pairs], row_offsets)
+            higher = unit_max_scores > max_scores
+            max_scores[higher] = unit_max_scores[higher]
+            integer_scores[higher] = integer_unit
+
+        compared_pairs = len(unique_pairs) * len(self.similarity_units)
+        self.telemetry.update({
+            'pruned_pairs': pruned_total,
+            'pruning_rate': round(pruned_total / max(1, compared_pairs), 4),
+            'unit_pruning_rates': unit_pruning_rates
+        })
+
+        max_scores = max_scores.tolist()
+        if integer_scores.all():
+            max_scores = [int(score) for score in max_scores]
+        self.df[self.compared_column_names] = max_scores
         return self.df
 
+    def unit_scores(self, unique_pairs: list, threshold: float) -> typing.List[tuple]:
+        """
+        Returns the scores of every similarity unit for the unique pairs, as returned by `score_pairs`. With more than
+        one worker the pairs are split in shards scored by a pool of processes, each building the similarity units
+        from their names, and the scores of the shards are gathered in the order of the pairs. The units built from
+        the cells of the table, e.g. tfidf, are always scored by this process.
+        """
+        workers = min(self.workers, len(unique_pairs))
+        worker_units = [each_similarity_unit for each_similarity_unit in self.similarity_units
+                        if workers > 1 and not each_similarity_unit.table_dependent]
+        worker_scores = {}
+        if worker_units:
+            unit_names = [each_similarity_unit.get_name() for each_similarity_unit in worker_units]
+            shard_size = math.ceil(len(unique_pairs) / (workers * 4))
+            shards = [(unique_pairs[i:i + shard_size], threshold) for i in range(0, len(unique_pairs), shard_size)]
+            with multiprocessing.get_context('fork').Pool(workers, initializer=initialize_worker,
+                                                          initargs=(unit_names, self.worker_tl_args)) as pool:
+                shard_scores = pool.map(score_shard, shards)
+            for i, each_similarity_unit in enumerate(worker_units):
+                worker_scores[each_similarity_unit] = (
+                    np.concatenate([unit_scores[i][0] for unit_scores in shard_scores]),
+                    all(unit_scores[i][1] for unit_scores in shard_scores),
+                    sum(unit_scores[i][2] for unit_scores in shard_scores))
+        return [worker_scores[each_similarity_unit] if each_similarity_unit in worker_scores
+                else score_pairs(each_similarity_unit, unique_pairs, threshold)
+                for each_similarity_unit in self.similarity_units]
+
+    def label_pairs(self) -> (list, np.ndarray, np.ndarray):
+        """
+        Explodes the candidate labels and the target labels of every row into (target label, candidate label) pairs.
+        A pair is often found in many rows, when a candidate is retrieved for several cells or by several methods, so
+        every pair is only kept once.
+
+        Returns the unique pairs, the index of the unique pair of every pair of every row and the offset of the
+        first pair of every row, each row having at least one pair.
+        """
+        pair_indices = {}
+        row_pairs = []
+        row_offsets = []
+        for candidate_labels, target_labels, original_label, method in zip(self.df[self.candidate_label_column_name],
+                                                                           self.df[self.target_label_column_name],
+                                                                           self.df['label'],
+                                                                           self.df['method']):
+            og_labels = candidate_labels.split("|")
+            target_labels = target_labels.split("|")
+            if method.strip() == 'exact-match' and original_label != target_labels:
+                target_labels.extend(original_label.split("|"))
+            row_offsets.append(len(row_pairs))
+            for each_label in og_labels:
+                for target_label in target_labels:
+                    row_pairs.append(pair_indices.setdefault((target_label, each_label), len(pair_indices)))
+        return list(pair_indices), np.array(row_pairs, dtype=np.int64), np.array(row_offsets, dtype=np.int64)
+
     def string_similarity(self, pair: tuple, threshold) -> float:
         method = pair[3].strip()
         og_labels = pair[0].split("|")
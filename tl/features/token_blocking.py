@@ -0,0 +1,62 @@
+import numpy as np
+
+# The characters of a token are counted in this many buckets
+character_buckets = 64
+
+
+class TokenBags(object):
+    """
+    Bags of tokens, as compared by `symmetric_monge_elkan_similarity`, indexed by the characters of their tokens.
+
+    Every token is lowercased, like jaro winkler does, and its characters are counted in `character_buckets`
+    buckets. Two tokens cannot have more matching characters than the dot product of their counts, which bounds
+    their jaro winkler similarity from above. Bags must not be empty.
+    """
+
+    def __init__(self, bags: list):
+        self.bags = bags
+        tokens = [token.lower() for bag in bags for token in bag]
+        self.sizes = np.array([len(bag) for bag in bags], dtype=float)
+        self.starts = np.concatenate(([0], np.cumsum(self.sizes[:-1]))).astype(int) if bags else \
+            np.array([], dtype=int)
+        self.lengths = np.array([len(token) for token in tokens], dtype=float)
+        self.counts = np.zeros((len(tokens), character_buckets), dtype=float)
+        for i, token in enumerate(tokens):
+            for character in token:
+                self.counts[i, ord(character) % character_buckets] += 1
+
+    def __len__(self):
+        return len(self.bags)
+
+
+def symmetric_monge_elkan_upper_bounds(bags_1: TokenBags, bags_2: TokenBags) -> np.ndarray:
+    """
+    Purpose: Bounds from above the `symmetric_monge_elkan_similarity`, with jaro winkler between the tokens, of
+    every bag in bags_1 and every bag in bags_2.
+    Returns: a (len(bags_1), len(bags_2)) array, the similarity of two bags is never larger than their bound.
+    """
+    if len(bags_1) == 0 or len(bags_2) == 0:
+        return np.zeros((len(bags_1), len(bags_2)))
+    shortest = np.minimum.outer(bags_1.lengths, bags_2.lengths)
+    longest = np.maximum.outer(bags_1.lengths, bags_2.lengths)
+    matches = np.minimum(bags_1.counts @ bags_2.counts.T, shortest)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # jaro with no transpositions, and the largest prefix bonus of jaro winkler
+        jaro = np.where(matches > 0, (matches / shortest + matches / longest + 1) / 3, 0.0)
+    jaro_winkler = np.where(jaro > 0.7, jaro + 0.4 * (1 - jaro), jaro)
+
+    monge_elkan_1 = np.add.reduceat(np.maximum.reduceat(jaro_winkler, bags_2.starts, axis=1), bags_1.starts,
+                                    axis=0) / bags_1.sizes[:, None]
+    monge_elkan_2 = np.add.reduceat(np.maximum.reduceat(jaro_winkler, bags_1.starts, axis=0), bags_2.starts,
+                                    axis=1) / bags_2.sizes[None, :]
+    return (monge_elkan_1 + monge_elkan_2) / 2
+
+
+def candidate_pairs(bags_1: TokenBags, bags_2: TokenBags, threshold: float) -> list:
+    """
+    Returns the (i, j) pairs, in row major order, of bags_1[i] and bags_2[j] whose symmetric monge elkan
+    similarity can reach threshold. All the other pairs are below the threshold.
+    """
+    # a small margin keeps the pairs whose similarity is the threshold up to rounding
+    upper_bounds = symmetric_monge_elkan_upper_bounds(bags_1, bags_2)
+    return list(zip(*np.nonzero(upper_bounds >= threshold - 1e-9)))
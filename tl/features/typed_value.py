@@ -0,0 +1,109 @@
+import functools
+import re
+
+import dateutil.parser as dp
+import numpy as np
+
+# The number of distinct strings whose typed values are kept
+cache_size = 1 << 17
+
+year_pattern = re.compile(r'^[1-9]\d{2,3}$')
+punctuation_pattern = re.compile(r'[^\w\s]')
+
+
+class TypedValue(object):
+    """
+    The year, number and tokens a string of a cell can be read as, shared by `TableContextMatches` and
+    `MatchContext`. Every type is read the first time it is asked for, and `typed_value` keeps the typed value of
+    every distinct string, so that a string is never parsed twice.
+    """
+
+    __slots__ = ['value', '_year', '_number', '_tokens', '_numeric_parts']
+
+    def __init__(self, value: str):
+        self.value = value
+        self._year = ''
+        self._number = ''
+        self._tokens = None
+        self._numeric_parts = None
+
+    @property
+    def year(self) -> str:
+        """
+        The year of the date the string is parsed to by dateutil, None if it is not a date.
+        """
+        if self._year == '':
+            if year_pattern.match(self.value):
+                # dateutil reads a number of 3 or 4 digits as a year
+                self._year = self.value
+            else:
+                try:
+                    self._year = str(dp.parse(self.value).year)
+                except Exception:
+                    self._year = None
+        return self._year
+
+    @property
+    def number(self) -> float:
+        """
+        The number of the string without quotes and thousands separators, or of its last word that is a non zero
+        number if it has several words, nan if it is not a number and None if none of its words is.
+        """
+        if self._number == '':
+            to_match = self.value.replace('"', '').replace(",", "")
+            if " " in to_match:
+                self._number = None
+                for word in to_match.split(" "):
+                    number = self.read_number(word)
+                    if number:
+                        self._number = number
+            else:
+                self._number = self.read_number(to_match)
+        return self._number
+
+    @staticmethod
+    def read_number(word: str) -> float:
+        try:
+            return float(word)
+        except ValueError:
+            return np.nan
+
+    @property
+    def tokens(self) -> list:
+        """
+        The lower case words of the string without punctuation.
+        """
+        if self._tokens is None:
+            self._tokens = punctuation_pattern.sub('', self.value.lower()).split(" ")
+        return self._tokens
+
+    @property
+    def numeric_parts(self) -> (str, bool, str):
+        """
+        The string without quotes and thousands separators, whether it is a number, and the last number in it if
+        it has several words, as matched by `MatchContext`.
+        """
+        if self._numeric_parts is None:
+            # For quantity matching, we will give multiple tries to handle cases where numbers are separated with
+            to_match_1 = self.value.replace('"', '').replace(",", "")
+            to_match_2 = to_match_1.replace(".", "0")
+
+            num_v = None
+
+            if " " in to_match_2:
+                split_v = to_match_1.split(" ")
+                for s in split_v:
+                    if not s == ".":
+                        new_s = s.replace(".", "0")
+                        if new_s.isnumeric():
+                            num_v = s
+            self._numeric_parts = (to_match_1, to_match_1.isnumeric() or to_match_2.isnumeric(), num_v)
+        return self._numeric_parts
+
+
+@functools.lru_cache(maxsize=cache_size)
+def typed_value(value: str) -> TypedValue:
+    """
+    Returns the typed value of a string, the same object for the same string while it is in the cache.
+    """
+    return TypedValue(value)
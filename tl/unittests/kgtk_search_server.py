@@ -0,0 +1,72 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class KGTKSearchStandInServer(object):
+    """
+    A local stand-in for the KGTK search API, used by the tests and benchmarks.
+
+    Every search term `t` returns `size` candidates `Q<n>` whose label is `t` and whose score decreases
+    with the rank. Search terms in `empty_labels` return no candidates, and the ones in `slow_labels` are
+    answered after `slow_delay` seconds. All the requests received are recorded in `requests`.
+    """
+
+    def __init__(self, empty_labels: set = None, slow_labels: set = None, slow_delay: float = 1.0):
+        self.empty_labels = empty_labels or set()
+        self.slow_labels = slow_labels or set()
+        self.slow_delay = slow_delay
+        self.requests = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.create_handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return 'http://127.0.0.1:{}/api'.format(self.server.server_address[1])
+
+    def search(self, params: dict) -> list:
+        label = params['q'][0]
+        size = int(params.get('size', ['20'])[0])
+        if label in self.empty_labels:
+            return []
+        return [{
+            'qnode': 'Q{}'.format(abs(hash((label, i))) % 100000),
+            'label': [label],
+            'alias': ['{} {}'.format(label, i)],
+            'description': ['candidate {} for {}'.format(i, label)],
+            'pagerank': 1.0 / (i + 1),
+            'score': float(size - i)
+        } for i in range(size)]
+
+    def create_handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                params = parse_qs(urlparse(self.path).query)
+                with stand_in.lock:
+                    stand_in.requests.append(params)
+                if params['q'][0] in stand_in.slow_labels:
+                    time.sleep(stand_in.slow_delay)
+                body = json.dumps(stand_in.search(params)).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.server.shutdown()
+        self.server.server_close()
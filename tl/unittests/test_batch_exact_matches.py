@@ -0,0 +1,113 @@
+import json
+import unittest
+import pandas as pd
+from tl.candidate_generation.es_search import Search, flatten_strings
+from tl.candidate_generation.utility import Utility
+
+documents = [
+    {'_id': 'Q90', '_source': {'all_labels': {'en': ['Paris']}, 'labels': {'en': ['Paris']},
+                               'descriptions': {'en': ['capital of France']}, 'pagerank': 0.5,
+                               'external_identifiers_pairs': ['P214:158822968']}},
+    {'_id': 'Q830149', '_source': {'all_labels': {'en': ['Paris']}, 'labels': {'en': ['Paris']},
+                                   'descriptions': {'en': ['city in Texas']}, 'pagerank': 0.1}},
+    {'_id': 'Q1490', '_source': {'all_labels': {'en': ['Tokyo']}, 'labels': {'en': ['Tokyo']},
+                                 'descriptions': {'en': ['capital of Japan']}, 'pagerank': 0.4,
+                                 'external_identifiers_pairs': ['P214:128952883']}},
+    {'_id': 'Q64', '_source': {'all_labels': {'en': ['Berlin']}, 'labels': {'en': ['Berlin']},
+                               'descriptions': {'en': ['capital of Germany']}, 'pagerank': 0.3}},
+    {'_id': 'Q1055', '_source': {'labels': {'en': ['Hamburg']}, 'aliases': {'en': ['Free and Hanseatic City']},
+                                 'descriptions': {'en': ['city in Germany']}, 'pagerank': 0.2}}
+]
+
+
+class StandInIndex(object):
+    """
+    Answers the exact match and external identifier queries from the documents above, the terms of a query on the
+    field all_labels_aliases are matched against all the labels and aliases of a document.
+    """
+
+    def __init__(self):
+        self.queries = list()
+
+    @staticmethod
+    def field_values(source, field):
+        path = field.split('.')[:-1]
+        if path == ['all_labels_aliases']:
+            return flatten_strings([source.get('labels'), source.get('aliases')])
+        values = [source]
+        for key in path:
+            values = [v[key] for v in values if isinstance(v, dict) and key in v]
+        return flatten_strings(values)
+
+    def search_es(self, query):
+        query = json.loads(query)
+        self.queries.append(query)
+        hits = list()
+        for document in documents:
+            highlight = {}
+            matches = True
+            for clause in query['query']['bool']['must']:
+                if 'terms' in clause:
+                    ((field, terms),) = clause['terms'].items()
+                else:
+                    field = list(clause['bool']['should'][0]['term'])[0]
+                    terms = [c['term'][field]['value'] for c in clause['bool']['should']]
+                lower_case = field.endswith('keyword_lower')
+                values = [v for v in self.field_values(document['_source'], field)
+                          if (v.lower() if lower_case else v) in terms]
+                matches = matches and len(values) > 0
+                if values and not field.startswith('all_labels_aliases'):
+                    highlight[field] = ['<em>{}</em>'.format(v) for v in values]
+            if matches:
+                hits.append({'_id': document['_id'], '_score': 1.0, '_source': document['_source'],
+                             'highlight': highlight})
+        return hits[:query['size']]
+
+
+class TestBatchExactMatches(unittest.TestCase):
+    def setUp(self):
+        self.search = Search(es_url=None, es_index=None)
+        self.index = StandInIndex()
+        self.search.search_es = self.index.search_es
+
+    def tearDown(self):
+        del self.search.search_es
+
+    def test_demultiplex_hits(self):
+        results = self.search.search_terms_candidates_batch(['paris', 'Tokyo|Berlin', 'Atlantis', 'Hamburg'], 1,
+                                                            ['all_labels.en'], 'exact-match')
+        self.assertEqual(len(self.index.queries), 2)
+        self.assertEqual(list(results[0][0]), ['Q90'])
+        self.assertEqual(list(results[1][0]), ['Q1490', 'Q64'])
+        self.assertEqual(results[2][0], {})
+        # Hamburg is not in all_labels, it is found by the query on all the labels and aliases
+        self.assertEqual(list(results[3][0]), ['Q1055'])
+        self.assertEqual(results[0][0]['Q90']['description_str'], 'capital of France')
+
+    def test_size_cap_splits_batch(self):
+        # the first query asks for 3 hits, Paris fills them and Berlin is only found after splitting the batch
+        results = self.search.search_terms_candidates_batch(['Berlin', 'Paris', 'Tokyo'], 1,
+                                                            ['all_labels.en'], 'exact-match')
+        self.assertEqual(self.index.queries[0]['size'], 3)
+        self.assertGreater(len(self.index.queries), 1)
+        self.assertEqual([list(r[0]) for r in results], [['Q64'], ['Q90'], ['Q1490']])
+
+    def test_external_identifiers(self):
+        results = self.search.search_terms_candidates_batch(['128952883', '158822968', '0'], 5,
+                                                            ['external_identifiers_pairs'], 'ex-id-match',
+                                                            lower_case=False, identifier_property='p214')
+        self.assertEqual(len(self.index.queries), 1)
+        self.assertEqual([list(r[0]) for r in results], [['Q1490'], ['Q90'], []])
+
+    def test_same_candidates_as_single_queries(self):
+        df = pd.DataFrame({'column': '0', 'row': [str(i) for i in range(5)],
+                           'label': ['Paris', 'tokyo', 'Atlantis', 'Berlin', 'Hamburg'],
+                           'label_clean': ['Paris', 'tokyo', 'Atlantis', 'Berlin', 'Hamburg']})
+        utility = Utility(self.search)
+        batch_df = utility.create_candidates_df(df, 'label_clean', 5, 'all_labels.en', 'exact-match',
+                                                lower_case=True, batch_size=2)
+        # a query per batch of 2 cells, and one on all the labels and aliases for Atlantis and Hamburg each
+        self.assertEqual(len(self.index.queries), 5)
+        single_df = utility.create_candidates_df(df, 'label_clean', 5, 'all_labels.en', 'exact-match',
+                                                 lower_case=True)
+        pd.testing.assert_frame_equal(batch_df, single_df)
@@ -0,0 +1,104 @@
+import csv
+import io
+import random
+import time
+import unittest
+import pandas as pd
+from pathlib import Path
+from tl.candidate_generation.utility import Utility
+
+parent_path = Path(__file__).parent
+
+
+class StandInSearch(object):
+    """
+    Answers every search term with two candidates after a random delay, so that the queries finish out of order.
+    """
+
+    def search_term_candidates(self, search_term, size, properties, method, lower_case=False,
+                               auxiliary_fields=None, extra_musts=None, search_term_original=None,
+                               identifier_property=None):
+        time.sleep(random.random() / 100)
+        candidate_dict = {}
+        for i in range(2):
+            candidate_dict['{}_{}'.format(search_term, i)] = {
+                'label_str': search_term,
+                'alias_str': '',
+                'description_str': '',
+                'pagerank_float': 0.0,
+                'score': float(i)
+            }
+        return candidate_dict, {}
+
+
+class TestCandidateBlocks(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(TestCandidateBlocks, self).__init__(*args, **kwargs)
+        self.utility = Utility(StandInSearch())
+        self.df = pd.read_csv('{}/data/canonical.csv'.format(parent_path), dtype=object)
+
+    def test_blocks_match_whole_output(self):
+        odf = self.utility.create_candidates_df(self.df, 'label', 2, 'labels', 'exact-match', max_threads=8)
+        blocks = list(self.utility.create_candidates_df(self.df, 'label', 2, 'labels', 'exact-match',
+                                                        max_threads=8, block_size=7))
+        self.assertEqual(len(blocks), (len(self.df) + 6) // 7)
+        self.assertTrue(all(len(block) == 14 for block in blocks[:-1]))
+        pd.testing.assert_frame_equal(pd.concat(blocks).reset_index(drop=True), odf)
+        self.assertEqual(list(odf['row'][::2]), list(self.df['row']))
+
+    def test_write_candidates(self):
+        blocks = self.utility.create_candidates_df(self.df, 'label', 2, 'labels', 'exact-match', block_size=5)
+        output = io.StringIO()
+        Utility.write_candidates(blocks, output)
+        odf = self.utility.create_candidates_df(self.df, 'label', 2, 'labels', 'exact-match')
+        expected = io.StringIO()
+        Utility.write_candidates(odf, expected)
+        self.assertEqual(output.getvalue(), expected.getvalue())
+
+    def test_candidates_file_blocks(self):
+        candidates = self.utility.create_candidates_df(self.df, 'label', 2, 'labels', 'exact-match')
+        odf = self.utility.create_candidates_df(candidates, 'label', 2, 'labels', 'fuzzy-augmented')
+        blocks = list(self.utility.create_candidates_df(candidates, 'label', 2, 'labels', 'fuzzy-augmented',
+                                                        block_size=3))
+        self.assert_same_rows(pd.concat(blocks), odf)
+
+    def test_rows_without_cell(self):
+        candidates = self.utility.create_candidates_df(self.df, 'label', 2, 'labels', 'exact-match')
+        candidates = candidates.drop(columns=['kg_aliases', 'pagerank'])
+        # the cell of row 1 has no label, its rows are not searched but kept in the output
+        candidates.iloc[[2, 3], candidates.columns.get_loc('label')] = None
+        output = io.StringIO()
+        Utility.write_candidates(self.utility.create_candidates_df(candidates, 'label', 2, 'labels',
+                                                                   'fuzzy-augmented', block_size=3), output)
+        expected = io.StringIO()
+        Utility.write_candidates(self.utility.create_candidates_df(candidates, 'label', 2, 'labels',
+                                                                   'fuzzy-augmented'), expected)
+
+        lines = list(csv.reader(io.StringIO(output.getvalue())))
+        self.assertEqual(lines[0], next(csv.reader(io.StringIO(expected.getvalue()))))
+        self.assertTrue(all(len(line) == len(lines[0]) for line in lines))
+        bdf = pd.read_csv(io.StringIO(output.getvalue()), dtype=object)
+        self.assert_same_rows(bdf, pd.read_csv(io.StringIO(expected.getvalue()), dtype=object))
+        self.assertTrue(bdf[bdf['row'] == '1']['kg_id'].isin(candidates['kg_id']).all())
+        # the input rows are written in (column, row) order
+        input_rows = bdf[bdf['method'] == 'exact-match']
+        keys = list(zip(input_rows['column'], input_rows['row']))
+        self.assertEqual(keys, sorted(keys))
+
+    def test_empty_input(self):
+        candidates = self.utility.create_candidates_df(self.df, 'label', 2, 'labels', 'exact-match')
+        for df in [self.df.head(0), candidates.head(0)]:
+            output = io.StringIO()
+            Utility.write_candidates(self.utility.create_candidates_df(df, 'label', 2, 'labels', 'fuzzy-augmented',
+                                                                       block_size=3), output)
+            expected = io.StringIO()
+            Utility.write_candidates(self.utility.create_candidates_df(df, 'label', 2, 'labels', 'fuzzy-augmented'),
+                                     expected)
+            self.assertEqual(output.getvalue(), expected.getvalue())
+        self.assertEqual(output.getvalue().strip().split(','), list(candidates.columns))
+
+    def assert_same_rows(self, bdf, odf):
+        self.assertEqual(len(bdf), len(odf))
+        sort_columns = ['column', 'row', 'method', 'kg_id']
+        pd.testing.assert_frame_equal(bdf.sort_values(sort_columns).reset_index(drop=True),
+                                      odf.sort_values(sort_columns).reset_index(drop=True))
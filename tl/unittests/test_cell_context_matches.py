@@ -0,0 +1,187 @@
+import json
+import os
+import tempfile
+import unittest
+import pandas as pd
+from tl.features.cell_context_matches import TableContextMatches, CellContextMatches, ContextTriples
+from tl.features.property_model import PropertyModel
+
+
+def write_table(folder: str, number_of_rows: int = 12) -> (str, str):
+    """
+    Writes a table of people, their country, year of birth and height, with a right and a wrong candidate for
+    every person, and the context of the candidates. Returns the paths of the input file and the context file.
+    """
+    rows = []
+    context = {}
+    for i in range(number_of_rows):
+        country = f'country {i % 3}'
+        year = str(1950 + i)
+        height = str(170 + i)
+        rows.append([i, 0, f'person {i}', f'Qp{i}', f'person {i}', '', f'{country}|{year}|{height}'])
+        rows.append([i, 0, f'person {i}', f'Qx{i}', f'person {i}', '', f'{country}|{year}|{height}'])
+        rows.append([i, 1, country, f'Qc{i % 3}', country, '', ''])
+        context[f'Qp{i}'] = [{'p': 'P27', 't': 'i', 'v': [country], 'i': f'Qc{i % 3}'},
+                             {'p': 'P569', 't': 'd', 'v': [year]},
+                             {'p': 'P2048', 't': 'q', 'v': [height]},
+                             {'p': 'P1477', 't': 'i', 'v': [f'name {i}']},
+                             {'p': 'P1971', 't': 'q', 'v': ['7']}]
+        context[f'Qx{i}'] = [{'p': 'P19', 't': 'i', 'v': [country], 'i': f'Qc{i % 3}'},
+                             {'p': 'P27', 't': 'i', 'v': ['elsewhere']}]
+        context[f'Qc{i % 3}'] = [{'p': 'P36', 't': 'i', 'v': [f'capital {i % 3}']}]
+    input_path = os.path.join(folder, 'input.csv')
+    pd.DataFrame(rows, columns=['row', 'column', 'label_clean', 'kg_id', 'kg_labels', 'kg_aliases', 'context']) \
+        .to_csv(input_path, index=False)
+    context_path = os.path.join(folder, 'context.jl')
+    with open(context_path, 'w') as f:
+        for qnode, qnode_context in context.items():
+            f.write(json.dumps({qnode: qnode_context}) + '\n')
+    return input_path, context_path
+
+
+class TestCellContextMatches(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.input_path, self.context_path = write_table(self.folder.name)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def table_context_matches(self, **kwargs):
+        return TableContextMatches(context_path=self.context_path, input_path=self.input_path,
+                                   string_similarity_threshold=0.75, quantity_similarity_threshold=0.85, **kwargs)
+
+    def test_context_scores(self):
+        tcm = self.table_context_matches()
+        odf = tcm.input_df
+        scores = dict(zip(odf['kg_id'], odf['context_score']))
+        self.assertEqual(scores['Qp0'], 1 - 1 / pow(2, 3))
+        self.assertEqual(scores['Qx0'], 1 - 1 / pow(2, 1))
+        self.assertEqual(set(tcm.relevant_properties_df['property_']), {'P27', 'P19', 'P569', 'P2048', '_P27',
+                                                                        '_P19'})
+
+    def test_property_model(self):
+        property_model_path = os.path.join(self.folder.name, 'property_model.json')
+        full = self.table_context_matches(property_model_path=property_model_path)
+        self.assertEqual(full.telemetry['property_model'], 'created')
+        self.assertEqual(full.telemetry['skipped_comparisons'], 0)
+        key = full.property_model_key
+        self.assertEqual(key, PropertyModel.table_signature(pd.read_csv(self.input_path), 'label_clean'))
+        self.assertEqual(set(PropertyModel(property_model_path).relevant_properties(key)['0_1']), {'P27', 'P19'})
+
+        # the second run only matches the relevant properties, with the same scores
+        pruned = self.table_context_matches(property_model_path=property_model_path)
+        self.assertEqual(pruned.telemetry['property_model'], 'used')
+        self.assertEqual(pruned.telemetry['full_comparisons'], full.comparisons)
+        self.assertLess(pruned.comparisons, full.comparisons)
+        self.assertGreater(pruned.skipped_comparisons, 0)
+        self.assertEqual(pruned.input_df['context_score'].tolist(), full.input_df['context_score'].tolist())
+
+        # a model is shared by the tables of a dataset
+        self.table_context_matches(property_model_path=property_model_path, property_model_key='people')
+        self.assertEqual(set(PropertyModel(property_model_path).models), {key, 'people'})
+
+    def test_sample(self):
+        full = self.table_context_matches()
+        sampled = self.table_context_matches(sample_size=4)
+        self.assertEqual(sampled.telemetry['sample_rows'], 4)
+        self.assertLess(sampled.telemetry['sample_comparisons'], sampled.comparisons)
+        self.assertLess(sampled.comparisons - sampled.telemetry['sample_comparisons'], full.comparisons)
+        self.assertGreater(sampled.skipped_comparisons, 0)
+        self.assertEqual(sampled.input_df['context_score'].tolist(), full.input_df['context_score'].tolist())
+
+        # without a fallback, the pairs of columns the sample did not match are skipped
+        sampled.relevant_properties.pop('0_1')
+        sampled.fallback_to_all_properties = False
+        self.assertFalse(sampled.is_relevant_property('0', '1', 'P27'))
+        sampled.fallback_to_all_properties = True
+        self.assertTrue(sampled.is_relevant_property('0', '1', 'P27'))
+
+        # a table no larger than the sample is matched in full
+        self.assertNotIn('sample_rows', self.table_context_matches(sample_size=12).telemetry)
+
+    def test_sampled_property_model(self):
+        property_model_path = os.path.join(self.folder.name, 'property_model.json')
+        sampled = self.table_context_matches(sample_size=4, property_model_path=property_model_path)
+        self.assertEqual(sampled.telemetry['property_model'], 'created')
+        self.assertIsNone(sampled.telemetry['property_coverage'])
+        # the comparisons and time of the sampled run are not kept as those of a full run
+        model = PropertyModel(property_model_path).get(sampled.property_model_key)
+        self.assertEqual(model['sample_rows'], 4)
+        self.assertIsNone(model['coverage'])
+        self.assertIsNone(model['comparisons'])
+        self.assertIsNone(model['time'])
+
+        used = self.table_context_matches(property_model_path=property_model_path)
+        self.assertEqual(used.telemetry['property_model'], 'used')
+        self.assertEqual(used.telemetry['property_model_sample_rows'], 4)
+        self.assertIsNone(used.telemetry['full_comparisons'])
+        self.assertIsNone(used.telemetry['speedup'])
+        self.assertEqual(used.input_df['context_score'].tolist(), sampled.input_df['context_score'].tolist())
+
+    def test_triple_store(self):
+        triples = ContextTriples(capacity=2)
+        ccm = CellContextMatches('0', '0', triples)
+        added = []
+        for q_node, property_, col2, score in [('Q1', 'P27', '1', 0.8), ('Q2', 'P19', '1', 0.9),
+                                               ('Q1', 'P27', '1', 1.0), ('Q1', 'P569', '2', 1.0),
+                                               ('Q1', 'P19', '1', 0.75)]:
+            triple = dict(row='0', col1='0', col1_item=q_node, col1_string='person', type='i', score=score,
+                          property=property_, col2=col2, col2_string='a', best_match='a', col2_item=None)
+            ccm.add_triple(**triple)
+            added.append(triple)
+        self.assertEqual(len(triples), 5)
+        self.assertTrue(ccm.has_candidate('Q2'))
+        self.assertEqual(ccm.get_triples_to_column('1'), [t for t in added if t['col2'] == '1'])
+        self.assertEqual(ccm.get_triples(), [t for t in added if t['col2'] == '1'] + [added[3]])
+        self.assertEqual(ccm.get_properties('1'), [('P27', 'i', 1.0, 0.9, 2), ('P19', 'i', 0.9, 0.825, 2)])
+        self.assertEqual(ccm.get_properties('1', q_node='Q1'),
+                         [('P27', 'i', 1.0, 0.9, 2), ('P19', 'i', 0.75, 0.75, 1)])
+        self.assertEqual(ccm.get_properties('3'), [])
+
+    def test_row_shards(self):
+        serial = self.table_context_matches(use_cpus=1)
+        sharded = self.table_context_matches(use_cpus=2)
+        self.assertEqual(sharded.telemetry['cpus'], 2)
+        self.assertEqual(sharded.telemetry['shards'], 6)
+        self.assertEqual(sharded.telemetry['matched_rows'], 12)
+        self.assertEqual(sharded.comparisons, serial.comparisons)
+        self.assertEqual(sharded.input_df['context_score'].tolist(), serial.input_df['context_score'].tolist())
+        self.assertEqual(sharded.input_df['context_properties'].tolist(),
+                         serial.input_df['context_properties'].tolist())
+        for key, ccm in serial.ccm_dict.items():
+            self.assertEqual(sharded.ccm_dict[key].get_triples(), ccm.get_triples())
+
+    def test_context_matches_file(self):
+        context_matches_path = os.path.join(self.folder.name, 'context_matches.npz')
+        matched = self.table_context_matches(context_matches_path=context_matches_path)
+        self.assertEqual(matched.telemetry['context_matches'], 'saved')
+        self.assertEqual(len(ContextTriples.load(context_matches_path)), len(matched.triples))
+
+        # a rerun loads the matches instead of matching the context again
+        loaded = self.table_context_matches(context_matches_path=context_matches_path)
+        self.assertEqual(loaded.telemetry['context_matches'], 'loaded')
+        self.assertEqual(loaded.comparisons, 0)
+        for column in ['context_score', 'context_properties', 'context_similarity']:
+            self.assertEqual(loaded.input_df[column].tolist(), matched.input_df[column].tolist())
+        self.assertEqual(loaded.ccm_dict['0_0'].get_properties('1'), matched.ccm_dict['0_0'].get_properties('1'))
+
+        # all the fields are written and read back from binary and csv files
+        for path in [os.path.join(self.folder.name, 'matches.bin'), os.path.join(self.folder.name, 'matches.csv')]:
+            matched.serialize(path)
+            tcm = TableContextMatches.__new__(TableContextMatches)
+            tcm.ccm_dict, tcm.triples = {}, ContextTriples()
+            tcm.load_from_disk(path)
+            for key, ccm in matched.ccm_dict.items():
+                self.assertEqual(tcm.ccm_dict[key].get_triples() if key in tcm.ccm_dict else [], ccm.get_triples())
+
+    def test_similarity_memo(self):
+        tcm = self.table_context_matches(use_cpus=1)
+        # the countries of the rows are compared to the countries of the candidates of every row
+        self.assertGreater(tcm.telemetry['similarity_memo_hits'], 0)
+        self.assertEqual(tcm.telemetry['similarity_memo_misses'], len(tcm.similarity_memo))
+        memo = dict(tcm.similarity_memo)
+        tcm.similarity_memo = {}
+        for (context_value, col2_string, context_values_type), similarity in memo.items():
+            self.assertEqual(tcm.pair_similarity(context_value, col2_string, context_values_type), similarity)
+        self.assertEqual(tcm.similarity_memo, memo)
@@ -0,0 +1,68 @@
+import unittest
+from unittest import mock
+from tl.candidate_generation.es_search import Search
+from tl.utility.concurrency import AdaptiveConcurrencyController, ConcurrencyController, retry_delay
+
+
+class TestConcurrencyController(unittest.TestCase):
+    def test_additive_increase(self):
+        controller = AdaptiveConcurrencyController(max_limit=10, initial_limit=2)
+        for _ in range(100):
+            controller.acquire()
+            controller.release(0.01)
+        self.assertEqual(controller.get_telemetry()['concurrency_limit'], 10)
+
+    def test_multiplicative_decrease(self):
+        controller = AdaptiveConcurrencyController(max_limit=16, initial_limit=16)
+        controller.acquire()
+        controller.release(0.01, overloaded=True)
+        self.assertEqual(controller.limit, 8)
+        # requests which saw the same congestion do not decrease the limit again
+        controller.acquire()
+        controller.release(0.01, overloaded=True)
+        self.assertEqual(controller.limit, 8)
+
+    def test_latency_spike(self):
+        controller = AdaptiveConcurrencyController(max_limit=16, initial_limit=16)
+        controller.acquire()
+        controller.release(0.01)
+        controller.acquire()
+        controller.release(1.0)
+        self.assertEqual(int(controller.limit), 8)
+        self.assertEqual(controller.get_telemetry()['concurrency_decreases'], 1)
+
+    def test_fast_rejection(self):
+        controller = AdaptiveConcurrencyController(max_limit=16, initial_limit=8)
+        controller.acquire()
+        controller.release(0.05)
+        # a fast 429 does not lower the baseline, the next requests served as fast as before are no spikes
+        controller.acquire()
+        controller.release(0.001, overloaded=True)
+        self.assertEqual(controller.baseline_latency, 0.05)
+        for _ in range(20):
+            controller.acquire()
+            controller.release(0.05)
+        self.assertEqual(controller.get_telemetry()['concurrency_decreases'], 1)
+        self.assertGreater(controller.limit, 4)
+
+    def test_shared_instance(self):
+        self.assertIs(ConcurrencyController(), ConcurrencyController())
+
+    def test_retry_delay(self):
+        for attempt, (low, high) in enumerate([(0.25, 0.5), (0.5, 1.0), (1.0, 2.0)], start=1):
+            delays = [retry_delay(attempt, 0.5) for _ in range(100)]
+            self.assertTrue(all(low <= delay <= high for delay in delays))
+            self.assertGreater(len(set(delays)), 1)
+        self.assertLessEqual(retry_delay(20, 0.5), 10.0)
+
+    def test_rejected_search_waits_before_retrying(self):
+        search = Search(es_url=None, es_index=None)
+        responses = [mock.Mock(status_code=429, text='rejected') for _ in range(2)]
+        responses.append(mock.Mock(status_code=200, json=lambda: {'hits': {'hits': []}}))
+        with mock.patch('tl.candidate_generation.es_search.requests.post', side_effect=responses) as post, \
+                mock.patch('tl.candidate_generation.es_search.time.sleep') as sleep:
+            self.assertEqual(search.search_es({'query': 'rejected twice'}), [])
+        self.assertEqual(post.call_count, 3)
+        delays = [call.args[0] for call in sleep.call_args_list]
+        self.assertEqual(len(delays), 2)
+        self.assertTrue(0.25 <= delays[0] <= 0.5 <= delays[1] <= 1.0)
@@ -1,7 +1,8 @@
+import time
 import unittest
 import pandas as pd
 from pathlib import Path
-from tl.features.context_match import MatchContext
+from tl.features.context_match import MatchContext, QNodeContext
 
 parent_path = Path(__file__).parent
 
@@ -127,3 +128,102 @@ class TestContextMatch(unittest.TestCase):
         self.assertTrue(node_similarity[1] == "1.0")
         self.assertTrue(node_context_score == 1.0)
 
+
+    def test_parsed_q_node_context(self):
+        context = MatchContext.read_context_file(context_path=self.context_file_path, qnodes={'Q1348423'})
+        q_node_context = QNodeContext(context['Q1348423'])
+        self.assertEqual(q_node_context.dates, ['1986', '1987'])
+        self.assertEqual(q_node_context.date_properties, ['P577', 'P577'])
+        self.assertIn('P214', q_node_context.properties)
+        position = q_node_context.item_values.index('america')
+        self.assertEqual(q_node_context.item_tokens[position], ['america'])
+        self.assertEqual(q_node_context.item_properties[position], 'P495')
+        self.assertEqual(q_node_context.item_q_nodes[position], 'Q30')
+        self.assertEqual(len(q_node_context.quantities), len(q_node_context.quantity_properties))
+
+    def test_quantities_within_threshold(self):
+        q_node_context = QNodeContext('"q""100"":P1082|q""-90"":P2046|q""85"":P1082|q""0"":P1120|q""120"":P2044"')
+        positions = q_node_context.quantities_within(100.0, 0.8)
+        self.assertEqual(positions, [0, 2, 4])
+        self.assertEqual(positions, [i for i, quantity in enumerate(q_node_context.quantities)
+                                     if MatchContext.quantity_score(quantity, 100.0) >= 0.8])
+        self.assertEqual(q_node_context.quantities_within(0.0, 0.8), [3])
+        self.assertEqual(q_node_context.date_index, {})
+
+    def scoring_match_context(self, data):
+        obj = MatchContext.__new__(MatchContext)
+        obj.context_property_column = 'context_property'
+        obj.context_similarity_column = 'context_similarity'
+        obj.context_debug_column = 'context_property_similarity_q_node'
+        obj.output_column_name = self.output_column_name
+        obj.data = data
+        return obj
+
+    def test_property_scores(self):
+        # the scores of the previous implementation, which grew the property tables row by row
+        obj = self.scoring_match_context(pd.DataFrame({
+            'column': ['1'] * 5, 'row': ['0', '0', '1', '2', '2'],
+            'context_property': [['P17', 'P31'], ['P17', ''], ['P17', 'P31'], ['P131', 'P31'], ['', 'P17']],
+            'context_similarity': [['1.0', '0.95'], ['0.9', '0.0'], ['0.92', '1.0'], ['1.0', '0.5$$'],
+                                   ['0.0', '0.9']],
+            'context_property_similarity_q_node': [['P17/Q30/1.0/usa', 'P31/Q5/0.95/human'],
+                                                   ['P17/Q30/0.9/us', '//0.0/'],
+                                                   ['P17/Q30/0.92/u.s.', 'P31/Q5/1.0/human'],
+                                                   ['P131/Q1/1.0/x', 'P31(0.25)//0.5$$/'],
+                                                   ['//0.0/', 'P17/Q30/0.9/usa']],
+            'reverse_context_property': [['P17'], ['P17', 'P131'], [], ['P131'], ['P17']],
+            'reverse_context_similarity': [['1.0'], ['0.9', '0.95'], [], ['1.0'], ['0.91']],
+            'reverse_context_property_similarity_q_node': [['P17/Q30/1.0/a'], ['P17/Q30/0.9/b', 'P131/Q1/0.95/c'],
+                                                           [], ['P131/Q1/1.0/d'], ['P17/Q30/0.91/e']]
+        }))
+        obj.calculate_property_value('1')
+        self.assertEqual(obj.properties_with_score_metric.values.tolist(),
+                         [['1', 'P31', '2', 1.0, '0.5$$'], ['1', 'P17', '1', 0.5, '0.92'],
+                          ['1', 'P17', '2', 0.3333, '0.9'], ['1', 'P131', '1', 0.3333, '1.0']])
+        obj.calculate_score()
+        self.assertEqual(obj.data[self.output_column_name].tolist(), [1.0, 0.45, 1.0, 0.8333, 0.3])
+        self.assertEqual(obj.data['context_property_similarity_q_node'].tolist(),
+                         ['P17(0.5)/Q30/1.0/usa|P31(1.0)/Q5/0.95/human', 'P17(0.5)/Q30/0.9/us|//0.0/',
+                          'P17(0.5)/Q30/0.92/u.s.|P31(1.0)/Q5/1.0/human',
+                          'P131(0.3333)/Q1/1.0/x|P31(1.0)(0.25)//0.5$$/', '//0.0/|P17(0.3333)/Q30/0.9/usa'])
+        obj.inverse_property_calculation_and_score_calculation('1')
+        self.assertEqual(obj.properties_with_score_metric.values.tolist(),
+                         [['1_inv', 'P131', 1.0, '0.95'], ['1_inv', 'P17', 0.75, '0.91']])
+        self.assertEqual([round(score, 4) for score in obj.data['actual_' + self.output_column_name]],
+                         [2.2, 2.075, 1.46, 1.8333, 0.9825])
+        self.assertEqual(obj.data['reverse_context_property_similarity_q_node'].tolist(),
+                         ['P17(0.75)/Q30/1.0/a', 'P17(0.75)/Q30/0.9/b|P131(1.0)/Q1/0.95/c', '',
+                          'P131(1.0)/Q1/1.0/d', 'P17(0.75)/Q30/0.91/e'])
+
+    def test_property_scores_scale_linearly(self):
+        # benchmark: scoring four times as many rows takes about four times as long
+        def score(number_of_rows):
+            obj = self.scoring_match_context(pd.DataFrame({
+                'column': '1', 'row': [str(i // 4) for i in range(number_of_rows)],
+                'context_property': [['P{}'.format(i % 50), 'P{}'.format(i % 7)] for i in range(number_of_rows)],
+                'context_similarity': [['0.95', '1.0'] for _ in range(number_of_rows)],
+                'context_property_similarity_q_node': [['P{}/Q1/0.95/a'.format(i % 50), 'P{}/Q2/1.0/b'.format(i % 7)]
+                                                       for i in range(number_of_rows)]
+            }))
+            start = time.time()
+            obj.calculate_property_value('1')
+            obj.calculate_score()
+            return time.time() - start
+
+        score(1000)
+        self.assertLess(score(16000), 8 * score(4000) + 0.5)
+
+    def test_worker_pool(self):
+        def match_context(use_cpus):
+            obj = MatchContext(self.input_file_path, self.similarity_string_threshold,
+                               self.similarity_quantity_threshold, self.string_separator,
+                               self.missing_property_replacement_factor, self.ignore_column_name,
+                               self.pseudo_gt_column_name, self.output_column_name, self.context_file_path)
+            # more workers than cpus still exercises the pool
+            obj.use_cpus = use_cpus
+            return obj
+
+        obj = match_context(2)
+        odf = obj.process_data_by_column()
+        self.assertIsNone(obj.worker_pool)
+        pd.testing.assert_frame_equal(odf, match_context(1).process_data_by_column())
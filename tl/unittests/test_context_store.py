@@ -0,0 +1,77 @@
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from tl.features.context_match import MatchContext
+from tl.features.cell_context_matches import TableContextMatches
+from tl.utility.context_store import ContextStore
+
+parent_path = Path(__file__).parent
+
+
+class TestContextStore(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(TestContextStore, self).__init__(*args, **kwargs)
+        self.context_file_path = '{}/data/unit_test_context.tsv'.format(parent_path)
+        self.custom_context_path = '{}/data/custom_context.tsv.gz'.format(parent_path)
+
+    def test_tsv_store(self):
+        with tempfile.TemporaryDirectory() as store_path:
+            entries = ContextStore.build([self.context_file_path, self.custom_context_path], store_path)
+            expected = MatchContext.read_context_file(context_path=self.context_file_path,
+                                                      custom_context_path=self.custom_context_path)
+            store = ContextStore(store_path)
+            self.assertEqual(len(store), entries)
+            self.assertEqual(store.materialize(expected), dict(expected))
+
+            qnodes = ['Q30', 'Q91463330', 'Q1348423', 'Qmissing']
+            self.assertEqual(store.materialize(qnodes), {q: expected[q] for q in qnodes if q in expected})
+            self.assertIsNone(store.get('Qmissing'))
+            store.close()
+
+            # reading from the store gives the same context as reading the tsv files
+            context = MatchContext.read_context_file(context_path=store_path, qnodes=set(qnodes))
+            self.assertEqual(dict(context), {q: expected[q] for q in qnodes if q in expected})
+
+    def test_json_store(self):
+        with tempfile.TemporaryDirectory() as folder:
+            context_file = os.path.join(folder, 'context.jl')
+            with open(context_file, 'w') as f:
+                f.write(json.dumps({'Q1': [{'p': 'P31', 't': 'i', 'v': 'city', 'i': 'Q515'}]}) + '\n')
+                f.write(json.dumps({'Q2': [{'p': 'P1082', 't': 'q', 'v': '1000'}]}) + '\n')
+            store_path = os.path.join(folder, 'store')
+            ContextStore.build([context_file], store_path)
+            self.assertEqual(TableContextMatches.read_context_file(store_path, qnodes={'Q2', 'Q3'}),
+                             {'Q2': [{'p': 'P1082', 't': 'q', 'v': '1000'}]})
+            self.assertEqual(TableContextMatches.read_context_file(store_path),
+                             TableContextMatches.read_context_file(context_file))
+
+    def test_filtered_json_context(self):
+        lines = [{'Q1': [{'p': 'P31', 't': 'i', 'v': 'city', 'i': 'Q515'}]},
+                 {'Q2': [{'p': 'P1082', 't': 'q', 'v': '1000'}], 'Q3': [{'p': 'P17', 't': 'i', 'v': 'Q1'}]},
+                 {'Q4': [{'p': 'P1448', 't': 'i', 'v': 'the "Q5" city'}]},
+                 {'Q1': [{'p': 'P31', 't': 'i', 'v': 'town', 'i': 'Q3957'}]}]
+        with tempfile.TemporaryDirectory() as folder:
+            context_file = os.path.join(folder, 'context.jl')
+            with open(context_file, 'w') as f:
+                for line in lines:
+                    f.write(json.dumps(line) + '\n')
+            with gzip.open(context_file + '.gz', 'wt') as f:
+                for line in lines:
+                    f.write(json.dumps(line) + '\n')
+            for path in [context_file, context_file + '.gz']:
+                for qnodes in [None, {'Q1', 'Q3', 'Q5'}, {'Q4'}, set()]:
+                    expected = {}
+                    for line in lines:
+                        expected.update({q: c for q, c in line.items() if qnodes is None or q in qnodes})
+                    self.assertEqual(TableContextMatches.read_context_file(path, qnodes=qnodes), expected)
+
+    def test_gzipped_lines(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'lines.txt.gz')
+            lines = ['line {} {}\n'.format(i, 'x' * (i % 97)) for i in range(50000)] + ['last line']
+            with gzip.open(path, 'wt') as f:
+                f.write(''.join(lines))
+            self.assertEqual(list(ContextStore.read_lines(path)), lines)
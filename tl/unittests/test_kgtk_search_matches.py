@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+import pandas as pd
+from tl.candidate_generation.get_kgtk_search_matches import KGTKSearchMatches
+from tl.unittests.kgtk_search_server import KGTKSearchStandInServer
+
+
+class TestKGTKSearchMatches(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(TestKGTKSearchMatches, self).__init__(*args, **kwargs)
+        self.df = pd.DataFrame({
+            'column': ['0', '0', '0', '0'],
+            'row': ['0', '1', '2', '3'],
+            'label': ['Budapest', 'AT&T #1', 'Budapest', 'nothing'],
+            'label_clean': ['Budapest', 'AT&T #1', 'Budapest', 'nothing']
+        })
+
+    def test_candidates(self):
+        with KGTKSearchStandInServer(empty_labels={'nothing'}) as server:
+            km = KGTKSearchMatches(es_url=None, es_index=None, api_url=server.url)
+            odf = km.get_matches('label_clean', size=3, df=self.df.copy())
+            # the same label is only searched once
+            self.assertEqual(len(server.requests), 3)
+
+        self.assertEqual(len(odf), 3 + 3 + 3 + 1)
+        self.assertEqual(list(odf.columns), ['column', 'row', 'label', 'label_clean', 'kg_id', 'pagerank',
+                                             'kg_labels', 'method', 'kg_descriptions', 'retrieval_score'])
+        self.assertTrue((odf['method'] == 'kgtk-search').all())
+        # special characters in the label are url encoded
+        att = odf[odf['row'] == '1']
+        self.assertTrue((att['kg_labels'].str.startswith('AT&T #1|')).all())
+        self.assertEqual(att['retrieval_score'].tolist(), [3.0, 2.0, 1.0])
+        # a cell without candidates still has one row
+        nothing = odf[odf['row'] == '3']
+        self.assertEqual(nothing['kg_id'].tolist(), [''])
+
+    def test_persistent_cache(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache_path = os.path.join(temp_dir, 'kgtk_search_cache.jl')
+            with KGTKSearchStandInServer() as server:
+                km = KGTKSearchMatches(es_url=None, es_index=None, api_url=server.url, cache_path=cache_path)
+                odf_1 = km.get_matches('label_clean', size=2, df=self.df.copy())
+                self.assertEqual(len(server.requests), 3)
+
+            with KGTKSearchStandInServer() as server:
+                km = KGTKSearchMatches(es_url=None, es_index=None, api_url=server.url, cache_path=cache_path)
+                odf_2 = km.get_matches('label_clean', size=2, df=self.df.copy())
+                self.assertEqual(len(server.requests), 0)
+                # a different size is a different cache key
+                km.get_matches('label_clean', size=3, df=self.df.copy())
+                self.assertEqual(len(server.requests), 3)
+
+        self.assertTrue(odf_1.equals(odf_2))
+
+    def test_timeout(self):
+        with KGTKSearchStandInServer(slow_labels={'Budapest'}) as server:
+            km = KGTKSearchMatches(es_url=None, es_index=None, api_url=server.url, timeout=0.2)
+            odf = km.get_matches('label_clean', size=2, df=self.df.copy())
+            # the label which timed out has no candidates, the other labels are not affected
+            self.assertEqual(odf[odf['label_clean'] == 'Budapest']['kg_id'].tolist(), ['', ''])
+            self.assertEqual(len(odf[odf['row'] == '1']), 2)
+
+            # the failed search is not cached
+            server.slow_labels = set()
+            odf = km.get_matches('label_clean', size=2, df=self.df.copy())
+            self.assertEqual(len(odf[odf['label_clean'] == 'Budapest']), 4)
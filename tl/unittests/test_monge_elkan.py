@@ -0,0 +1,24 @@
+import random
+import unittest
+import rltk.similarity as similarity
+from tl.features.monge_elkan import monge_elkan_similarity, symmetric_monge_elkan_similarity, token_pair_similarity
+
+
+class TestMongeElkan(unittest.TestCase):
+    def test_same_as_rltk(self):
+        rnd = random.Random(0)
+        words = ['united', 'states', 'of', 'america', 'unites', 'state', 'city', 'new', 'york', 'yorke', 'a', '']
+        for _ in range(2000):
+            bag1 = [rnd.choice(words) for _ in range(rnd.randint(1, 4))]
+            bag2 = [rnd.choice(words) for _ in range(rnd.randint(1, 4))]
+            lower_bound = rnd.choice([None, 0.5, 0.75, 0.9])
+            self.assertEqual(monge_elkan_similarity(bag1, bag2, lower_bound=lower_bound),
+                             similarity.monge_elkan_similarity(bag1, bag2, lower_bound=lower_bound))
+            self.assertEqual(symmetric_monge_elkan_similarity(bag1, bag2, lower_bound=lower_bound),
+                             similarity.symmetric_monge_elkan_similarity(bag1, bag2, lower_bound=lower_bound))
+        # the token pairs are compared once
+        self.assertGreater(token_pair_similarity.cache_info().hits, token_pair_similarity.cache_info().misses)
+
+    def test_bags(self):
+        self.assertRaises(TypeError, monge_elkan_similarity, 'united states', ['united'])
+        self.assertRaises(ValueError, symmetric_monge_elkan_similarity, None, ['united'])
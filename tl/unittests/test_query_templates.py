@@ -0,0 +1,39 @@
+import json
+import unittest
+from tl.candidate_generation.es_search import Search
+from tl.candidate_generation.query_templates import QueryTemplate, wikimedia_descriptions
+
+
+class TestQueryTemplates(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(TestQueryTemplates, self).__init__(*args, **kwargs)
+        self.search = Search(es_url=None, es_index=None)
+
+    def test_render(self):
+        template = QueryTemplate({"query": {"match": {"labels": "{{search_term}}"}}, "size": "{{size}}"})
+        self.assertEqual(template.parameters, ('search_term', 'size'))
+        query = json.loads(template.render(search_term='"Buda" {{pest}}', size=5))
+        self.assertEqual(query, {"query": {"match": {"labels": '"Buda" {{pest}}'}}, "size": 5})
+        with self.assertRaises(AttributeError):
+            template._names = ()
+
+    def test_phrase_queries_are_independent(self):
+        query_1 = self.search.create_phrase_query('Budapest', 10, None)
+        query_2 = self.search.create_phrase_query('University of Southern California', 20, ['labels'])
+        multi_match_1 = json.loads(query_1)['query']['bool']['must'][0]['multi_match']
+        multi_match_2 = json.loads(query_2)['query']['bool']['must'][0]['multi_match']
+        self.assertEqual(multi_match_1['query'], 'Budapest')
+        self.assertEqual(multi_match_1['type'], 'best_fields')
+        self.assertEqual(multi_match_1['fields'], ['labels^2', 'aliases'])
+        self.assertEqual(multi_match_2['type'], 'phrase')
+        self.assertEqual(multi_match_2['slop'], 10)
+        self.assertEqual(json.loads(query_1)['size'], 10)
+
+    def test_isa_in_filter(self):
+        isa = {"term": {"instance_ofs.keyword_lower": {"value": "q5"}}}
+        query = json.loads(self.search.create_ngram_query('Obama', size=5, extra_musts=isa))
+        bool_query = query['query']['function_score']['query']['bool']
+        self.assertEqual(len(bool_query['must']), 1)
+        self.assertEqual(bool_query['filter'][0], isa)
+        self.assertEqual(bool_query['filter'][1]['bool']['must_not'][0]['terms']['descriptions.en.keyword_lower'],
+                         wikimedia_descriptions)
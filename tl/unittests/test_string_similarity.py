@@ -0,0 +1,87 @@
+import unittest
+import pandas as pd
+from pathlib import Path
+from tl.features.string_similarity import StringSimilarity
+from tl.features.similarity_units import similarity_unit_from_name
+
+parent_path = Path(__file__).parent
+
+
+class TestStringSimilarity(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(TestStringSimilarity, self).__init__(*args, **kwargs)
+        self.df = pd.read_csv('{}/data/feature_file.csv'.format(parent_path), dtype=object).head(300)
+
+    def test_same_as_every_row(self):
+        for methods, threshold in [(['levenshtein', 'jaro_winkler'], 0.0),
+                                   (['symmetric_monge_elkan:tokenizer=word'], 0.5),
+                                   (['jaccard:tokenizer=ngram:tokenizer_n=3'], 0.0)]:
+            string_similarity = StringSimilarity(similarity_method=methods, df=self.df, ignore_case=True,
+                                                 output_column='sim')
+            rows = list(zip(string_similarity.df['kg_labels'], string_similarity.df['label_clean'],
+                            string_similarity.df['label'], string_similarity.df['method']))
+            odf = string_similarity.get_similarity_score(threshold=threshold)
+            self.assertEqual(odf['sim'].tolist(), [string_similarity.string_similarity(row, threshold) for row in rows])
+
+    def test_label_pairs(self):
+        df = pd.DataFrame([['Paris', 'paris', 'Paris|Paris, France', 'exact-match'],
+                           ['Paris', 'paris', 'Paris|Paris, France', 'fuzzy-augmented'],
+                           ['London', 'london', 'London', 'fuzzy-augmented']],
+                          columns=['label', 'label_clean', 'kg_labels', 'method'])
+        string_similarity = StringSimilarity(similarity_method=['soundex'], df=df)
+        unique_pairs, row_pairs, row_offsets = string_similarity.label_pairs()
+        self.assertEqual(unique_pairs, [('paris', 'Paris'), ('Paris', 'Paris'), ('paris', 'Paris, France'),
+                                        ('Paris', 'Paris, France'), ('london', 'London')])
+        self.assertEqual(row_pairs.tolist(), [0, 1, 2, 3, 0, 2, 4])
+        self.assertEqual(row_offsets.tolist(), [0, 4, 6])
+        # soundex only returns integers
+        self.assertEqual(string_similarity.get_similarity_score()[None].tolist(), [1, 1, 1])
+
+    def test_workers(self):
+        methods = ['levenshtein', 'jaccard:tokenizer=ngram:tokenizer_n=3', 'needleman:match=3']
+        serial = StringSimilarity(similarity_method=methods, df=self.df, ignore_case=True).get_similarity_score(0.5)
+        string_similarity = StringSimilarity(similarity_method=methods, df=self.df, ignore_case=True, workers=2)
+        self.assertEqual(string_similarity.get_similarity_score(0.5)[None].tolist(), serial[None].tolist())
+
+        # the workers build the same similarity units from their names
+        for each_similarity_unit in string_similarity.similarity_units:
+            unit = similarity_unit_from_name(each_similarity_unit.get_name(), string_similarity.worker_tl_args)
+            self.assertEqual(unit.get_name(), each_similarity_unit.get_name())
+            self.assertEqual(unit.similarity('Paris', 'paris, France'),
+                             each_similarity_unit.similarity('Paris', 'paris, France'))
+
+    def test_table_dependent_workers(self):
+        # the tokens of the candidate labels are found in the documents of tfidf
+        df = pd.DataFrame([['paris', 'paris', 'paris|london', 'exact-match'],
+                           ['london', 'london', 'london|new york', 'fuzzy-augmented'],
+                           ['new york', 'new york', 'york|paris', 'fuzzy-augmented']],
+                          columns=['label', 'label_clean', 'kg_labels', 'method'])
+        methods = ['tfidf:tokenizer=word', 'levenshtein']
+        kwargs = dict(df=df, target_columns=['label_clean', 'kg_labels'], output_column='sim')
+        serial = StringSimilarity(similarity_method=methods, **kwargs).get_similarity_score()
+        # tfidf is scored by the parent process, only levenshtein is rebuilt by the workers
+        odf = StringSimilarity(similarity_method=methods, workers=2, **kwargs).get_similarity_score()
+        self.assertEqual(odf['sim'].tolist(), serial['sim'].tolist())
+        self.assertGreater(odf['sim'].tolist()[2], StringSimilarity(similarity_method=['levenshtein'], **kwargs)
+                           .get_similarity_score()['sim'].tolist()[2])
+
+    def test_upper_bounds(self):
+        methods = ['levenshtein', 'hybrid_jaccard:tokenizer=ngram:tokenizer_n=3', 'hybrid_jaccard:tokenizer=word']
+        string_similarity = StringSimilarity(similarity_method=methods, df=self.df, ignore_case=True)
+        unique_pairs = string_similarity.label_pairs()[0]
+        for each_similarity_unit in string_similarity.similarity_units:
+            for target_label, each_label in unique_pairs:
+                similarity = each_similarity_unit.similarity(target_label, each_label)
+                for threshold in [0.3, 0.7, similarity]:
+                    # a pair is only pruned when its similarity is below the threshold
+                    self.assertEqual(each_similarity_unit.similarity(target_label, each_label, threshold=threshold),
+                                     similarity if similarity >= threshold else 0.0)
+            self.assertGreater(each_similarity_unit.pruned_pairs, 0)
+            self.assertEqual(each_similarity_unit.compared_pairs, len(unique_pairs) * 4)
+
+        odf = string_similarity.get_similarity_score(threshold=0.7)
+        self.assertEqual(string_similarity.telemetry['unique_pairs'], len(unique_pairs))
+        self.assertEqual(list(string_similarity.telemetry['unit_pruning_rates']),
+                         [unit.get_name() for unit in string_similarity.similarity_units])
+        self.assertGreater(string_similarity.telemetry['pruning_rate'], 0)
+        self.assertTrue((odf[None][odf[None] > 0] >= 0.7).all())
@@ -0,0 +1,30 @@
+import unittest
+import rltk.similarity as similarity
+from tl.features.token_blocking import TokenBags, symmetric_monge_elkan_upper_bounds, candidate_pairs
+
+
+class TestTokenBlocking(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(TestTokenBlocking, self).__init__(*args, **kwargs)
+        self.items = [['united', 'states', 'of', 'america'], ['"america"'], ['usa'], ['Venezia'], ['barack', 'obama']]
+        self.labels = [['america'], ['venice'], ['united', 'state', 'of', 'america'], ['Obama', 'Barack'], ['']]
+
+    def test_upper_bounds(self):
+        upper_bounds = symmetric_monge_elkan_upper_bounds(TokenBags(self.items), TokenBags(self.labels))
+        self.assertEqual(upper_bounds.shape, (5, 5))
+        for i, item in enumerate(self.items):
+            for j, label in enumerate(self.labels):
+                sim = similarity.hybrid.symmetric_monge_elkan_similarity(label, item)
+                self.assertLessEqual(sim, upper_bounds[i, j] + 1e-12)
+
+    def test_candidate_pairs(self):
+        pairs = candidate_pairs(TokenBags(self.items), TokenBags(self.labels), 0.9)
+        self.assertEqual(pairs, sorted(pairs))
+        for i, item in enumerate(self.items):
+            for j, label in enumerate(self.labels):
+                if similarity.hybrid.symmetric_monge_elkan_similarity(label, item) >= 0.9:
+                    self.assertIn((i, j), pairs)
+        # pairs without any characters in common are never compared
+        self.assertNotIn((2, 1), pairs)
+        self.assertNotIn((0, 4), pairs)
+        self.assertEqual(candidate_pairs(TokenBags(self.items), TokenBags([]), 0.9), [])
@@ -0,0 +1,30 @@
+import math
+import unittest
+import dateutil.parser as dp
+from tl.features.typed_value import typed_value
+
+
+class TestTypedValue(unittest.TestCase):
+    def test_year(self):
+        for value in ['1950', '170', '2001-05-12', '12/05/2001', '"1950"', 'country 0', '']:
+            try:
+                year = str(dp.parse(value).year)
+            except Exception:
+                year = None
+            self.assertEqual(typed_value(value).year, year)
+
+    def test_number(self):
+        self.assertEqual(typed_value('"1,000"').number, 1000.0)
+        self.assertEqual(typed_value('country 2').number, 2.0)
+        self.assertTrue(math.isnan(typed_value('country').number))
+        # the last word which is a non zero number, or nan, wins
+        self.assertTrue(math.isnan(typed_value('2 country').number))
+        self.assertEqual(typed_value('2 0').number, 2.0)
+
+    def test_tokens(self):
+        self.assertEqual(typed_value('The "United" States.').tokens, ['the', 'united', 'states'])
+        self.assertEqual(typed_value('1,000.5 m').numeric_parts, ('1000.5 m', False, '1000.5'))
+        self.assertEqual(typed_value('1,000').numeric_parts, ('1000', True, None))
+
+    def test_cache(self):
+        self.assertIs(typed_value('Venice'), typed_value('Venice'))
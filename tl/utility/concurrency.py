@@ -0,0 +1,127 @@
+import os
+import random
+import threading
+import time
+
+from tl.utility.singleton import singleton
+
+# status codes with which a server signals that it is overloaded, 429 is also returned by ES for rejected executions
+overloaded_status_codes = {429, 502, 503, 504}
+
+
+def retry_delay(attempt: int, base_delay: float, max_delay: float = 10.0) -> float:
+    """
+    Returns the seconds to wait before the retry number `attempt`, starting at 1, of a request rejected by an
+    overloaded server. The delay doubles with every retry, and is drawn at random in the upper half of its range so
+    that the requests rejected together are not retried together.
+    """
+    delay = min(max_delay, base_delay * 2 ** (attempt - 1))
+    return random.uniform(delay / 2, delay)
+
+
+class AdaptiveConcurrencyController(object):
+    """
+    Additive-increase/multiplicative-decrease (AIMD) limit on the number of requests in flight.
+
+    Use `ConcurrencyController()` to get the controller shared by all the stages running in a process. Every
+    request to a search server acquires a slot before it is sent and releases it with its latency once the response
+    arrives. While latencies stay close to the best latency seen so far, the limit grows by about one request per
+    round trip; when the server rejects a request, fails, or the latency spikes, the limit is multiplied by
+    `backoff`.
+
+    The maximum limit is read from the environment variable TL_MAX_CONCURRENCY, default 50.
+    """
+
+    def __init__(self, max_limit: int = None, min_limit: int = 1, initial_limit: int = 4,
+                 latency_tolerance: float = 2.0, min_latency_delta: float = 0.01, backoff: float = 0.5):
+        if max_limit is None:
+            max_limit = int(os.environ.get('TL_MAX_CONCURRENCY', 50))
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = float(max(self.min_limit, min(initial_limit, self.max_limit)))
+        self.latency_tolerance = latency_tolerance
+        self.min_latency_delta = min_latency_delta
+        self.backoff = backoff
+
+        self.in_flight = 0
+        self.baseline_latency = None
+        self.last_decrease = 0.0
+        self.n_requests = 0
+        self.n_decreases = 0
+        self.max_in_flight = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Blocks until the number of requests in flight is below the current limit and takes a slot.
+        """
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def release(self, latency: float, overloaded: bool = False):
+        """
+        Frees the slot of a finished request and adapts the limit to its outcome.
+
+        Args:
+            latency: seconds between sending the request and receiving the response
+            overloaded: True if the server rejected the request or the request failed
+        """
+        with self.condition:
+            self.in_flight -= 1
+            self.n_requests += 1
+            now = time.time()
+
+            # a rejected or failed request often returns much faster than a served one, only the latencies of
+            # served requests make the baseline
+            spike = False
+            if not overloaded:
+                if self.baseline_latency is None or latency < self.baseline_latency:
+                    self.baseline_latency = latency
+                else:
+                    # let the baseline follow slow drifts of the server latency
+                    self.baseline_latency = 0.99 * self.baseline_latency + 0.01 * latency
+                spike = latency > self.latency_tolerance * self.baseline_latency + self.min_latency_delta
+
+            if overloaded or spike:
+                # decrease at most once per round trip, the requests in flight saw the same congestion
+                if now - self.last_decrease > latency:
+                    self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                    self.last_decrease = now
+                    self.n_decreases += 1
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+            self.condition.notify_all()
+
+    @staticmethod
+    def is_overloaded(response) -> bool:
+        return response.status_code in overloaded_status_codes
+
+    def call(self, func, *args, **kwargs):
+        """
+        Sends a request with `func` inside a slot; exceptions raised by `func` count as overloads.
+        """
+        self.acquire()
+        start = time.time()
+        overloaded = True
+        try:
+            response = func(*args, **kwargs)
+            overloaded = self.is_overloaded(response)
+        finally:
+            self.release(time.time() - start, overloaded)
+        return response
+
+    def get_telemetry(self) -> dict:
+        with self.condition:
+            return {
+                'concurrency_limit': int(self.limit),
+                'max_concurrency_limit': self.max_limit,
+                'max_in_flight': self.max_in_flight,
+                'requests': self.n_requests,
+                'concurrency_decreases': self.n_decreases
+            }
+
+
+ConcurrencyController = singleton(AdaptiveConcurrencyController)
@@ -0,0 +1,237 @@
+import gzip
+import json
+import mmap
+import os
+import queue
+import re
+import threading
+
+import numpy as np
+from typing import Iterable, List, Tuple
+
+from tl.exceptions import UnsupportTypeError
+
+# the pairs of header names of the node and context columns in context tsv files
+tsv_context_columns = [('qnode', 'context'), ('node1', 'node2')]
+
+# a key after the first one of a json line whose value is a list, as the context of a QNode is
+json_list_key_pattern = re.compile(r'\]\s*,\s*"[^"]*"\s*:\s*\[')
+
+# the size of the chunks decompressed ahead of the lines being read
+decompressed_chunk_size = 1 << 20
+
+
+class ContextStore(object):
+    """
+    An on-disk store of the context of QNodes, built with `tl build-context-store`.
+
+    The store is a folder holding the context values one after the other in `values.bin`, the sorted QNodes in
+    `keys.npy` and the (offset, length) of the value of every QNode in `spans.npy`. All the files are memory mapped,
+    a QNode is found by binary search and only the values which are looked up are read from disk, so opening a
+    store takes the same time and memory whatever the size of the KG.
+
+    A QNode which appears in several input files has one value per file. The values of a tsv store are
+    concatenated in the order of the input files, like `MatchContext` does for the context and the custom context,
+    and for a json lines store the value of the last file wins.
+    """
+
+    def __init__(self, path: str):
+        if not self.is_context_store(path):
+            raise UnsupportTypeError('{} is not a context store, build one with `tl build-context-store`'.format(path))
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.format = self.meta['format']
+        self.keys = np.load(os.path.join(path, 'keys.npy'), mmap_mode='r')
+        self.spans = np.load(os.path.join(path, 'spans.npy'), mmap_mode='r')
+        self._values_file = open(os.path.join(path, 'values.bin'), 'rb')
+        if os.path.getsize(self._values_file.name) > 0:
+            self.values = mmap.mmap(self._values_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.values = b''
+
+    @staticmethod
+    def is_context_store(path: str) -> bool:
+        return path is not None and os.path.isdir(path) and os.path.exists(os.path.join(path, 'meta.json'))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, qnode: str) -> bool:
+        return self.get(qnode) is not None
+
+    def get(self, qnode: str, default=None):
+        key = qnode.encode('utf-8')
+        start = np.searchsorted(self.keys, key, side='left')
+        end = np.searchsorted(self.keys, key, side='right')
+        if start == end:
+            return default
+        values = [self.values[offset:offset + length].decode('utf-8') for offset, length in self.spans[start:end]]
+        if self.format == 'json':
+            return json.loads(values[-1])
+        return ''.join(values)
+
+    def materialize(self, qnodes: Iterable[str]) -> dict:
+        """
+        Returns a dict with the context of the QNodes which are in the store.
+        """
+        context_dict = {}
+        for qnode in qnodes:
+            if isinstance(qnode, str):
+                value = self.get(qnode)
+                if value is not None:
+                    context_dict[qnode] = value
+        return context_dict
+
+    def close(self):
+        if isinstance(self.values, mmap.mmap):
+            self.values.close()
+        self._values_file.close()
+
+    @staticmethod
+    def open_context_file(path: str):
+        if os.path.splitext(path)[1] == '.gz':
+            return gzip.open(path, 'rt')
+        return open(path)
+
+    @staticmethod
+    def context_file_format(path: str) -> str:
+        name = path[:-3] if path.endswith('.gz') else path
+        return 'json' if os.path.splitext(name)[1] in ('.jl', '.jsonl', '.json') else 'tsv'
+
+    @staticmethod
+    def read_tsv_context(f) -> Iterable[Tuple[str, str]]:
+        """
+        Yields the (qnode, context) pairs of a context tsv file with a header, either `qnode context` or
+        `node1 ... node2`. The context values are kept as they are in the file.
+        """
+        node_idx = -1
+        feature_idx = -1
+        for line in f:
+            row = line.strip().split('\t')
+            header = [columns for columns in tsv_context_columns if columns[0] in row and columns[1] in row]
+            if header:
+                node_idx = row.index(header[0][0])
+                feature_idx = row.index(header[0][1])
+            else:
+                yield row[node_idx], row[feature_idx]
+
+    @staticmethod
+    def read_json_context(f) -> Iterable[Tuple[str, str]]:
+        """
+        Yields the (qnode, serialized context) pairs of a json lines context file, one json object per line.
+        """
+        for line in f:
+            line = line.strip()
+            if line:
+                for qnode, context in json.loads(line).items():
+                    yield qnode, json.dumps(context)
+
+    @staticmethod
+    def read_lines(path: str) -> Iterable[str]:
+        """
+        Yields the lines of a text file. A gzipped file is decompressed by another thread, a few chunks ahead of
+        the lines being read, so that decompression, which releases the GIL, runs while the lines are parsed.
+        """
+        if os.path.splitext(path)[1] != '.gz':
+            with open(path) as f:
+                yield from f
+            return
+
+        chunks = queue.Queue(maxsize=8)
+
+        def decompress():
+            try:
+                with gzip.open(path, 'rb') as f:
+                    chunk = f.read(decompressed_chunk_size)
+                    while chunk:
+                        chunks.put(chunk)
+                        chunk = f.read(decompressed_chunk_size)
+                chunks.put(b'')
+            except Exception as e:
+                chunks.put(e)
+
+        thread = threading.Thread(target=decompress, daemon=True)
+        thread.start()
+        rest = b''
+        chunk = chunks.get()
+        while chunk:
+            if isinstance(chunk, Exception):
+                raise chunk
+            lines = (rest + chunk).split(b'\n')
+            rest = lines.pop()
+            for line in lines:
+                yield line.decode('utf-8') + '\n'
+            chunk = chunks.get()
+        if rest:
+            yield rest.decode('utf-8')
+        thread.join()
+
+    @staticmethod
+    def load_json_context(path: str, qnodes: set = None) -> dict:
+        """
+        Reads the context of the QNodes in qnodes, or of all the QNodes if qnodes is None, from a json lines file,
+        optionally gzipped. A line holding the context of a single QNode which is not in qnodes is skipped without
+        being decoded, all the other lines are decoded. For a QNode on several lines the last line wins.
+        """
+        context_dict = {}
+        for line in ContextStore.read_lines(path):
+            line = line.strip()
+            if not line:
+                continue
+            if qnodes is not None and ContextStore.skips_json_line(line, qnodes):
+                continue
+            for qnode, context in json.loads(line).items():
+                if qnodes is None or qnode in qnodes:
+                    context_dict[qnode] = context
+        return context_dict
+
+    @staticmethod
+    def skips_json_line(line: str, qnodes: set) -> bool:
+        """
+        Returns True if a json line, as written by json.dumps, holds the context of a single QNode, its first key,
+        which is not in qnodes.
+        """
+        if not line.startswith('{"') or not line.endswith(']}'):
+            return False
+        end = line.find('"', 2)
+        qnode = line[2:end]
+        if qnode in qnodes or '\\' in qnode:
+            return False
+        return json_list_key_pattern.search(line, end) is None
+
+    @staticmethod
+    def build(input_paths: List[str], output_path: str) -> int:
+        """
+        Builds a context store in the folder output_path from context tsv or json lines files, optionally gzipped.
+
+        Returns: the number of (qnode, context) entries in the store
+        """
+        formats = {ContextStore.context_file_format(path) for path in input_paths}
+        if len(formats) != 1:
+            raise UnsupportTypeError('The input files of a context store must be all tsv or all json lines files')
+        store_format = formats.pop()
+
+        os.makedirs(output_path, exist_ok=True)
+        keys = list()
+        spans = list()
+        offset = 0
+        with open(os.path.join(output_path, 'values.bin'), 'wb') as values_file:
+            for path in input_paths:
+                with ContextStore.open_context_file(path) as f:
+                    pairs = ContextStore.read_json_context(f) if store_format == 'json' \
+                        else ContextStore.read_tsv_context(f)
+                    for qnode, context in pairs:
+                        value = context.encode('utf-8')
+                        values_file.write(value)
+                        keys.append(qnode.encode('utf-8'))
+                        spans.append((offset, len(value)))
+                        offset += len(value)
+
+        # a stable sort keeps the values of a QNode in the order of the input files
+        keys = np.array(keys, dtype=bytes) if keys else np.array([], dtype='S1')
+        order = np.argsort(keys, kind='stable')
+        np.save(os.path.join(output_path, 'keys.npy'), keys[order])
+        np.save(os.path.join(output_path, 'spans.npy'), np.array(spans, dtype=np.int64).reshape(-1, 2)[order])
+        with open(os.path.join(output_path, 'meta.json'), 'w') as f:
+            json.dump({'format': store_format, 'entries': len(keys), 'input_files': input_paths}, f)
+        return len(keys)
@@ -9,4 +9,6 @@ class Logger(object):
             self.log_file = open(log_file, "a")
 
     def write_to_file(self, args: dict):
-        print(f'{args["command"]} Time: {args["time"]}s', file=self.log_file)
+        # any other entry of args is telemetry reported by the command, e.g. the concurrency limit
+        telemetry = ''.join(f' {k}: {v}' for k, v in args.items() if k not in ('command', 'time'))
+        print(f'{args["command"]} Time: {args["time"]}s{telemetry}', file=self.log_file)